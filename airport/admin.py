@@ -1,7 +1,24 @@
 from django.contrib.gis import admin
 from models import *
 
-class LocationAdmin(admin.OSMGeoAdmin):
+from route.resolver import invalidate_index
+
+class InvalidateIndexMixin(object):
+    """
+    Airports, navaids and historical idents edited by hand make every
+    process reload it's identifier index. The signals leave the 'ALL'
+    user's places alone because the importers save thousands of them.
+    """
+    
+    def save_model(self, request, obj, form, change):
+        super(InvalidateIndexMixin, self).save_model(request, obj, form, change)
+        invalidate_index()
+    
+    def delete_model(self, request, obj):
+        super(InvalidateIndexMixin, self).delete_model(request, obj)
+        invalidate_index()
+
+class LocationAdmin(InvalidateIndexMixin, admin.OSMGeoAdmin):
     list_display = ('identifier', 'name', 'country', 'region', 'municipality',
                     'user')
     search_fields = ('identifier', 'name', 'municipality',)
@@ -20,11 +37,16 @@ class RegionAdmin(admin.OSMGeoAdmin):
     search_fields = ('name','code')
     list_display = ('name', 'code', 'country_name')
     
-class HistoricalIdentAdmin(admin.OSMGeoAdmin):
+class HistoricalIdentAdmin(InvalidateIndexMixin, admin.OSMGeoAdmin):
     raw_id_fields = ('current_location', )
     search_fields = ('identifier', 'current_location__identifier')
     list_display = ('identifier', 'current_location', 'curr_name', 'start', 'end')
 
+class LocationChangeAdmin(admin.ModelAdmin):
+    raw_id_fields = ('location', )
+    search_fields = ('identifier', )
+    list_display = ('identifier', 'location', 'created')
+
 class CountryAdmin(admin.OSMGeoAdmin):
     search_fields = ('name','code')
     list_display = ('name', 'code')
@@ -36,3 +58,4 @@ admin.site.register(USStates, USStatesAdmin)
 admin.site.register(Country, CountryAdmin)
 admin.site.register(Region, RegionAdmin)
 admin.site.register(HistoricalIdent, HistoricalIdentAdmin)
+admin.site.register(LocationChange, LocationChangeAdmin)
@@ -23,9 +23,9 @@ from django.conf import settings
 PROJECT_ROOT = settings.PROJECT_ROOT
 ######################################################
 
-from airport.models import Location, Region, Country, HistoricalIdent
-from logbook.models import Flight
+from airport.models import Location, Region, Country, HistoricalIdent, LocationChange
 from route.models import RouteBase
+from route.resolver import invalidate_index
 
 from django.contrib.auth.models import User
 ALL_USER = User(pk=1)
@@ -44,8 +44,8 @@ def latlng_match(old_lat, new_lat, old_lng, new_lng):
     return lat_match and lng_match
 
 def re_render_all():
-    for r in Route.objects.iterator():
-        r.easy_render()
+    from route.rerender import rerender
+    rerender('all', all_routes=True)
 
 BANNED = (46307, 14715)   
 
@@ -140,10 +140,10 @@ def airports():   #import airport
             if l.id not in BANNED:
                 l.save()
             
-            if redo_after_save:
-                ## iff the ident has changed, we need to wait until the new
-                ## location is saved before we re-render
-                Flight.render_airport(ident)
+            if redo_after_save or created:
+                ## the routes that use this airport get re-rendered
+                ## afterwards by the rerender_routes command
+                LocationChange.objects.create(location=l, identifier=ident)
                 
             
         except Exception, e:
@@ -153,7 +153,11 @@ def airports():   #import airport
             #update user on status
             print colored("\n{0}\n".format(count), 'cyan')
 
+    # make every process reload its identifier index
+    invalidate_index()
+    
     print "airports: {0}".format(count)
+    print "run ./manage.py rerender_routes to update the affected routes"
     print "hists:    {0}".format("\n".join([str(h) for h in hists if h]))
     
 def make_historical_ident(l, new_ident):
@@ -219,6 +223,9 @@ def navaids():
         skip_find_region = latlng_match(l.location.y, lat,
                                         l.location.x, lng)
         
+        # new, moved or renamed navaids need their routes re-rendered
+        changed = c or not skip_find_region or l.identifier != ident
+        
         l.loc_class = 2
         l.identifier = ident
         l.name = name
@@ -234,9 +241,14 @@ def navaids():
         
         try:
             l.save(skip_find_region=skip_find_region)
+            
+            if changed:
+                LocationChange.objects.create(location=l, identifier=ident)
         except Exception, e:
             print "error:", ident, e
             
+    invalidate_index()
+    
     print "navaids: {0}".format(count)
 
 ###############################################################################
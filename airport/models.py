@@ -75,18 +75,11 @@ class Location(EnhancedModel, WikiMixins):
     def get_profiles(self, val, field):
         """
         Returns the profiles of the users who have flown in this
-        type/tail/whatever
+        location. Only lookups by identifier are indexed.
         """
-                   
-        from profile.models import Profile
-        kwarg = {"user__flight__route__routebase__location__%s__iexact" % field: val}
         
-        return Profile.objects\
-                      .filter(social=True)\
-                      .filter(**kwarg)\
-                      .values('user__username', 'user__id', 'logbook_share')\
-                      .order_by('user__username')\
-                      .distinct()
+        from logbook.models import SocialIndex
+        return SocialIndex.profiles('location', val)
     
     @classmethod
     def goof(cls, *args, **kwargs):
@@ -177,11 +170,8 @@ class Location(EnhancedModel, WikiMixins):
     def get_users(self):
         """ Returns all users who have flown to this location """
         
-        from django.contrib.auth.models import User      
-        return User.objects\
-                   .filter(profile__social=True)\
-                   .filter(flight__route__routebase__location__id=self.id)\
-                   .distinct()\
+        from logbook.models import SocialIndex
+        return SocialIndex.users('location', self.identifier)
     
     def save(self, *args, **kwargs):
         """ if it's a custom, automatically look up to see which country and
@@ -246,6 +236,22 @@ class HistoricalIdent(EnhancedModel):
                                   self.current_location.location_summary())
 
 ###############################################################################
+
+class LocationChange(models.Model):
+    """
+    An airport or navaid that was added, or had its identifier, name or city
+    changed, by an import. The rerender_routes command re-renders only the
+    routes affected by these rows, then removes them.
+    """
+    
+    location = models.ForeignKey(Location)
+    identifier = models.CharField(max_length=8)
+    created = models.DateTimeField(auto_now_add=True)
+    
+    def __unicode__(self):
+        return u"%s (%s)" % (self.identifier, self.created)
+
+###############################################################################
   
 class Region(EnhancedModel):
     
@@ -0,0 +1,147 @@
+"""
+The numbers that go on the FAA's 8710 form. Every cell of every row comes
+from one query that groups the user's flights by the plane's cat_class.
+The cat_classes are then folded together into the form's rows.
+"""
+
+from django.db import connection
+from django.db.models.sql.datastructures import EmptyResultSet
+
+from logbook.models import Flight
+
+def _when(col, field):
+    """
+    The field, only for flights where `col` is logged
+    """
+
+    return "CASE WHEN logbook_flight.%s > 0 THEN logbook_flight.%s ELSE 0 END"\
+                % (col, field)
+
+# each cell of a row, and how it is summed
+CELLS = (
+    ('total',           "logbook_flight.total"),
+    ('pic',             "logbook_flight.pic"),
+    ('sic',             "logbook_flight.sic"),
+    ('dual_r',          "logbook_flight.dual_r"),
+    ('solo',            "logbook_flight.solo"),
+    ('inst',            "logbook_flight.act_inst + logbook_flight.sim_inst"),
+    ('night_l',         "logbook_flight.night_l"),
+
+    ('xc_pic',          _when('pic', 'xc')),
+    ('night_pic',       _when('pic', 'night')),
+    ('night_l_pic',     _when('pic', 'night_l')),
+
+    ('sic_xc',          _when('sic', 'xc')),
+    ('sic_night',       _when('sic', 'night')),
+    ('sic_night_l',     _when('sic', 'night_l')),
+
+    ('xc_dual_r',       _when('dual_r', 'xc')),
+    ('night_dual_r',    _when('dual_r', 'night')),
+
+    ('xc_solo',         _when('solo', 'xc')),
+
+    ('num_of_flights',  "1"),
+)
+
+class FormLine(object):
+    """
+    One row of the form. Cells with nothing logged are blank.
+    """
+
+    cats = None ## will be overwritten by subclasses
+
+    def __init__(self, totals):
+        for cell, sql in CELLS:
+            setattr(self, cell, totals.get(cell) or "&nbsp;")
+
+class Airplane(FormLine):
+    cats = (1,2,3,4)
+
+class Rotorcraft(FormLine):
+    cats = (6,7)
+
+class LTA(FormLine):
+    cats = (12,13)
+
+class Glider(FormLine):
+    cats = (5, )
+
+class PoweredLift(FormLine):
+    cats = (14, )
+
+class Sim(FormLine):
+    cats = (15, 17)
+
+class FTD(FormLine):
+    cats = (16, 18)
+
+class PCATD(FormLine):
+    cats = (19, )
+
+class Form8710(object):
+    """
+    All rows of the form for the user's logbook, optionally only counting
+    the flights up to and including the `as_of` date.
+    """
+
+    LINES = (
+        ('airplane', Airplane),
+        ('rotorcraft', Rotorcraft),
+        ('lta', LTA),
+        ('glider', Glider),
+        ('pl', PoweredLift),
+        ('sim', Sim),
+        ('ftd', FTD),
+        ('pcatd', PCATD),
+    )
+
+    def __init__(self, user, as_of=None):
+        self.user = user
+        self.as_of = as_of
+
+        by_cat_class = self.fetch()
+
+        self.lines = {}
+        for name, Line in self.LINES:
+            totals = dict.fromkeys((cell for cell, sql in CELLS), 0)
+
+            for cat_class in Line.cats:
+                for cell, value in by_cat_class.get(cat_class, {}).items():
+                    totals[cell] += value
+
+            self.lines[name] = Line(totals)
+            setattr(self, name, self.lines[name])
+
+    def fetch(self):
+        """
+        Returns the totals of each cell, by cat_class
+        """
+
+        qs = Flight.objects.user(self.user)
+
+        if self.as_of:
+            qs = qs.filter(date__lte=self.as_of)
+
+        try:
+            subquery, params = qs.order_by()\
+                                 .values('pk')\
+                                 .query.get_compiler(qs.db)\
+                                 .as_sql()
+        except EmptyResultSet:
+            return {}
+
+        selects = ", ".join("COALESCE(SUM(%s), 0)" % sql for cell, sql in CELLS)
+
+        cursor = connection.cursor()
+        cursor.execute(
+            """SELECT plane_plane.cat_class, %s
+               FROM logbook_flight
+               INNER JOIN plane_plane
+                  ON plane_plane.id = logbook_flight.plane_id
+               WHERE logbook_flight.id IN (%s)
+               GROUP BY plane_plane.cat_class""" % (selects, subquery), params)
+
+        cells = [cell for cell, sql in CELLS]
+
+        return dict((row[0], dict(zip(cells, row[1:])))
+                        for row in cursor.fetchall())
@@ -21,3 +21,57 @@ Another way to test that 1 + 1 is equal to 2.
 True
 """}
 
+
+class Form8710Test(TestCase):
+    
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from logbook.test_utils import make_flight
+        from plane.models import Plane
+        
+        self.u = User(username='frank')
+        self.u.save()
+        
+        sel = Plane(tailnumber="N6666", cat_class=1)
+        sel.save()
+        
+        heli = Plane(tailnumber="N7777", cat_class=6)
+        heli.save()
+        
+        for date, plane, total, pic, dual_r, xc in (
+                ('2009-01-01', sel, 1.0, 0, 1.0, 1.0),
+                ('2009-02-01', sel, 2.0, 2.0, 0, 2.0),
+                ('2009-03-01', heli, 1.5, 1.5, 0, 0)):
+            make_flight(self.u, plane, date=date, total=total, pic=pic,
+                        dual_r=dual_r, xc=xc)
+    
+    def test_form(self):
+        """
+        Tests that every row gets only the flights of it's cat_classes and
+        each subset cell only the flights where that column is logged
+        """
+        
+        from form import Form8710
+        
+        form = Form8710(self.u)
+        
+        self.failUnlessEqual(form.airplane.total, 3.0)
+        self.failUnlessEqual(form.airplane.xc_pic, 2.0)
+        self.failUnlessEqual(form.airplane.xc_dual_r, 1.0)
+        self.failUnlessEqual(form.airplane.num_of_flights, 2)
+        self.failUnlessEqual(form.rotorcraft.pic, 1.5)
+        self.failUnlessEqual(form.glider.total, "&nbsp;")
+    
+    def test_as_of(self):
+        """
+        Tests that only flights up to the date get counted
+        """
+        
+        import datetime
+        from form import Form8710
+        
+        form = Form8710(self.u, as_of=datetime.date(2009, 1, 15))
+        
+        self.failUnlessEqual(form.airplane.total, 1.0)
+        self.failUnlessEqual(form.airplane.pic, "&nbsp;")
+        self.failUnlessEqual(form.rotorcraft.total, "&nbsp;")
@@ -1,125 +1,21 @@
-from annoying.decorators import render_to
-from django.db.models import Sum
-from logbook.models import Flight
-
-class FormLine(object):
+import datetime
 
-    cats = None ## will be overwritten by subclasses
-    
-    total = "x&nbsp;"
-    dual_r = "x&nbsp;"
-    solo = "x&nbsp;"
-    pic = "x&nbsp;"
-    xc_dual_r = "x&nbsp;"
-    xc_solo = "x&nbsp;"
-    xc_pic = "x&nbsp;"
-    inst = "x&nbsp;"
-    night_dual_r = "x&nbsp;"
-    night_l = "x&nbsp;"
-    night_pic = "x&nbsp;"
-    night_l_pic = "x&nbsp;"
-    
-    sic = "x&nbsp;"
-    sic_xc = "x&nbsp;"
-    sic_night = "x&nbsp;"
-    sic_night_l = "x&nbsp;"
-    
-    def __init__(self, user):
-        self.user = user        
-        self.qs = Flight.objects.user(self.user)\
-                 .filter(plane__cat_class__in=self.cats)\
-                 
-        self.determine()
- 
-    def determine(self):        
-        main = self.qs.aggregate(
-                    total=Sum('total'),
-                    pic=Sum('pic'),
-                    dual_r=Sum('dual_r'),
-                    sic=Sum('sic'),
-                    solo=Sum('solo'),
-                    sim_inst=Sum('sim_inst'),
-                    act_inst=Sum('act_inst'),
-                    night_l=Sum('night_l'),
-                 )
-                 
-        for field in ('total', 'pic', 'sic', 'dual_r',
-                      'solo', 'night_l'):
-            setattr(self, field, main[field] or "&nbsp;")
-                                        
-        self.inst = (main['act_inst'] or 0) + (main['sim_inst'] or 0)       
-        if self.inst == 0:
-            self.inst = "&nbsp;"
-        
-        ##########################################
-            
-        pic = self.qs.pic().aggregate(xc=Sum('xc'),
-                                      night_l=Sum('night_l'),
-                                      night=Sum('night'),
-                                     )
-                              
-        self.xc_pic = pic['xc'] or "&nbsp;"
-        self.night_pic = pic['night'] or "&nbsp;"
-        self.night_l_pic = pic['night_l'] or "&nbsp;"
-        
-        ##########################################
-        
-        sic = self.qs.sic().aggregate(xc=Sum('xc'),
-                                      night_l=Sum('night_l'),
-                                      night=Sum('night'),
-                                     )
-                                             
-        self.sic_xc = sic['xc'] or "&nbsp;"
-        self.sic_night = sic['night'] or "&nbsp;"
-        self.sic_night_l = sic['night_l'] or "&nbsp;"
-        
-        ##########################################
-        
-        dual_r = self.qs.dual_r().aggregate(xc=Sum('xc'),
-                                            night=Sum('night'),
-                                           )
-                                           
-        self.night_dual_r = dual_r['night'] or "&nbsp;"
-        self.xc_dual_r = dual_r['xc'] or "&nbsp;"
-        
-        self.xc_solo = self.qs.solo().aggregate(xc=Sum('xc'))['xc'] or "&nbsp;"
-        
-
-class Airplane(FormLine):       
-    cats = (1,2,3,4)
-        
-class Rotorcraft(FormLine):
-    cats = (6,7)
-    
-class LTA(FormLine):
-    cats = (12,13)
-    
-class Glider(FormLine):
-    cats = (5, )
-    
-class PoweredLift(FormLine):
-    cats = (14, )
-    
-class Sim(FormLine):
-    cats = (15, 17)
+from annoying.decorators import render_to
 
-class FTD(FormLine):
-    cats = (16, 18)
-    
-class PCATD(FormLine):
-    cats = (19, )
+from form import Form8710
 
 @render_to('8710.html')
 def auto8710(request):
     
-    airplane = Airplane(request.display_user)
-    rotorcraft = Rotorcraft(request.display_user)
-    lta = LTA(request.display_user)
-    glider = Glider(request.display_user)
-    pl = PoweredLift(request.display_user)
+    # only count the flights up to this date
+    try:
+        as_of = datetime.datetime.strptime(request.GET['as_of'], '%Y-%m-%d')\
+                                 .date()
+    except (KeyError, ValueError):
+        as_of = None
+    
+    form = Form8710(request.display_user, as_of)
     
-    sim = Sim(request.display_user)
-    ftd = FTD(request.display_user)
-    pcatd = PCATD(request.display_user)
-     
-    return locals()
+    ret = dict(form.lines)
+    ret['as_of'] = as_of
+    return ret
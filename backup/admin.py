@@ -1,9 +1,16 @@
 from django.contrib import admin
-from models import UsersToday
+from models import UsersToday, BackupMetric
 
 class UsersTodayAdmin(admin.ModelAdmin):
     list_display = ('date', 'users_count', 'usernames', 'email_usernames')
     raw_id_fields = ('logged_today', )
     list_per_page = 14
 
+class BackupMetricAdmin(admin.ModelAdmin):
+    list_display = ('user', 'schedule', 'created', 'seconds', 'size', 'sent',
+                    'skipped')
+    list_filter = ('schedule', 'sent', 'skipped')
+    raw_id_fields = ('user', )
+
 admin.site.register(UsersToday, UsersTodayAdmin)
+admin.site.register(BackupMetric, BackupMetricAdmin)
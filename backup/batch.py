@@ -0,0 +1,155 @@
+"""
+Runs the scheduled email backups. The backup files are made by a pool of
+processes, and the emails of each batch of users go out over a single
+SMTP connection.
+"""
+
+import time
+import traceback
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.contrib.auth.models import User
+
+from models import BackupMetric
+
+def make_backup(item):
+    """
+    Entry point for each process in the pool. Makes the backup file for
+    the user, unless their logbook hasn't changed since the last backup
+    that was sent to them.
+    """
+
+    from django.db import connection
+    from classes import Backup
+
+    user_id, last_checksum = item
+    start = time.time()
+
+    try:
+        backup = Backup(User.objects.get(pk=user_id))
+        checksum = backup.checksum()
+
+        if checksum == last_checksum:
+            return user_id, checksum, None, time.time() - start, None
+
+        file_ = backup.output_csv().getvalue()
+        return user_id, checksum, file_, time.time() - start, None
+
+    except Exception:
+        return user_id, '', None, time.time() - start, traceback.format_exc()
+
+    finally:
+        # every worker has it's own connection, don't leave it open
+        connection.close()
+
+def send_batch(users, schedule, pool):
+    """
+    Make and send the backups for one batch of users. Returns the
+    BackupMetric rows of the batch.
+    """
+
+    from classes import EmailBackup
+
+    users = dict((user.id, user) for user in users)
+    last = BackupMetric.last_checksums(users.keys())
+
+    results = pool.map(make_backup, [(id, last.get(id)) for id in users])
+
+    metrics = []
+    emails = []
+
+    for user_id, checksum, file_, seconds, error in results:
+        metric = BackupMetric(user_id=user_id, schedule=schedule,
+                              checksum=checksum, seconds=seconds,
+                              error=error or '')
+        metrics.append(metric)
+
+        if error:
+            print "ERROR: %s - %s" % (users[user_id].username, error)
+            continue
+
+        if file_ is None:
+            metric.skipped = True
+            print "%s [unchanged, skipped]" % users[user_id].username
+            continue
+
+        try:
+            em = EmailBackup(users[user_id], auto=True)
+
+            if user_id == settings.DEMO_USER_ID or not em.addr:
+                continue
+
+            email = em.make_email(file_)
+        except Exception:
+            metric.error = traceback.format_exc()
+            print "ERROR: %s - %s" % (users[user_id].username, metric.error)
+            continue
+
+        metric.size = len(file_)
+        emails.append((metric, email))
+
+        print "%s [%s, %.2f s, %s bytes]" % (users[user_id].username,
+                                             em.addr, seconds, len(file_))
+
+    if emails:
+        # one connection for the whole batch, but each message is sent on
+        # it's own so a bad address doesn't take the rest of the batch down
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception:
+            error = traceback.format_exc()
+            print "ERROR: %s" % error
+            for metric, email in emails:
+                metric.error = error
+            emails = []
+
+        try:
+            for metric, email in emails:
+                try:
+                    connection.send_messages([email])
+                except Exception:
+                    metric.error = traceback.format_exc()
+                    print "ERROR: %s - %s" % (users[metric.user_id].username,
+                                              metric.error)
+                else:
+                    metric.sent = True
+        finally:
+            connection.close()
+
+    BackupMetric.objects.bulk_create(metrics)
+    return metrics
+
+def run(users, schedule, workers=4, batch=100):
+    """
+    Send the email backups to the passed users, `batch` users at a time.
+    """
+
+    from multiprocessing import Pool
+    from django.db import connection
+
+    users = list(users)
+
+    # forked processes can not share the parent's connection
+    connection.close()
+    pool = Pool(workers)
+
+    metrics = []
+    try:
+        for i in range(0, len(users), batch):
+            metrics.extend(send_batch(users[i:i + batch], schedule, pool))
+    finally:
+        pool.close()
+        pool.join()
+
+    sent = [m for m in metrics if m.sent]
+
+    print "\n%s sent, %s skipped, %s errors" % (
+                len(sent),
+                len([m for m in metrics if m.skipped]),
+                len([m for m in metrics if m.error]))
+    print "%s bytes total, %.2f s spent making backups" % (
+                sum(m.size for m in sent), sum(m.seconds for m in metrics))
+
+    return metrics
@@ -1,6 +1,5 @@
 import csv
 import cStringIO
-import zipfile
 import datetime
 
 from django.core.mail import EmailMessage
@@ -16,25 +15,66 @@ from profile.models import Profile
 
 from main.utils import hash_ten
 
+from zipstream import ZipStream
+
+class Echo(object):
+    """
+    A file-like object that hands back whatever gets written to it, so a
+    csv writer can be used to make one line at a time.
+    """
+    
+    def write(self, value):
+        return value
+
 class Backup(object):
     """
     Constructor takes one argument, an instance of the User object
     """
+    
+    # how many flights are fetched from the database at a time
+    CHUNK = 500
+    
     def __init__(self, user):
         self.user = user
+    
+    def flights(self):
+        """
+        Yields all of the user's flights in date order. They are fetched in
+        chunks, each chunk starting after the last (date, id) of the
+        previous one.
+        """
         
-    def output_csv(self):
-        """returns a StringIO representing a csv backup file for the user"""
-
-        csv_sio = cStringIO.StringIO()
-        writer = csv.writer(csv_sio, delimiter="\t")
+        from django.db.models import Q
         
-        ##########################
+        qs = Flight.objects.filter(user=self.user)\
+                           .select_related('plane', 'route')\
+                           .order_by('date', 'id')
         
-        writer.writerow([FIELD_TITLES[field] for field in BACKUP_FIELDS])
+        last = None
+        while True:
+            chunk = qs
+            if last:
+                chunk = qs.filter(Q(date__gt=last.date) |
+                                  Q(date=last.date, id__gt=last.id))
+            
+            chunk = list(chunk[:self.CHUNK])
+            
+            for flight in chunk:
+                yield flight
+            
+            if len(chunk) < self.CHUNK:
+                break
+            
+            last = chunk[-1]
+    
+    def rows(self):
+        """
+        Yields each row of the backup file as a list
+        """
         
-        flights = Flight.objects.filter(user=self.user).order_by('date')
-        for flight in flights:
+        yield [FIELD_TITLES[field] for field in BACKUP_FIELDS]
+        
+        for flight in self.flights():
             tmp=[]
             for field in BACKUP_FIELDS:
                 try:
@@ -49,50 +89,101 @@ class Backup(object):
                 except Exception, e:
                     tmp.append("error (%s): %s" % (e, flight.id))
                 
-            writer.writerow(tmp)
+            yield tmp
         
         records = Records.goon(user=self.user)
         if records and records.text:
             rec = records.text.encode("utf-8", "ignore").replace("\n","\\n")
-            writer.writerow(["##RECORDS", rec])
+            yield ["##RECORDS", rec]
         
         planes = Plane.objects.filter(user=self.user)    
-        for p in planes:
+        for p in planes.iterator():
             tags = ", ".join(p.get_tags_quote())
-            writer.writerow(["##PLANE", p.tailnumber, p.manufacturer, p.model,
-                        p.type, p.cat_class, "X", tags,
-                        p.description, p.fuel_burn])
+            yield ["##PLANE", p.tailnumber, p.manufacturer, p.model,
+                   p.type, p.cat_class, "X", tags,
+                   p.description, p.fuel_burn]
                         
         events = NonFlight.objects.filter(user=self.user)    
-        for e in events:
-            writer.writerow(["##EVENT", e.date, e.non_flying, e.remarks.encode("utf-8", "ignore")])
+        for e in events.iterator():
+            yield ["##EVENT", e.date, e.non_flying, e.remarks.encode("utf-8", "ignore")]
         
         fixer = lambda r: r.encode('ascii', 'replace')
         locations = Location.objects.filter(user=self.user)
-        for l in locations:
+        for l in locations.iterator():
             x = getattr(l.location, "x", "")
             y = getattr(l.location, "y", "")
             
-            rowz = ["##LOC", l.identifier, l.name, x, y, fixer(l.municipality), l.get_loc_type_display()]
-            writer.writerow(rowz)
+            yield ["##LOC", l.identifier, l.name, x, y, fixer(l.municipality), l.get_loc_type_display()]
+    
+    def lines(self):
+        """
+        Yields the backup file one tab seperated line at a time
+        """
+        
+        writer = csv.writer(Echo(), delimiter="\t")
+        
+        for row in self.rows():
+            yield writer.writerow(row)
+        
+    def output_csv(self):
+        """returns a StringIO representing a csv backup file for the user"""
+
+        csv_sio = cStringIO.StringIO()
+        
+        for line in self.lines():
+            csv_sio.write(line)
                     
         #save to self.csv before returning, for potential later use
         self.csv = csv_sio
         
         return csv_sio
+    
+    def checksum(self):
+        """
+        A hash of every database row that goes into this user's backup
+        file. It is calculated by the database, which is a lot cheaper than
+        making the backup just to see if it's any different.
+        """
+        
+        import hashlib
+        from django.db import connection
+        
+        sql = """
+            SELECT md5(coalesce(string_agg(md5(t::text), '' ORDER BY t.{pk}), ''))
+            FROM {table} t WHERE t.user_id = %s
+        """
+        
+        cursor = connection.cursor()
+        m = hashlib.md5()
+        
+        for model in (Flight, Plane, Records, NonFlight, Location):
+            cursor.execute(sql.format(table=model._meta.db_table,
+                                      pk=model._meta.pk.column),
+                           [self.user.id])
+            m.update(cursor.fetchone()[0])
+        
+        return m.hexdigest()
+    
+    def filename(self):
+        return "logbook-backup-%s.tsv" % datetime.date.today()
+    
+    def iter_zip(self):
+        """
+        Yields a zipfile containing the CSV file, piece by piece, while the
+        CSV file is being made.
+        """
+        
+        return ZipStream(self.filename()).iterate(self.lines())
 
     def output_zip(self):
         """
         Outputs a StringIO representing a zipfile containing the CSV file
         """
         
-        self.output_csv()
-        
-        DATE = datetime.date.today()
-            
         zip_sio = cStringIO.StringIO()
-        z = zipfile.ZipFile(zip_sio,'w', compression=zipfile.ZIP_DEFLATED)
-        z.writestr("logbook-backup-%s.tsv" % DATE, self.csv.getvalue())
+        
+        for chunk in self.iter_zip():
+            zip_sio.write(chunk)
 
         return zip_sio
     
@@ -113,7 +204,12 @@ class EmailBackup(object):
         
         return url % (self.user.id, token)
     
-    def make_email(self):
+    def make_email(self, file_=None):
+        """
+        Makes the email with the backup attached. The backup file can be
+        passed in if it has already been made.
+        """
+        
         today = datetime.date.today()
         
         unsub = self.make_unsubscrbe_link()
@@ -131,7 +227,8 @@ class EmailBackup(object):
         title = "%s's FlightLogg.in backup for %s" %\
                 (self.profile.real_name or self.profile.user.username, today)
                 
-        file_ = Backup(self.user).output_csv().getvalue()
+        if file_ is None:
+            file_ = Backup(self.user).output_csv().getvalue()
         
         if self.auto:
             f = "Auto Backup Mailer <info@flightlogg.in>"
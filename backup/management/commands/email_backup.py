@@ -5,7 +5,7 @@ from django.core.management.base import NoArgsCommand
 
 from django.contrib.auth.models import User
 
-from backup.classes import Backup, EmailBackup
+from backup.batch import run
 from backup.models import UsersToday
 
 class Command(NoArgsCommand):
@@ -39,6 +39,20 @@ class Command(NoArgsCommand):
                         action='store_true',
                         help="Do the biweekly schedule",
             ),
+            
+            make_option('--workers',
+                        dest='workers',
+                        type='int',
+                        default=4,
+                        help="Number of processes that make the backup files",
+            ),
+            
+            make_option('--batch-size',
+                        dest='batch_size',
+                        type='int',
+                        default=100,
+                        help="Number of emails sent per SMTP connection",
+            ),
     )
     
     def handle(self, *args, **options):
@@ -79,17 +93,9 @@ class Command(NoArgsCommand):
                 User.objects.filter(userstoday__in=records).distinct().count()
         
         start = datetime.datetime.now()
-        for user in users:
-            try:
-                em = EmailBackup(user, auto=True)
-            except Exception, e:
-                ## do not raise exception of a single user's email can't be made,
-                ## instead print the error message to the log
-                print "ERROR: %s - %s" % (self.user, e)
-            
-            else:
-                result = em.send()
-                print "%s [%s]" % (user.username, result)
+        
+        run(users, schedule, workers=options['workers'],
+            batch=options['batch_size'])
         
         print "\n=====\ntotal processing time: %s" % \
                                 (datetime.datetime.now() - start)
@@ -40,6 +40,45 @@ class UsersToday(models.Model):
         return ", ".join(ret)
         
 
+class BackupMetric(models.Model):
+    """
+    One row for each user in each run of the email backup command. Holds
+    how long the backup took to make, how big it was, and the checksum of
+    the logbook, so the next run can skip users whose logbook hasn't
+    changed since their last backup was sent.
+    """
+    
+    user = models.ForeignKey(User)
+    schedule = models.CharField(max_length=16)
+    created = models.DateTimeField(auto_now_add=True)
+    
+    checksum = models.CharField(max_length=32, blank=True)
+    seconds = models.FloatField(default=0)
+    size = models.IntegerField(default=0)
+    
+    sent = models.BooleanField(default=False)
+    skipped = models.BooleanField(default=False)
+    error = models.TextField(blank=True)
+    
+    class Meta:
+        get_latest_by = 'created'
+    
+    def __unicode__(self):
+        return "%s %s (%s)" % (self.user_id, self.schedule, self.created)
+    
+    @classmethod
+    def last_checksums(cls, user_ids):
+        """
+        Returns a dict of user id -> checksum of the last backup that
+        was sent to that user.
+        """
+        
+        rows = cls.objects.filter(user__in=user_ids, sent=True)\
+                          .order_by('created')\
+                          .values_list('user', 'checksum')
+        
+        return dict(rows)
+
 #########################################################
 
    
@@ -60,4 +99,13 @@ def add_to_email_queue(sender, **kwargs):
     ut.logged_today.add(sender)
     ut.save()
 
-edit_logbook.connect(add_to_email_queue)
+def queue_email_backup(sender, **kwargs):
+    """
+    The email queue gets updated by the job queue instead of during the
+    request.
+    """
+    
+    from main.jobs import enqueue
+    enqueue('backup', sender)
+
+edit_logbook.connect(queue_email_backup)
@@ -14,6 +14,20 @@ class SimpleTest(TestCase):
         """
         self.failUnlessEqual(1 + 1, 2)
 
+class ZipStreamTest(TestCase):
+    def test_readable_zip(self):
+        import zipfile
+        import cStringIO
+        from zipstream import ZipStream
+        
+        lines = ["Date\tTotal\r\n"] + ["2010-01-01\t1.2\r\n"] * 2000
+        
+        out = "".join(ZipStream("backup.tsv").iterate(iter(lines)))
+        z = zipfile.ZipFile(cStringIO.StringIO(out))
+        
+        self.failUnlessEqual(z.testzip(), None)
+        self.failUnlessEqual(z.read("backup.tsv"), "".join(lines))
+
 __test__ = {"doctest": """
 Another way to test that 1 + 1 is equal to 2.
 
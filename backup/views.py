@@ -2,7 +2,7 @@ import datetime
 
 from share.decorator import no_share
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, StreamingHttpResponse, Http404
 from annoying.decorators import render_to
 
 from classes import Backup, EmailBackup
@@ -10,14 +10,13 @@ from classes import Backup, EmailBackup
 @no_share('logbook')  
 def backup(request):
     
-    # get a zip file of the csv of the users data
-    sio = Backup(request.display_user).output_zip()
+    # a zip file of the csv of the users data, streamed while it's being made
+    backup = Backup(request.display_user)
     
-    DATE = datetime.date.today()
-    
-    response = HttpResponse(sio.getvalue(), mimetype='application/zip')
+    response = StreamingHttpResponse(backup.iter_zip(),
+                                     content_type='application/zip')
     response['Content-Disposition'] = \
-                'attachment; filename=logbook-backup-%s.tsv.zip' % DATE
+                'attachment; filename=%s.zip' % backup.filename()
 
     return response
 
@@ -0,0 +1,141 @@
+import struct
+import zlib
+import datetime
+
+class ZipStream(object):
+    """
+    Writes a zip archive as a stream of chunks. The content of a deflated
+    file is passed in as an iterable of strings and gets compressed as it
+    comes in, so nothing but the current chunk is held in memory. The sizes
+    and crc come after the data (in a 'data descriptor'), which every
+    unzip program understands. Files that are already in memory can be
+    stored as they are.
+
+    Call deflated() and stored() for each file, then close() for the
+    central directory, and send on everything they yield in that order.
+    iterate() does all of that for a zip file with a single file in it.
+    """
+
+    LOCAL_HEADER = "<4s2B4HL2L2H"
+    DATA_DESCRIPTOR = "<4sLLL"
+    CENTRAL_DIR = "<4s4B4HL2L5H2L"
+    END_ARCHIVE = "<4s4H2LH"
+
+    # bit 3: crc and sizes are in the data descriptor
+    DESCRIPTOR_FLAG = 0x08
+    STORED = 0
+    DEFLATED = 8
+    VERSION = 20
+
+    def __init__(self, filename=None, date_time=None):
+        self.filename = filename
+        self.date_time = date_time or datetime.datetime.now()
+
+        self.offset = 0
+        self.entries = []
+
+    def dos_date_time(self):
+        dt = self.date_time
+        date = (dt.year - 1980) << 9 | dt.month << 5 | dt.day
+        time = dt.hour << 11 | dt.minute << 5 | dt.second // 2
+        return date, time
+
+    def _write(self, data):
+        self.offset += len(data)
+        return data
+
+    def _local_header(self, name, flags, method, crc, compressed_size, size):
+        date, time = self.dos_date_time()
+
+        return struct.pack(self.LOCAL_HEADER, "PK\003\004", self.VERSION, 0,
+                           flags, method, time, date, crc, compressed_size,
+                           size, len(name), 0) + name
+
+    def stored(self, name, data):
+        """
+        Yields the bytes of a file that is already in memory, without
+        compressing it (for things like images, that don't get smaller)
+        """
+
+        crc = zlib.crc32(data) & 0xffffffff
+        self.entries.append((name, 0, self.STORED, crc, len(data), len(data),
+                             self.offset))
+
+        yield self._write(self._local_header(name, 0, self.STORED, crc,
+                                             len(data), len(data)))
+        yield self._write(data)
+
+    def deflated(self, name, chunks):
+        """
+        Yields the bytes of a file made of the chunks, compressed as they
+        come in
+        """
+
+        offset = self.offset
+
+        yield self._write(self._local_header(name, self.DESCRIPTOR_FLAG,
+                                             self.DEFLATED, 0, 0, 0))
+
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                      zlib.DEFLATED, -15)
+        crc = 0
+        size = 0
+        compressed_size = 0
+
+        for chunk in chunks:
+            if not chunk:
+                continue
+
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+
+            data = compressor.compress(chunk)
+            if data:
+                compressed_size += len(data)
+                yield self._write(data)
+
+        data = compressor.flush()
+        compressed_size += len(data)
+        crc = crc & 0xffffffff
+
+        yield self._write(data + struct.pack(self.DATA_DESCRIPTOR, "PK\007\010",
+                                             crc, compressed_size, size))
+
+        self.entries.append((name, self.DESCRIPTOR_FLAG, self.DEFLATED, crc,
+                             compressed_size, size, offset))
+
+    def close(self):
+        """
+        Yields the central directory, which ends the zip file
+        """
+
+        date, time = self.dos_date_time()
+        start = self.offset
+
+        central = []
+        for name, flags, method, crc, compressed_size, size, offset in self.entries:
+            central.append(struct.pack(self.CENTRAL_DIR, "PK\001\002",
+                                       self.VERSION, 0, self.VERSION, 0,
+                                       flags, method, time, date, crc,
+                                       compressed_size, size, len(name),
+                                       0, 0, 0, 0, 0, offset) + name)
+
+        central = "".join(central)
+
+        end = struct.pack(self.END_ARCHIVE, "PK\005\006", 0, 0,
+                          len(self.entries), len(self.entries),
+                          len(central), start, 0)
+
+        yield self._write(central + end)
+
+    def iterate(self, chunks):
+        """
+        Yields the bytes of a zip file with the single file `filename` in
+        it, made of the chunks
+        """
+
+        for data in self.deflated(self.filename, chunks):
+            yield data
+
+        for data in self.close():
+            yield data
@@ -7,4 +7,11 @@ class BadgeAdmin(admin.ModelAdmin):
     list_filter = ('title', )
     raw_id_fields = ('awarded_flight', 'user')
 
-admin.site.register(AwardedBadge, BadgeAdmin)
\ No newline at end of file
+admin.site.register(AwardedBadge, BadgeAdmin)
+
+class BadgeProgressAdmin(admin.ModelAdmin):
+    list_display = ('user', 'title')
+    list_filter = ('title', )
+    raw_id_fields = ('user', )
+
+admin.site.register(BadgeProgress, BadgeProgressAdmin)
\ No newline at end of file
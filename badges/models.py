@@ -1,6 +1,7 @@
 import time
 
 from django.db import models
+from django.utils import simplejson
 from airport.models import Location
 from logbook.models import Flight
 from plane.models import Plane
@@ -72,18 +73,140 @@ class AwardedBadge(models.Model):
         self.awarded_flight = status_class.new_flight
         self.save()
 
+class BadgeProgress(models.Model):
+    """
+    Holds the running state (counters, hour sums and sets of distinct things
+    like airports or countries) that a badge class needs to decide if the
+    badge can be awarded. Each new flight gets folded into the state, so the
+    user's whole logbook only gets scanned when a flight is edited or
+    deleted, or the progress is rebuilt.
+    """
+    
+    user = models.ForeignKey('auth.User')
+    title = models.CharField(max_length=64)
+    state = models.TextField(default='{}')
+    
+    class Meta:
+        unique_together = ('user', 'title')
+    
+    def __unicode__(self):
+        return "%s - %s" % (self.title, self.user_id)
+    
+    def decode(self):
+        """
+        Returns the state as a dict. Lists are turned back into sets, since
+        sets are what all the badge classes keep.
+        """
+        state = simplejson.loads(self.state)
+        return dict((key, set(val) if isinstance(val, list) else val)
+                        for key, val in state.items())
+    
+    @classmethod
+    def load(cls, user):
+        """
+        Returns a dict of all the stored states for this user, keyed by
+        badge title.
+        """
+        return dict((p.title, p.decode()) for p in cls.objects.filter(user=user))
+    
+    @classmethod
+    def store(cls, user, states):
+        for title, state in states.items():
+            encoded = simplejson.dumps(
+                dict((key, sorted(val) if isinstance(val, set) else val)
+                        for key, val in state.items())
+            )
+            
+            updated = cls.objects.filter(user=user, title=title)\
+                                 .update(state=encoded)
+            if not updated:
+                cls.objects.create(user=user, title=title, state=encoded)
+    
+    @classmethod
+    def reset(cls, user_ids):
+        """
+        Throw out the progress of the users, for when something that was
+        folded into it changed without the flights being saved (deleted
+        flights, edited planes, re-rendered routes, recalculated fuel). It
+        gets rebuilt the next time one of their flights is saved.
+        """
+        
+        cls.objects.filter(user__id__in=list(user_ids)).delete()
+    
+    @classmethod
+    def locations_by_route(cls, **filters):
+        """
+        Returns a dict of route id to a list of every location in that route
+        as (identifier, country code, continent) tuples. This way the badge
+        classes don't need to do any queries of their own.
+        """
+        from route.models import RouteBase
+        
+        rows = RouteBase.objects.filter(location__isnull=False, **filters)\
+                                .order_by('route', 'sequence')\
+                                .values_list('route',
+                                             'location__identifier',
+                                             'location__country__code',
+                                             'location__country__continent')
+        ret = {}
+        for route_id, identifier, country, continent in rows.iterator():
+            ret.setdefault(route_id, []).append((identifier, country, continent))
+        
+        return ret
+    
+    @classmethod
+    def fold_flight(cls, flight, states, badge_classes):
+        """
+        Add a single flight to the passed states.
+        """
+        locations = cls.locations_by_route(route=flight.route_id)\
+                       .get(flight.route_id, [])
+        
+        for BadgeClass in badge_classes:
+            state = states.setdefault(BadgeClass.title, {})
+            BadgeClass.fold(state, flight, locations)
+    
+    @classmethod
+    def rebuild(cls, user, badge_classes):
+        """
+        Recreate the progress for the passed badge classes from every flight
+        in the user's logbook, in one pass over the flights.
+        """
+        
+        states = dict((BadgeClass.title, {}) for BadgeClass in badge_classes)
+        locations = cls.locations_by_route(route__flight__user=user)
+        
+        flights = Flight.objects.filter(user=user)\
+                                .order_by('date', 'id')\
+                                .select_related('plane', 'route')
+        
+        for flight in flights.iterator():
+            for BadgeClass in badge_classes:
+                BadgeClass.fold(states[BadgeClass.title],
+                                flight,
+                                locations.get(flight.route_id, []))
+        
+        cls.store(user, states)
+        return states
+
 #################################
 
 class BadgeStatus(object):
 
     description = '[placeholder]'
     disabled = True
+    
+    # badge classes that can keep their state in BadgeProgress define this
+    fold = None
 
-    def __init__(self, new_flight=None, all_flights=None, user=None):
+    def __init__(self, new_flight=None, all_flights=None, user=None,
+                 progress=None, awarded=None):
         """
         all_flights == the collection of flights that exist in the logbook.
         new_flight == the new flight that was just added that cause this
         class to be initialized
+        progress == the state dict from BadgeProgress, if this class has one
+        awarded == dict of title -> level of all badges the user already has
         """
         if not user and new_flight is not None:
             self.user = new_flight.user
@@ -95,10 +218,21 @@ class BadgeStatus(object):
         else:
             self.flights = all_flights
         self.new_flight = new_flight
+        self.progress = progress
+        self.awarded = awarded
 
     @classmethod
     def get_description(cls, level):
         return cls.description
+    
+    def check_eligible(self):
+        """
+        Use the stored progress when there is one, otherwise go to the
+        database
+        """
+        if self.progress is not None and self.fold:
+            return self.eligible_from_progress(self.progress)
+        return self.eligible()
 
     def grant_badge(self, level=1, awarding_flight=None):
 
@@ -130,12 +264,14 @@ class BadgeStatus(object):
 class SingleBadgeStatus(BadgeStatus):
     
     def already_awarded(self):
+        if self.awarded is not None:
+            return self.title in self.awarded
         return AwardedBadge.objects.filter(user=self.new_flight.user, title=self.title).exists()
     
     def grant_if_eligible(self):
         if self.already_awarded():
             return False
-        if self.eligible():
+        if self.check_eligible():
             self.grant_badge()
 
 class MultipleLevelBadgeStatus(BadgeStatus):
@@ -182,6 +318,8 @@ class MultipleLevelBadgeStatus(BadgeStatus):
         return 0
     
     def current_level(self):
+        if self.awarded is not None:
+            return self.awarded.get(self.title, 0)
         badge = AwardedBadge.objects.filter(user=self.new_flight.user, title=self.title)
         current_level = 0
         if badge:
@@ -189,7 +327,7 @@ class MultipleLevelBadgeStatus(BadgeStatus):
         return current_level
     
     def grant_if_eligible(self):
-        level = self.eligible()
+        level = self.check_eligible()
         if level == 0:
             return
         
@@ -346,12 +484,32 @@ class CompleteSetBadgeStatus(SingleBadgeStatus):
                 r['tw'] = True
         
         return all(r.values())
+    
+    @classmethod
+    def fold(cls, state, flight, locations):
+        p = flight.plane
+        seen = state.setdefault('seen', set())
+        if p.cat_class in [2,4]:
+            seen.add('multi')
+        if p.cat_class in [1,3]:
+            seen.add('single')
+        if p.cat_class in [3,4]:
+            seen.add('sea')
+        if 'turbine' in p.tags.lower():
+            seen.add('turbine')
+        if 'tailwheel' in p.tags.lower():
+            seen.add('tw')
+    
+    def eligible_from_progress(self, state):
+        return len(state.get('seen', ())) == 5
 
 
 class OneThousandHourBadgeStatus(SingleBadgeStatus):
     title = "One Thousand Hours"
     description = "Logging 1000 hours"
     disabled = False
+    hours = 1000
+    min_flights = 100
     
     def add(self):
         all_flights = Flight.objects.filter(user=self.user).sim(False).order_by('date', 'id')
@@ -370,12 +528,24 @@ class OneThousandHourBadgeStatus(SingleBadgeStatus):
         hours = self.flights.sim(False).aggregate(s=models.Sum('total'))['s']
         c = self.flights.count()
         return hours >= 1000 and c > 100
+    
+    @classmethod
+    def fold(cls, state, flight, locations):
+        if not flight.plane.is_sim():
+            state['hours'] = state.get('hours', 0) + flight.total
+        state['flights'] = state.get('flights', 0) + 1
+    
+    def eligible_from_progress(self, state):
+        return (state.get('hours', 0) >= self.hours and
+                state.get('flights', 0) > self.min_flights)
 
 
-class FiveThousandHourBadgeStatus(SingleBadgeStatus):
+class FiveThousandHourBadgeStatus(OneThousandHourBadgeStatus):
     title = "Five Thousand Hours"
     description = "Logging 5000 hours"
     disabled = False
+    hours = 5000
+    min_flights = 500
 
     def add(self):
         all_flights = Flight.objects.filter(user=self.user).sim(False).order_by('date', 'id')
@@ -396,10 +566,12 @@ class FiveThousandHourBadgeStatus(SingleBadgeStatus):
         return hours >= 5000 and c > 500
 
 
-class TenThousandHourBadgeStatus(SingleBadgeStatus):
+class TenThousandHourBadgeStatus(OneThousandHourBadgeStatus):
     title = "Ten Thousand Hours"
     description = "Logging 10,000 hours"
     disabled = False
+    hours = 10000
+    min_flights = 500
 
     def add(self):
         all_flights = Flight.objects.filter(user=self.user).sim(False).order_by('date', 'id')
@@ -443,6 +615,15 @@ class NightAdventurerBadgeStatus(SingleBadgeStatus):
             routebase__route__flight__in=self.flights,
             routebase__route__flight__night__gt=0)
         return count.distinct().count() > self.needed
+    
+    @classmethod
+    def fold(cls, state, flight, locations):
+        places = state.setdefault('places', set())
+        if flight.night > 0 and not flight.plane.is_sim():
+            places.update(identifier for identifier, country, continent in locations)
+    
+    def eligible_from_progress(self, state):
+        return len(state.get('places', ())) > self.needed
 
 
 class PrivateBadgeStatus(SingleBadgeStatus):
@@ -494,6 +675,13 @@ class MasterInstructorBadgeStatus(SingleBadgeStatus):
     def eligible(self):
         hours = self.flights.aggregate(s=models.Sum('dual_g'))['s']
         return hours > 1000
+    
+    @classmethod
+    def fold(cls, state, flight, locations):
+        state['hours'] = state.get('hours', 0) + flight.dual_g
+    
+    def eligible_from_progress(self, state):
+        return state.get('hours', 0) > 1000
 
 
 class TypeRatingBadgeStatus(SingleBadgeStatus):
@@ -554,6 +742,13 @@ class SwimmingPoolOfFuelBadgeStatus(SingleBadgeStatus):
     def eligible(self):
         total_gals = self.flights.aggregate(s=models.Sum('gallons'))['s']
         return total_gals >= self.capacity
+    
+    @classmethod
+    def fold(cls, state, flight, locations):
+        state['gallons'] = state.get('gallons', 0) + (flight.gallons or 0)
+    
+    def eligible_from_progress(self, state):
+        return state.get('gallons', 0) >= self.capacity
 
 class FuelTruckBadgeStatus(SwimmingPoolOfFuelBadgeStatus):
     title = 'Fuel Truck'
@@ -578,6 +773,14 @@ class ToTheMoonBadgeStatus(SingleBadgeStatus):
     def eligible(self):
         total_dis = self.flights.aggregate(s=models.Sum('gallons'))['s']
         return total_dis >= self.distance
+    
+    @classmethod
+    def fold(cls, state, flight, locations):
+        distance = flight.route.total_line_all or 0
+        state['distance'] = state.get('distance', 0) + distance
+    
+    def eligible_from_progress(self, state):
+        return state.get('distance', 0) >= self.distance
 
 class AroundTheEarthBadgeStatus(ToTheMoonBadgeStatus):
     title = "Around The World"
@@ -619,6 +822,14 @@ class ExplorerBadgeStatus(MultipleLevelBadgeStatus):
     def eligible(self):
         count = Location.objects.filter(routebase__route__flight__in=self.flights)
         return self.determine_level(count.distinct().count())
+    
+    @classmethod
+    def fold(cls, state, flight, locations):
+        visited = state.setdefault('visited', set())
+        visited.update(identifier for identifier, country, continent in locations)
+    
+    def eligible_from_progress(self, state):
+        return self.determine_level(len(state.get('visited', ())))
 
 
 class ClassBBadgeStatus(MultipleLevelBadgeStatus):
@@ -668,6 +879,15 @@ class ClassBBadgeStatus(MultipleLevelBadgeStatus):
         count = qs.count()
 
         return self.determine_level(count)
+    
+    @classmethod
+    def fold(cls, state, flight, locations):
+        visited = state.setdefault('visited', set())
+        visited.update(identifier for identifier, country, continent in locations
+                            if identifier in cls.class_b)
+    
+    def eligible_from_progress(self, state):
+        return self.determine_level(len(state.get('visited', ())))
 
 
 class LongHaulBadgeStatus(MultipleLevelBadgeStatus):
@@ -765,6 +985,15 @@ class WorldExplorerBadgeStatus(MultipleLevelBadgeStatus):
         c = countries.count()
         level = self.determine_level(c)
         return level
+    
+    @classmethod
+    def fold(cls, state, flight, locations):
+        visited = state.setdefault('visited', set())
+        visited.update(country for identifier, country, continent in locations
+                            if country)
+    
+    def eligible_from_progress(self, state):
+        return self.determine_level(len(state.get('visited', ())))
 
 
 class BusyBeeBadgeStatus(MultipleLevelBadgeStatus):
@@ -820,6 +1049,13 @@ class TypeMasterBadgeStatus(MultipleLevelBadgeStatus):
     def eligible(self):
         types = self.flights.values_list('plane__type', flat=True).distinct().count()
         return self.determine_level(types)
+    
+    @classmethod
+    def fold(cls, state, flight, locations):
+        state.setdefault('types', set()).add(flight.plane.type)
+    
+    def eligible_from_progress(self, state):
+        return self.determine_level(len(state.get('types', ())))
 
 
 class SocialBadgeStatus(MultipleLevelBadgeStatus):
@@ -854,6 +1090,16 @@ class SocialBadgeStatus(MultipleLevelBadgeStatus):
             return False
         people = self.flights.values_list('person', flat=True).distinct().count()
         return self.determine_level(people)
+    
+    @classmethod
+    def fold(cls, state, flight, locations):
+        if flight.person:
+            state.setdefault('people', set()).add(flight.person)
+    
+    def eligible_from_progress(self, state):
+        if not self.new_flight.person:
+            return False
+        return self.determine_level(len(state.get('people', ())))
 
 ################################################################################
 
@@ -873,10 +1119,52 @@ def get_badges_classes():
 
 BADGE_CLASSES = get_badges_classes()
  
-def award_badges(new_flight):
+def award_badges(new_flight, rescan=False):
+    """
+    Award any badges the new flight has earned. The badge classes that keep
+    progress only get the new flight added to their state. When rescan is
+    True (the flight was edited), the progress is rebuilt from the whole
+    logbook instead.
+    """
     user = new_flight.user
+    awarded = dict(AwardedBadge.objects.filter(user=user)
+                                       .values_list('title', 'level'))
+    
+    progressive = [BadgeClass for BadgeClass in BADGE_CLASSES if BadgeClass.fold]
+    
+    if rescan:
+        states = BadgeProgress.rebuild(user, progressive)
+    else:
+        states = BadgeProgress.load(user)
+        missing = [BadgeClass for BadgeClass in progressive
+                        if BadgeClass.title not in states]
+        existing = [BadgeClass for BadgeClass in progressive
+                        if BadgeClass.title in states]
+        
+        # classes that have no progress yet get rebuilt, which already
+        # includes the new flight
+        if missing:
+            states.update(BadgeProgress.rebuild(user, missing))
+        
+        if existing:
+            BadgeProgress.fold_flight(new_flight, states, existing)
+            BadgeProgress.store(user, dict((BadgeClass.title, states[BadgeClass.title])
+                                                for BadgeClass in existing))
+    
     for BadgeClass in BADGE_CLASSES:
-        BadgeClass(new_flight).grant_if_eligible()
+        BadgeClass(new_flight,
+                   progress=states.get(BadgeClass.title),
+                   awarded=awarded).grant_if_eligible()
+
+def reset_progress(sender, **kwargs):
+    """
+    When a flight is deleted, throw out the user's badge progress. It gets
+    rebuilt the next time a flight is saved.
+    """
+    flight = kwargs['instance']
+    BadgeProgress.reset([flight.user_id])
+
+models.signals.post_delete.connect(reset_progress, sender=Flight)
 
 
 
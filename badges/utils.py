@@ -58,4 +58,20 @@ def new_badge2(badges=None, users=None, **kwargs):
         for Badge in badges:
             t0 = time.time()
             Badge(user=user).add()
-            print "%s - %.3f s" % (Badge.__name__, time.time() - t0)
\ No newline at end of file
+            print "%s - %.3f s" % (Badge.__name__, time.time() - t0)
+
+def rebuild_progress(users=None, **kwargs):
+    """
+    Rebuild the stored badge progress for the passed users from scratch.
+    """
+    from models import BadgeProgress, BADGE_CLASSES
+    
+    if users is None:
+        users = User.objects.filter(**kwargs).order_by('username')
+    
+    progressive = [Badge for Badge in BADGE_CLASSES if Badge.fold]
+    
+    for user in users:
+        t0 = time.time()
+        BadgeProgress.rebuild(user, progressive)
+        print "%s - %.3f s" % (user.username, time.time() - t0)
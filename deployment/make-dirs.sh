@@ -1,3 +1,4 @@
 #!/bin/bash
-sudo mkdir /var/cache/mpl /var/fl-uploads
-sudo chown www-data:www-data /var/cache/mpl /var/fl-uploads
+DIRS="/var/cache/mpl /var/fl-uploads /var/fl-graph-cache /var/fl-pdfs /var/fl-histograms"
+sudo mkdir -p $DIRS
+sudo chown www-data:www-data $DIRS
@@ -134,6 +134,7 @@ INSTALLED_APPS = (
     'maps',
     'realtime',
     'graphs',
+    'histogram',
     'currency',
     'auto8710',
     'sigs',
@@ -40,4 +40,22 @@ EASYDUMP_MANIFESTS = {
     }
 }
 
-BADGES_ENABLE = True
\ No newline at end of file
+BADGES_ENABLE = True
+
+# badges, route rendering and the backup signal are put in a queue and ran
+# by `manage.py run_jobs` instead of during the request. The crontab runs it
+# every minute, it drains the queue until it is empty
+DEFERRED_JOBS = True
+
+# where rendered linegraphs and bargraphs are kept, and how many bytes of
+# images to keep before the least recently used ones are removed
+GRAPH_CACHE_ROOT = '/var/fl-graph-cache'
+GRAPH_CACHE_SIZE = 512 * 1024 * 1024
+
+# PDFs of logbooks with more than PDF_BACKGROUND_FLIGHTS flights are made by
+# the job queue and saved here
+PDF_DIR = '/var/fl-pdfs'
+PDF_BACKGROUND_FLIGHTS = 5000
+
+# the site-wide histograms, made by `manage.py calc_histograms`
+HISTOGRAM_STORE = '/var/fl-histograms/histograms.npz'
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""
+Rendered graph images, stored on disk under a hash of the user's logbook
+version and the graph's parameters. When the logbook gets edited the
+version changes, so old images are never served again and eventually get
+evicted, least recently used first.
+"""
+
+import os
+import tempfile
+
+from django.conf import settings
+
+from logbook.utils import logbook_version, logbook_digest, cached_image
+
+MIMES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+class GraphCache(object):
+
+    # when the cache gets too big, remove images until it's this full
+    LOW_WATER = 0.8
+
+    def __init__(self, root, max_size):
+        self.root = root
+        self.max_size = max_size
+        self.size = None
+
+    def path(self, digest, ext):
+        return os.path.join(self.root, digest[:2], "%s.%s" % (digest, ext))
+
+    def get(self, digest, ext):
+        """
+        Returns the image, or None if it's not in the cache
+        """
+
+        path = self.path(digest, ext)
+
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except IOError:
+            return None
+
+        # the modification time is what the eviction goes by
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        return data
+
+    def put(self, digest, ext, data):
+        """
+        Save the image. The cache is only an optimization, so if the image
+        can't be written (full disk, missing permissions) it is just left
+        out of the cache.
+        """
+
+        path = self.path(digest, ext)
+        directory = os.path.dirname(path)
+
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass # another process made it first
+
+        # write to a temporary file first so no one reads half an image
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(tmp, path)
+        except (IOError, OSError):
+            if tmp and os.path.exists(tmp):
+                os.remove(tmp)
+            return
+
+        if self.size is None:
+            self.size = self.total_size()
+        else:
+            self.size += len(data)
+
+        if self.size > self.max_size:
+            self.evict()
+
+    def files(self):
+        """
+        Returns (modification time, size, path) for each image in the cache
+        """
+
+        ret = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                ret.append((st.st_mtime, st.st_size, path))
+
+        return ret
+
+    def total_size(self):
+        return sum(size for mtime, size, path in self.files())
+
+    def evict(self):
+        """
+        Remove the least recently used images until the cache is down to
+        LOW_WATER of it's maximum size.
+        """
+
+        files = sorted(self.files())
+        total = sum(size for mtime, size, path in files)
+        target = self.max_size * self.LOW_WATER
+
+        for mtime, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+        self.size = total
+
+_cache = None
+
+def get_cache():
+    """
+    Returns the process wide GraphCache, or None if no cache directory has
+    been set up.
+    """
+
+    global _cache
+
+    root = getattr(settings, 'GRAPH_CACHE_ROOT', None)
+
+    if not root:
+        return None
+
+    if _cache is None:
+        _cache = GraphCache(root, getattr(settings, 'GRAPH_CACHE_SIZE',
+                                          256 * 1024 * 1024))
+    return _cache
+
+def graph_digest(user, version, kind, params, ext):
+    return logbook_digest(user, version, kind, *(list(params) + [ext]))
+
+def cached_graph(request, kind, params, ext, render):
+    """
+    Returns the graph made by `render` (which returns an HttpResponse),
+    out of the disk cache if the logbook hasn't changed since it was made.
+    """
+
+    cache = get_cache()
+
+    if not cache:
+        return render()
+
+    return cached_image(request, [kind] + list(params) + [ext], MIMES[ext],
+                        render,
+                        get=lambda digest: cache.get(digest, ext),
+                        put=lambda digest, data: cache.put(digest, ext, data))
+
+def warm_graphs(user):
+    """
+    Render the graphs that are shown when the graph pages are first opened,
+    so they are already in the cache when the user gets there.
+    """
+
+    from views import render_linegraph, render_bargraph, default_graphs
+
+    version = logbook_version(user)
+    cache = get_cache()
+
+    if version is None or not cache:
+        return
+
+    renderers = {'linegraph': render_linegraph, 'bargraph': render_bargraph}
+
+    for kind, params, ext in default_graphs(user):
+        digest = graph_digest(user, version, kind, params, ext)
+
+        if cache.get(digest, ext) is not None:
+            continue
+
+        response = renderers[kind](user, *params, ext=ext)
+
+        if response.status_code == 200:
+            cache.put(digest, ext, response.content)
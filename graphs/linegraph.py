@@ -1,17 +1,15 @@
 import datetime
 import numpy
-from collections import deque
 
 from django.utils.dateformat import format
-from django.db.models import Sum
         
 from matplotlib.figure import Figure
 
-from logbook.constants import FIELD_TITLES, DB_FIELDS
+from logbook.constants import FIELD_TITLES
 from logbook.models import Flight
+from logbook.queryset_manager import AGG_SQL
 from main.mixins import NothingHereMixin
 
-from utils import datetimeRange
 from image_formats import plot_png, plot_svg, plot_png2, plot_svg2
 
 
@@ -99,8 +97,10 @@ class ProgressGraph(NothingHereMixin):
             # get either the rate plot lists or the actual plot list
             # if this part is being executed because plot.twin is True, then
             # there will be no plot.rx/ry, the data will be in plot.x/y instead
-            rx = getattr(plot, "rx", None) or plot.x
-            ry = getattr(plot, "ry", None) or plot.y
+            rx = getattr(plot, "rx", None)
+            ry = getattr(plot, "ry", None)
+            if rx is None:
+                rx, ry = plot.x, plot.y
             
             c = plot.rate_kwargs['color']
             if not self.ax2:
@@ -159,8 +159,8 @@ class Plot(object):
         """
         All subclasses need to first determine self.start and self.end, and
         self.title before this constructor can be called with super()
-        data needs to be a list of dicts:
-            [{'value': 34, 'date': datetime.date(207, 4, 2)}, { ... } ]
+        get_data needs to return two numpy arrays of the same length, the
+        dates (in order) and the value of each date.
         """
         
         self.pad = pad
@@ -178,40 +178,38 @@ class Plot(object):
         self.unit = "Accumulated Flight Hours"
         self.rate_unit = rate_unit or "30 Day Moving Total"
             
-    def _moving_value(self, iterable):
+    def _moving_value(self, values):
         """
-        Calculate the moving total with a deque
+        Calculate the moving total of the last `interval` values by
+        differencing the cumulative sum
         http://en.wikipedia.org/wiki/Moving_average
         """
         
-        d = deque([], self.interval)
+        total = numpy.cumsum(values, dtype=float)
+        moving = total.copy()
+        moving[self.interval:] -= total[:-self.interval]
         
-        data = []
-        for elem in iterable:
-            d.append(elem)
-            data.append(sum(d))
-            
-        return data
+        return moving
 
-    def _construct_plot_lists(self, data, rate, pad):
+    def _construct_plot_lists(self, dates, values, rate, pad):
         """
-        Transform the raw data into plot ready lists: x, y.
-        And for the rate: padx, pady
+        Transform the raw data into plot ready arrays: x, y.
+        And for the rate: padx, pady, which have a value for every day from
+        interval_start to the end, zero for days with nothing logged.
         """
         
-        values = []
-        dates = []
-        d={}
-        for item in data:
-            values.append(item['value'] or 0)
-            dates.append(item['date'])
-            d.update({item['date']: item['value']})
-            
         accumulation = numpy.cumsum(values)
         
         if rate and pad:
-            padx = list(datetimeRange(self.interval_start, self.end))
-            pady = [d.get(day, 0) for day in padx]
+            start = numpy.datetime64(self.interval_start, 'D')
+            days = (self.end - self.interval_start).days + 1
+            
+            index = (dates.astype('datetime64[D]') - start).astype(int)
+            inside = (index >= 0) & (index < days)
+            
+            padx = start + numpy.arange(days)
+            pady = numpy.bincount(index[inside], weights=values[inside],
+                                  minlength=days)
         else:
             padx = None
             pady = None
@@ -236,10 +234,13 @@ class Plot(object):
     
     def calculate(self):
     
-        data = self.get_data()
+        dates, values = self.get_data()
      
-        self.x, self.rawy, self.y, padx, pady = \
-                self._construct_plot_lists(data, self.rate, self.pad)
+        x, self.rawy, self.y, padx, pady = \
+                self._construct_plot_lists(dates, values, self.rate, self.pad)
+        
+        # matplotlib wants date objects, not datetime64
+        self.x = x.tolist()
                 
         if self.kwargs.pop('no_acc', False):
             self.y = self.rawy
@@ -248,7 +249,7 @@ class Plot(object):
         if self.rate:
             self.do_rate = True
             if self.pad:
-                self.rx = padx
+                self.rx = padx.tolist()
                 self.ry = self._moving_value(pady)
             else:
                 self.rx = self.x
@@ -270,21 +271,88 @@ class Plot(object):
 
 ##############################################################################
 
+class LogbookData(object):
+    """
+    The daily totals of one or more columns of a user's logbook. Each
+    column is a conditional SUM() so every column of a graph comes from a
+    single query, which is shared between all of the graph's plots.
+    """
+    
+    def __init__(self, user, columns, spikes=True):
+        self.user = user
+        self.columns = list(columns)
+        self.spikes = spikes
+        self._data = None
+    
+    def column(self, column):
+        """
+        Returns the dates (as datetime64) and the totals of that column on
+        each date.
+        """
+        
+        if self._data is None:
+            self._data = self.fetch()
+        
+        dates, values = self._data
+        return dates, values[:, self.columns.index(column)]
+    
+    def fetch(self):
+        from django.db import connection
+        from django.db.models.sql.datastructures import EmptyResultSet
+        
+        qs = Flight.objects.user(self.user)
+        
+        if not self.spikes:
+            # filter out spikes so it makes a smooth line
+            qs = qs.exclude(total__gte=24)
+        
+        try:
+            subquery, params = qs.order_by()\
+                                 .values('pk')\
+                                 .query.get_compiler(qs.db)\
+                                 .as_sql()
+        except EmptyResultSet:
+            return (numpy.array([], dtype='datetime64[D]'),
+                    numpy.zeros((0, len(self.columns))))
+        
+        selects = ", ".join("SUM(%s)" % AGG_SQL[cn] for cn in self.columns)
+        
+        cursor = connection.cursor()
+        cursor.execute(
+            """SELECT logbook_flight.date, %s
+               FROM logbook_flight
+               INNER JOIN plane_plane
+                  ON plane_plane.id = logbook_flight.plane_id
+               LEFT OUTER JOIN route_route
+                  ON route_route.id = logbook_flight.route_id
+               WHERE logbook_flight.id IN (%s)
+               GROUP BY logbook_flight.date
+               ORDER BY logbook_flight.date""" % (selects, subquery), params)
+        
+        rows = cursor.fetchall()
+        
+        dates = numpy.array([row[0] for row in rows], dtype='datetime64[D]')
+        values = numpy.array([[val or 0 for val in row[1:]] for row in rows],
+                             dtype=float).reshape(len(rows), len(self.columns))
+        
+        return dates, values
+
+##############################################################################
+
 class LogbookPlot(Plot):
     
-    def __init__(self, user, column, range=None, rate=False, spikes=True, **kwargs):
+    def __init__(self, user, column, range=None, rate=False, spikes=True,
+                                                        data=None, **kwargs):
         """
         Turns a username, column name and a date range into a big single
         list data from the database. self.interval_start is used internally
-        to ensure rate plots are accurate
+        to ensure rate plots are accurate. Plots of the same graph can pass
+        in a shared LogbookData so the logbook is only queried once.
         """
         
-        self.start_qs = Flight.objects.user(user).filter_by_column(column)
+        self.data = data or LogbookData(user, [column], spikes)
         
         self.title = FIELD_TITLES[column]
-        
-        if not spikes:
-            self.filter_spikes()
             
         self.column = column
             
@@ -297,55 +365,25 @@ class LogbookPlot(Plot):
         
         # pad=True because of how logbook data is retrieved from the database
         super(LogbookPlot, self).__init__(rate=rate, pad=True, **kwargs)
-
-    def figure_start_and_end(self, qs):
-        """
-        Get the dates that the graph starts and ends. This function is for when
-        a date range is not manually passed into the class
-        """
-        try:
-            end = qs.values('date').latest()['date']
-            start = qs.values('date').order_by('date')[0]['date']
-        except Flight.DoesNotExist:
-            raise EmptyGraph
-
-        return (start, end)
-
-    def get_annotate_field(self, column):
-        """
-        Returns a db field name for use in the annotate function
-        """
-        
-        if column == 'line_dist':
-            return "route__total_line_all"
-        
-        if column in DB_FIELDS:
-            return column
-        elif column.endswith('pic'):
-            return 'pic'
-        else:
-            return 'total'
-
-    def filter_spikes(self):
-        """
-        Filter out spikes so it makes a smooth line
-        """
-        
-        self.start_qs = self.start_qs.exclude(total__gte=24)
     
     def get_data(self):
         """
-        Returns a list of dicts containing values and dates
-        which will be sent off to more processing. This data is
-        filtered to the appropriate date range.
+        Returns the dates and values which will be sent off to more
+        processing. This data is filtered to the appropriate date range.
         """
         
-        column = self.column
+        dates, values = self.data.column(self.column)
+        
+        # only the days this column was logged
+        logged = values != 0
+        dates, values = dates[logged], values[logged]
         
         if not self.start and not self.end:
-            # Determine the start and end of the graph based on
-            # some extra database queries.
-            self.start, self.end = self.figure_start_and_end(self.start_qs)
+            # the graph goes from the first to the last time this column
+            # was logged
+            if not len(dates):
+                raise EmptyGraph
+            self.start, self.end = dates[0].tolist(), dates[-1].tolist()
             
         self.interval_start = self.start
         
@@ -354,25 +392,17 @@ class LogbookPlot(Plot):
             #this is so the rate line is fully accurate when the plot starts 
             self.interval_start -= datetime.timedelta(days=self.interval)
         
+        if not len(dates):
+            return dates, values
         
-        qs = self.start_qs
-        db_column = self.get_annotate_field(column)
+        start = numpy.datetime64(self.interval_start, 'D')
+        end = numpy.datetime64(self.end, 'D')
         
-        if qs.count() < 1:
-            return {}
-            
-        before_graph = qs.filter(date__lt=self.interval_start)\
-                         .agg(column, float=True)
-                         
-        qs = qs.filter(date__range=(self.interval_start,self.end))\
-               .values('date')\
-               .annotate(value=Sum(db_column))\
-               .order_by('date')
-
-        data = list(qs)
+        before_graph = values[dates < start].sum()
+        inside = (dates >= start) & (dates <= end)
         
         # add the before graph value to the beginning of the interval data
-        data.insert(0, {"date": self.interval_start-datetime.timedelta(days=1), 
-                        "value": before_graph})
+        dates = numpy.concatenate(([start - 1], dates[inside]))
+        values = numpy.concatenate(([before_graph], values[inside]))
 
-        return data
+        return dates, values
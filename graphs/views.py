@@ -6,7 +6,25 @@ from share.decorator import no_share
 from logbook.constants import GRAPH_FIELDS, AGG_FIELDS, FIELD_TITLES
 
 from constants import PLOT_COLORS
-from linegraph import LogbookProgressGraph, LogbookPlot
+from linegraph import LogbookProgressGraph, LogbookPlot, LogbookData
+from cache import cached_graph
+
+def default_graphs(user):
+    """
+    The graphs that are shown when the linegraph and bargraph pages are
+    first opened, as (kind, params, ext). These are rendered ahead of time
+    after each logbook edit.
+    """
+    
+    from profile.models import Profile
+    from constants import BAR_FIELDS
+    
+    style = Profile.get_for_user(user).style
+    
+    return [
+        ('linegraph', ('total', None, False, True), 'png'),
+        ('bargraph', (BAR_FIELDS[0], 'Sum', 'type', style), 'png'),
+    ]
 
 @no_share('other')
 def linegraph_image(request, columns, dates=None, ext='png',
@@ -24,12 +42,25 @@ def linegraph_image(request, columns, dates=None, ext='png',
     elif spikes == '-nospikes':
         spikes = False
     
-    plots = []
+    def render():
+        return render_linegraph(request.display_user, columns, dates,
+                                rate, spikes, ext)
+    
+    return cached_graph(request, 'linegraph', (columns, dates, rate, spikes),
+                        ext, render)
+
+def render_linegraph(user, columns, dates, rate, spikes, ext='png'):
+    
     columns = columns.split('-')
+    
+    if any(column not in GRAPH_FIELDS for column in columns):
+        raise Http404
+    
+    # all plots come out of the same query
+    data = LogbookData(user, columns, spikes)
+    
+    plots = []
     for column in columns:
-
-        if column not in GRAPH_FIELDS:
-            raise Http404
         
         if len(columns) > 1:
             color = PLOT_COLORS[column]
@@ -37,12 +68,13 @@ def linegraph_image(request, columns, dates=None, ext='png',
             color = 'blue'
         
         p = LogbookPlot(
-                user=request.display_user,
+                user=user,
                 column=column,
                 range=dates,
                 rate=rate,
                 spikes=spikes,
                 color=color,
+                data=data,
             )
         
         if column == 'app':
@@ -72,6 +104,17 @@ def linegraph_image(request, columns, dates=None, ext='png',
 
 def bargraph_image(request, column, func, agg):
     
+    from profile.models import Profile
+    style = Profile.get_for_user(request.display_user).style
+    
+    def render():
+        return render_bargraph(request.display_user, column, func, agg, style)
+    
+    return cached_graph(request, 'bargraph', (column, func, agg, style),
+                        'png', render)
+
+def render_bargraph(user, column, func, agg, style, ext='png'):
+    
     import bargraph as g
         
     if agg == 'person':
@@ -119,10 +162,8 @@ def bargraph_image(request, column, func, agg):
     else:
         assert False, "Agg not added to generator view"
     
-    graph = Graph(request.display_user, column, agg, func)
-    
-    from profile.models import Profile
-    graph.color_profile = Profile.get_for_user(request.display_user).style
+    graph = Graph(user, column, agg, func)
+    graph.color_profile = style
     
     return graph.as_png()
 
@@ -1,27 +1,35 @@
-from django.views.decorators.cache import cache_page
-import numpy as np
 from matplotlib.figure import Figure
 
-from django.conf import settings
-from django.db.models import Sum
 from graphs.image_formats import plot_png, plot_svg
 from main.mixins import NothingHereMixin
 
+from store import get_store
+
 class BaseHistogram(NothingHereMixin):
+    """
+    Draws bins that were calculated ahead of time by the calc_histograms
+    command. get_data() sets self.counts and self.edges, or leaves them
+    None when there is nothing stored.
+    """
+    
     def __init__(self, **kwargs):      
         self.kwargs = kwargs
+        self.counts = None
+        self.edges = None
         self.get_data()
                  
     def output(self):
 
-        if not self.data:
+        if self.counts is None or not self.counts.sum():
             return self.NothingHereGraph
         
         fig = Figure()
         ax = fig.add_subplot(111)
 
         # the histogram of the data
-        ax.hist(self.data, 50, facecolor='green', alpha=0.75)
+        widths = self.edges[1:] - self.edges[:-1]
+        ax.bar(self.edges[:-1], self.counts, widths, align='edge',
+               facecolor='green', alpha=0.75)
 
         ax.set_xlabel(self.x_label)
         ax.set_ylabel(self.y_label)
@@ -32,34 +40,31 @@ class BaseHistogram(NothingHereMixin):
         
         return fig
     
-    def remove_outliers(self):
-        import numpy
-        # convert to numpy array
-        A = numpy.array(self.data)
-        
-        # remove all outliers
-        dev = (3*A.std())
-        self.data = list(A[(A < A.mean()+dev) & (A > A.mean()-dev)])
-    
     def as_png(self):
         return plot_png(self.output)()
+    
+    def as_dict(self):
+        """
+        The bins, for the JSON api
+        """
+        
+        if self.counts is None:
+            return {'title': self.title, 'counts': [], 'edges': []}
+        
+        return {'title': self.title,
+                'counts': self.counts.tolist(),
+                'edges': self.edges.tolist()}
 
 #########################################################
 
 class UserTotalsHistogram(BaseHistogram):
     def get_data(self):
-        from django.contrib.auth.models import User
         
-        self.data = User.objects\
-                        .exclude(id=settings.DEMO_USER_ID)\
-                        .values('id')\
-                        .annotate(t=Sum('flight__total'))\
-                        .filter(t__isnull=False)\
-                        .values_list('t', flat=True)
-                        
-        e = self.data.filter(t__gt=3000).count()
+        e = 0
+        data = get_store().user_totals()
         
-        self.data = self.data.exclude(t__gt=3000)
+        if data:
+            self.counts, self.edges, e = data
                         
         self.x_label = 'Total Flight Hours'
         self.y_label = 'Number of Users'
@@ -68,21 +73,13 @@ class UserTotalsHistogram(BaseHistogram):
 
 class ModelSpeedHistogram(BaseHistogram):
     def get_data(self):
-        from logbook.models import Flight
         
         model = self.kwargs.pop('model')
         
-        self.data = Flight.objects\
-              .user('ALL')\
-              .filter(plane__model__iexact=model)\
-              .exclude(speed__isnull=True)\
-              .exclude(speed__gte=500)\
-              .exclude(speed=0)\
-              .exclude(app__gt=1)\
-              .exclude(route__total_line_all__lt=50)\
-              .values_list('speed', flat=True)
+        data = get_store().speeds('model', model)
         
-        self.remove_outliers()
+        if data:
+            self.counts, self.edges = data
                   
         self.x_label = "Speed of flight (knots)"
         self.y_label = "Number of flights"
@@ -90,25 +87,14 @@ class ModelSpeedHistogram(BaseHistogram):
         
 class TypeSpeedHistogram(BaseHistogram):
     def get_data(self):
-        from logbook.models import Flight
 
         type_ = self.kwargs.pop('type_')
         
-        self.data = Flight.objects\
-              .user('ALL')\
-              .filter(plane__type__iexact=type_)\
-              .exclude(speed__isnull=True)\
-              .exclude(speed=0)\
-              .exclude(app__gt=1)\
-              .exclude(route__total_line_all__lt=50)\
-              .values_list('speed', flat=True)
+        data = get_store().speeds('type', type_)
         
-        self.remove_outliers()
+        if data:
+            self.counts, self.edges = data
                    
         self.x_label = "Speed of flight (knots)"
         self.y_label = "Number of flights"
         self.title = "Speed of %s Flights" % type_
-
-
-
-
@@ -0,0 +1,19 @@
+import datetime
+
+from django.core.management.base import NoArgsCommand
+
+from histogram.store import calculate
+
+class Command(NoArgsCommand):
+    help = 'Bin the site-wide histograms and save them, ran by cron'
+    
+    def handle(self, *args, **options):
+        
+        def progress(name, seconds):
+            print "%s [%.2f sec]" % (name, seconds)
+        
+        start = datetime.datetime.now()
+        calculate(progress)
+        
+        print "\n=====\ntotal processing time: %s" % \
+                                (datetime.datetime.now() - start)
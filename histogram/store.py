@@ -0,0 +1,249 @@
+"""
+The site-wide histograms are binned ahead of time by the calc_histograms
+command, which is ran by cron. All distributions are saved into a single
+compressed numpy file: the bin counts and bin edges of every model and
+type are kept in one 2D array each, with a sorted array of the
+(uppercased) names to look them up by. The views only ever read this file,
+they never touch the flight table.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+from django.conf import settings
+from django.db.models import Sum
+
+BINS = 50
+
+# users with more hours than this are left out of the user totals histogram
+MAX_USER_TOTAL = 3000
+
+def remove_outliers(data):
+    """
+    Remove all values more than three standard deviations from the mean
+    """
+
+    dev = 3 * data.std()
+    mean = data.mean()
+    return data[(data < mean + dev) & (data > mean - dev)]
+
+def grouped_histograms(names, values):
+    """
+    Bin the values of each name separately. Returns the sorted names that
+    have any data left after removing outliers, and the counts and edges
+    of each name's bins as two 2D arrays in the same order.
+    """
+
+    if not len(names):
+        return (np.array([], dtype=unicode),
+                np.zeros((0, BINS), dtype=np.int32),
+                np.zeros((0, BINS + 1), dtype=np.float32))
+
+    keys, inverse = np.unique(names, return_inverse=True)
+
+    order = np.argsort(inverse, kind='mergesort')
+    splits = np.cumsum(np.bincount(inverse, minlength=len(keys)))[:-1]
+    groups = np.split(values[order], splits)
+
+    out_names, counts, edges = [], [], []
+    for name, data in zip(keys, groups):
+        data = remove_outliers(data)
+
+        if not len(data):
+            continue
+
+        c, e = np.histogram(data, BINS)
+        out_names.append(name)
+        counts.append(c)
+        edges.append(e)
+
+    return (np.array(out_names, dtype=unicode),
+            np.array(counts, dtype=np.int32).reshape(-1, BINS),
+            np.array(edges, dtype=np.float32).reshape(-1, BINS + 1))
+
+###############################################################################
+
+def user_totals():
+    """
+    The bins of the total hours of every user's logbook
+    """
+
+    from django.contrib.auth.models import User
+
+    totals = User.objects\
+                 .exclude(id=settings.DEMO_USER_ID)\
+                 .values('id')\
+                 .annotate(t=Sum('flight__total'))\
+                 .filter(t__isnull=False)\
+                 .values_list('t', flat=True)
+
+    totals = np.fromiter(totals.iterator(), dtype=float)
+
+    excluded = (totals > MAX_USER_TOTAL).sum()
+    totals = totals[totals <= MAX_USER_TOTAL]
+
+    if len(totals):
+        counts, edges = np.histogram(totals, BINS)
+    else:
+        counts, edges = np.zeros(0, dtype=np.int32), np.zeros(0)
+
+    return {
+        'user_totals_counts': counts.astype(np.int32),
+        'user_totals_edges': edges.astype(np.float32),
+        'user_totals_excluded': np.array(excluded, dtype=np.int32),
+    }
+
+def speeds():
+    """
+    The bins of the speed of every flight, by model and by type. Both come
+    out of the same query.
+    """
+
+    from logbook.models import Flight
+
+    rows = Flight.objects\
+                 .user('ALL')\
+                 .exclude(speed__isnull=True)\
+                 .exclude(speed=0)\
+                 .exclude(app__gt=1)\
+                 .exclude(route__total_line_all__lt=50)\
+                 .values_list('plane__model', 'plane__type', 'speed')
+
+    models, types, values = [], [], []
+    for model, type_, speed in rows.iterator():
+        models.append((model or "").upper())
+        types.append((type_ or "").upper())
+        values.append(speed)
+
+    models = np.array(models, dtype=unicode)
+    types = np.array(types, dtype=unicode)
+    values = np.array(values, dtype=float)
+
+    data = {}
+
+    # the model histogram also leaves out the very fast flights
+    for kind, names, keep in (('model', models, values < 500),
+                              ('type', types, values == values)):
+        keep &= (names != "")
+
+        names, counts, edges = grouped_histograms(names[keep], values[keep])
+
+        data['%s_names' % kind] = names
+        data['%s_counts' % kind] = counts
+        data['%s_edges' % kind] = edges
+
+    return data
+
+# the distributions that calc_histograms makes, in order
+DISTRIBUTIONS = (
+    ('user totals', user_totals),
+    ('speeds', speeds),
+)
+
+###############################################################################
+
+class HistogramStore(object):
+    """
+    Reads and writes the file all of the histograms are kept in. The
+    arrays are loaded once per process, and again whenever the file is
+    replaced.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+        self.arrays = {}
+
+    def save(self, arrays):
+        directory = os.path.dirname(self.path)
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # write to a temporary file first so no one reads half the store
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.npz')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.rename(tmp, self.path)
+
+    def load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self.mtime, self.arrays = None, {}
+            return self.arrays
+
+        if not mtime == self.mtime:
+            npz = np.load(self.path)
+            self.arrays = dict((name, npz[name]) for name in npz.files)
+            npz.close()
+            self.mtime = mtime
+
+        return self.arrays
+
+    def user_totals(self):
+        """
+        Returns (counts, edges, number of users left out), or None if the
+        histograms have not been made yet.
+        """
+
+        arrays = self.load()
+
+        if 'user_totals_counts' not in arrays:
+            return None
+
+        return (arrays['user_totals_counts'],
+                arrays['user_totals_edges'],
+                int(arrays['user_totals_excluded']))
+
+    def speeds(self, kind, name):
+        """
+        Returns (counts, edges) of the model or type (matched case
+        insensitively), or None if there is nothing stored for it.
+        """
+
+        arrays = self.load()
+        names = arrays.get('%s_names' % kind)
+
+        if names is None or not len(names):
+            return None
+
+        name = name.upper()
+        i = np.searchsorted(names, name)
+
+        if i == len(names) or not names[i] == name:
+            return None
+
+        return arrays['%s_counts' % kind][i], arrays['%s_edges' % kind][i]
+
+_store = None
+
+def get_store():
+    global _store
+
+    if _store is None:
+        path = getattr(settings, 'HISTOGRAM_STORE',
+                       '/var/fl-histograms/histograms.npz')
+        _store = HistogramStore(path)
+
+    return _store
+
+def calculate(progress=None):
+    """
+    Make every distribution and replace the store with them. `progress` is
+    called with the name of each distribution and how long it took.
+    """
+
+    import time
+
+    arrays = {}
+    for name, func in DISTRIBUTIONS:
+        start = time.time()
+        arrays.update(func())
+
+        if progress:
+            progress(name, time.time() - start)
+
+    get_store().save(arrays)
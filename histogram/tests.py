@@ -14,6 +14,28 @@ class SimpleTest(TestCase):
         """
         self.failUnlessEqual(1 + 1, 2)
 
+class GroupedHistogramsTest(TestCase):
+    def test_grouped_histograms(self):
+        """
+        Tests that each name gets binned the same as a histogram of only
+        it's own values
+        """
+        
+        import numpy as np
+        from store import grouped_histograms, BINS
+        
+        names = np.array([u'C-172', u'BE-55', u'C-172', u'BE-55', u'C-172'])
+        values = np.array([100.0, 180.0, 110.0, 190.0, 105.0])
+        
+        out_names, counts, edges = grouped_histograms(names, values)
+        
+        self.failUnlessEqual(list(out_names), [u'BE-55', u'C-172'])
+        self.failUnlessEqual(counts.shape, (2, BINS))
+        self.failUnlessEqual(counts[1].sum(), 3)
+        
+        expected = np.histogram([100.0, 110.0, 105.0], BINS)[0]
+        self.failUnlessEqual(list(counts[1]), list(expected))
+
 __test__ = {"doctest": """
 Another way to test that 1 + 1 is equal to 2.
 
@@ -19,4 +19,16 @@ urlpatterns = patterns('histogram.views',
         "user_totals",
                                                   name="histogram-user_totals",
     ),
+    
+    url(
+        r'^(?P<kind>model|type)-(?P<name>.+)\.json$',
+        "bins",
+                                                         name="histogram-bins",
+    ),
+    
+    url(
+        r'^(?P<kind>user_totals)\.json$',
+        "bins",
+                                             name="histogram-user_totals-bins",
+    ),
 )
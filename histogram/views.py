@@ -1,3 +1,6 @@
+import json
+
+from django.http import HttpResponse
 from django.views.decorators.cache import cache_page
 from histogram import *
 
@@ -15,3 +18,17 @@ def user_totals(request, model=None):
 def type_(request, type_=None):
     b = TypeSpeedHistogram(type_=type_)
     return b.as_png()
+
+def bins(request, kind, name=None):
+    """
+    The precomputed bins of a histogram, as JSON
+    """
+    
+    if kind == 'model':
+        b = ModelSpeedHistogram(model=name)
+    elif kind == 'type':
+        b = TypeSpeedHistogram(type_=name)
+    else:
+        b = UserTotalsHistogram()
+    
+    return HttpResponse(json.dumps(b.as_dict()), mimetype="application/json")
@@ -11,5 +11,22 @@ class ColumnAdmin(admin.ModelAdmin):
     list_display = ('user', 'f_route','atp_xc','line_dist','max_width','speed',
                     'student','fo','captain','instructor')
 
+class RunningTotalsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'plane', 'flights', 'total', 'pic', 'line_dist')
+    raw_id_fields = ('user', 'plane')
+
+class LogbookPageAdmin(admin.ModelAdmin):
+    list_display = ('user', 'page', 'per_page', 'date', 'flight_id')
+    raw_id_fields = ('user', )
+
+class SocialIndexAdmin(admin.ModelAdmin):
+    list_display = ('user', 'kind', 'value', 'first_date', 'last_date', 'flights')
+    list_filter = ('kind', )
+    search_fields = ('user__username', 'value')
+    raw_id_fields = ('user', )
+
 admin.site.register(Flight, FlightAdmin)
+admin.site.register(RunningTotals, RunningTotalsAdmin)
 admin.site.register(Columns, ColumnAdmin)
+admin.site.register(LogbookPage, LogbookPageAdmin)
+admin.site.register(SocialIndex, SocialIndexAdmin)
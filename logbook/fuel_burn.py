@@ -1,4 +1,5 @@
 import re
+import numpy
 from django.forms.util import ValidationError
         
 class FuelBurn(object):
@@ -6,6 +7,13 @@ class FuelBurn(object):
     A class that handles converting various fuel burn units
     """
     
+    # units that are a rate, and what to divide by to get gallons per hour
+    RATE_UNITS = {'pphll': 6, 'pphj': 6.8, 'pph': 6.8, 'lph': 3.78541178,
+                  'gph': 1, '': 1}
+    
+    # units that are an amount, and what to divide by to get gallons
+    AMOUNT_UNITS = {'pll': 6, 'p': 6.8, 'pj': 6.8, 'g': 1, 'l': 3.78541178}
+    
     def __init__(self, input, time, mileage=None):
         num, unit = FuelBurn.split(input)
         
@@ -112,51 +120,56 @@ class FuelBurn(object):
         
         num = float(num)
         
-        if unit == 'pphll':
-            gph = num / 6
+        if unit in self.RATE_UNITS:
+            gph = num / self.RATE_UNITS[unit]
             g = gph * time
             
-        elif unit == 'pphj' or unit == 'pph':
-            gph = num / 6.8
-            g = gph * time
-        
-        elif unit == 'pll':
-            g = num / 6
-            if time > 0:
-                gph = (g / time)
-            else:
-                gph = 0
-            
-        elif unit == 'p' or unit == 'pj':
-            g = num / 6.8
+        elif unit in self.AMOUNT_UNITS:
+            g = num / self.AMOUNT_UNITS[unit]
             if time > 0:
                 gph = (g / time)
             else:
                 gph = 0
         
-        elif unit == 'g':
-            g = num
-            if time > 0:
-                gph = (g / time)
-            else:
-                gph = 0
-        
-        elif unit == 'l':
-            g = num / 3.78541178 ## 1 gal = 3.78 liters
-            if time > 0:
-                gph = (g / time)
-            else:
-                gph = 0
-            
-        elif unit == 'lph':
-            gph = num / 3.78541178
-            g = gph * time
-            
-        elif unit == 'gph' or unit == '':
-            g = num * time
-            gph = num
-        
         else:
             assert False, "Invalid Fuel Burn Unit"
               
         return g, gph
+    
+    @classmethod
+    def convert_many(cls, input, times, mileages):
+        """
+        The same as making a FuelBurn for each time and mileage with the
+        same input, and calling as_unit('gallons'/'gph'/'mpg', for_db=True)
+        on each one. Returns three numpy arrays, where NaN is what would
+        have been None.
+        """
+        
+        num, unit = cls.split(input)
+        num = float(num)
+        
+        times = numpy.asarray(times, dtype=float)
+        mileages = numpy.nan_to_num(numpy.asarray(mileages, dtype=float))
+        
+        if unit in cls.RATE_UNITS:
+            gph = numpy.empty_like(times)
+            gph.fill(num / cls.RATE_UNITS[unit])
+            g = gph * times
+        
+        elif unit in cls.AMOUNT_UNITS:
+            g = numpy.empty_like(times)
+            g.fill(num / cls.AMOUNT_UNITS[unit])
+            gph = numpy.where(times > 0, g / numpy.where(times > 0, times, 1), 0)
+        
+        else:
+            assert False, "Invalid Fuel Burn Unit"
+        
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            mpg = numpy.where((mileages != 0) & (g != 0), mileages / g, 0)
+        
+        def for_db(values):
+            rounded = numpy.round(values, 2)
+            rounded[values == 0] = numpy.nan
+            return rounded
+        
+        return for_db(g), for_db(gph), for_db(mpg)
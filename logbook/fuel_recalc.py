@@ -0,0 +1,93 @@
+"""
+Recalculating the fuel columns of every flight in a plane after the
+plane's fuel burn has been changed. The values of all flights are
+converted at once with numpy and written back with one UPDATE per batch,
+without saving each flight (which would render it's route and apply it's
+running totals one at a time). The running totals are summed again and
+the badge progress, which has the gallons folded into it, is thrown out.
+"""
+
+import numpy
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from fuel_burn import FuelBurn
+
+def _db_value(value):
+    if numpy.isnan(value):
+        return None
+    return float(value)
+
+def update_batch(ids, gallons, gph, mpg):
+    """
+    Write the fuel values of the batch with a single UPDATE
+    """
+
+    rows = []
+    params = []
+    for row in zip(ids, gallons, gph, mpg):
+        rows.append("(%s, %s, %s, %s)")
+        params.append(int(row[0]))
+        params.extend(_db_value(value) for value in row[1:])
+
+    cursor = connection.cursor()
+    cursor.execute(
+        """UPDATE logbook_flight
+           SET gallons = v.gallons::double precision,
+               gph = v.gph::double precision,
+               mpg = v.mpg::double precision
+           FROM (VALUES %s) AS v(id, gallons, gph, mpg)
+           WHERE logbook_flight.id = v.id""" % ", ".join(rows), params)
+
+def recalculate_fuel(plane, batch=1000, progress=None):
+    """
+    Recalculate gallons, gph and mpg of the plane's flights that do not
+    have their own fuel burn. `progress` is called with the number of
+    flights done and the total after each batch. Returns the number of
+    flights updated.
+    """
+
+    from models import Flight, RunningTotals
+    from badges.models import BadgeProgress
+
+    if not plane.fuel_burn:
+        return 0
+
+    rows = Flight.objects.filter(plane=plane)\
+                         .filter(Q(fuel_burn__isnull=True) | Q(fuel_burn=''))\
+                         .order_by('id')\
+                         .values_list('id', 'total', 'route__total_line_all')
+
+    rows = list(rows)
+
+    if not rows:
+        return 0
+
+    ids = numpy.array([row[0] for row in rows])
+    times = numpy.array([row[1] or 0 for row in rows], dtype=float)
+    mileages = numpy.array([row[2] or 0 for row in rows], dtype=float)
+
+    gallons, gph, mpg = FuelBurn.convert_many(plane.fuel_burn, times, mileages)
+
+    for start in range(0, len(ids), batch):
+        end = start + batch
+
+        with transaction.commit_on_success():
+            update_batch(ids[start:end], gallons[start:end],
+                         gph[start:end], mpg[start:end])
+
+        if progress:
+            progress(min(end, len(ids)), len(ids))
+
+    with transaction.commit_on_success():
+        RunningTotals.resum_plane(plane, ['gallons'])
+        
+        # gets rebuilt with the new gallons the next time a flight is saved
+        users = Flight.objects.filter(plane=plane)\
+                              .values_list('user', flat=True)\
+                              .order_by()\
+                              .distinct()
+        BadgeProgress.reset(users)
+
+    return len(ids)
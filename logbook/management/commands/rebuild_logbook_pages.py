@@ -0,0 +1,33 @@
+import datetime
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.contrib.auth.models import User
+
+from logbook.models import LogbookPage
+
+class Command(NoArgsCommand):
+    help = 'Rebuild the logbook page index, run nightly for the ALL user'
+    
+    option_list = NoArgsCommand.option_list + (
+            make_option('--user',
+                        '-u',
+                        dest='username',
+                        help="Only rebuild the pages of this username",
+            ),
+    )
+    
+    def handle(self, *args, **options):
+        
+        if options['username']:
+            users = User.objects.filter(username=options['username'])
+        else:
+            users = User.objects.filter(logbookpage__isnull=False).distinct()
+        
+        start = datetime.datetime.now()
+        for user in users.order_by('id').iterator():
+            pages = LogbookPage.rebuild(user)
+            print "%s [%s pages]" % (user.username, pages)
+        
+        print "\n=====\ntotal processing time: %s" % \
+                                (datetime.datetime.now() - start)
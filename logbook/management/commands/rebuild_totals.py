@@ -0,0 +1,33 @@
+import datetime
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.contrib.auth.models import User
+
+from logbook.models import RunningTotals
+
+class Command(NoArgsCommand):
+    help = 'Rebuild the running totals table from the flight table'
+    
+    option_list = NoArgsCommand.option_list + (
+            make_option('--user',
+                        '-u',
+                        dest='username',
+                        help="Only rebuild the totals for this username",
+            ),
+    )
+    
+    def handle(self, *args, **options):
+        
+        users = User.objects.filter(flight__isnull=False).distinct()
+        
+        if options['username']:
+            users = users.filter(username=options['username'])
+        
+        start = datetime.datetime.now()
+        for user in users.order_by('id').iterator():
+            rows = RunningTotals.rebuild(user)
+            print "%s [%s planes]" % (user.username, rows)
+        
+        print "\n=====\ntotal processing time: %s" % \
+                                (datetime.datetime.now() - start)
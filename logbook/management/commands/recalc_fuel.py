@@ -0,0 +1,42 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from plane.models import Plane
+from logbook.fuel_recalc import recalculate_fuel
+
+class Command(NoArgsCommand):
+    help = "Recalculate the fuel columns of every flight in the passed planes"
+    
+    option_list = NoArgsCommand.option_list + (
+            make_option('--plane',
+                        '-p',
+                        dest='planes',
+                        type='int',
+                        action='append',
+                        default=[],
+                        help="Id of the plane, can be passed more than once",
+            ),
+            
+            make_option('--batch',
+                        '-b',
+                        dest='batch',
+                        type='int',
+                        default=1000,
+                        help="Number of flights updated per query",
+            ),
+    )
+    
+    def handle(self, *args, **options):
+        planes = Plane.objects.exclude(fuel_burn__isnull=True)\
+                              .exclude(fuel_burn='')
+        
+        if options['planes']:
+            planes = planes.filter(pk__in=options['planes'])
+        
+        for plane in planes:
+            
+            def progress(done, total):
+                print "%s: %s/%s flights" % (plane, done, total)
+            
+            recalculate_fuel(plane, batch=options['batch'], progress=progress)
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import User
 from django.utils.safestring import mark_safe
 from django.conf import settings
@@ -82,13 +82,101 @@ class Flight(EnhancedModel):
             self.user = share.get_display_user()
 
         no_badges = kwargs.pop('no_badges', False)
+        created = not self.pk
+        
+        if not hasattr(self, '_before'):
+            # remember what this flight contributed to the running totals,
+            # the logbook pages, the social index and the visited states
+            # before it gets overwritten. When render_route() saves this
+            # instance during pre_save, the inner save updates this value,
+            # so nothing is ever applied twice.
+            self._before = Flight.snapshot_from_db(self.pk)
 
         super(Flight,self).save(*args, **kwargs)
+        
+        from maps.models import VisitedPlace
+        
+        # same as above, an inner save may have already replaced it
+        before = self._before or {}
+        after = self.snapshot()
+        
+        RunningTotals.apply_delta(before.get('totals'), after['totals'])
+        
+        old_key, new_key = before.get('page_key'), after['page_key']
+        moved = not old_key == new_key
+        if moved:
+            LogbookPage.flight_moved(self.user_id, old_key, new_key)
+        
+        SocialIndex.flight_changed(self.user_id,
+                                   before.get('social_keys', set()),
+                                   after['social_keys'], moved)
+        
+        VisitedPlace.flight_changed(self.user_id,
+                                    before.get('visited', (None, set())),
+                                    after['visited'])
+        
+        self._before = after
+        
+        from main.jobs import enqueue
+        
+        if self.__dict__.pop('_route_deferred', False):
+            # a placeholder route was attached in the pre_save signal
+            enqueue('render_route', self.user, flight_id=self.id)
 
         if (not no_badges) and settings.BADGES_ENABLE:
-            from badges.models import award_badges
-            print "doing badge calc"
-            award_badges(self)
+            enqueue('award_badges', self.user, flight_id=self.id,
+                    rescan=not created)
+    
+    def route_places(self):
+        """
+        The (identifier, region code, country code) of each place on the
+        flight's route
+        """
+        
+        from route.models import RouteBase
+        
+        return list(RouteBase.objects.filter(route__id=self.route_id,
+                                             location__isnull=False)
+                                     .values_list('location__identifier',
+                                                  'location__region__code',
+                                                  'location__country'))
+    
+    def snapshot(self):
+        """
+        What the flight adds to the running totals, the logbook pages, the
+        social index and the visited states and countries, so a save can
+        tell what changed.
+        """
+        
+        from maps.models import VisitedPlace
+        
+        places = self.route_places()
+        
+        return {
+            'totals': RunningTotals.contribution(self),
+            'page_key': (self.date, self.id),
+            'social_keys': SocialIndex.keys_for(self, places),
+            'visited': (self.route_id, VisitedPlace.keys_for_places(places)),
+        }
+    
+    @classmethod
+    def snapshot_from_db(cls, flight_id):
+        """
+        The snapshot of the flight as it is currently saved in the
+        database, made from a single fetch of it's row (with the plane and
+        route). None if it is not saved yet.
+        """
+        
+        if not flight_id:
+            return None
+        
+        try:
+            flight = cls.objects.select_related('plane', 'route')\
+                                .get(pk=flight_id)
+        except cls.DoesNotExist:
+            return None
+        
+        return flight.snapshot()
     
     @classmethod
     def render_airport(cls, airport=None, **filters):
@@ -522,6 +610,686 @@ class Flight(EnhancedModel):
 
 ######################################################################################################
 
+class RunningTotals(models.Model):
+    """
+    Per-user, per-plane running totals of every flight in the user's logbook.
+    Flight.save() and flight deletion apply the difference to this table so
+    the logbook totals never need to scan the whole flight table. Totals by
+    category/class come from grouping these rows by the plane's cat_class.
+    Anything that is calculated from the plane (multi, turbine, sim, etc.) is
+    done when the totals are read, since the plane can be edited at any time.
+    Anything calculated from the route is stored here.
+    """
+    
+    # fields that get summed straight from the flight
+    FLIGHT_FIELDS = ('total', 'pic', 'sic', 'solo', 'night', 'dual_r',
+                     'dual_g', 'xc', 'act_inst', 'sim_inst', 'night_l',
+                     'day_l', 'app', 'gallons')
+    
+    FIELDS = FLIGHT_FIELDS + ('line_dist', 'p2p', 'atp_xc', 'p61_xc', 'flights')
+    
+    user =      models.ForeignKey(User)
+    plane =     models.ForeignKey(Plane)
+    
+    total =     models.FloatField(default=0)
+    pic =       models.FloatField(default=0)
+    sic =       models.FloatField(default=0)
+    solo =      models.FloatField(default=0)
+    night =     models.FloatField(default=0)
+    dual_r =    models.FloatField(default=0)
+    dual_g =    models.FloatField(default=0)
+    xc =        models.FloatField(default=0)
+    act_inst =  models.FloatField(default=0)
+    sim_inst =  models.FloatField(default=0)
+    night_l =   models.IntegerField(default=0)
+    day_l =     models.IntegerField(default=0)
+    app =       models.IntegerField(default=0)
+    gallons =   models.FloatField(default=0)
+    
+    line_dist = models.FloatField(default=0)
+    p2p =       models.FloatField(default=0)
+    atp_xc =    models.FloatField(default=0)
+    p61_xc =    models.FloatField(default=0)
+    
+    flights =   models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('user', 'plane')
+        verbose_name_plural = 'Running Totals'
+    
+    def __unicode__(self):
+        return u"%s -- %s" % (self.user_id, self.plane_id)
+    
+    @classmethod
+    def contribution(cls, flight):
+        """
+        Returns a tuple of (user_id, plane_id, values) that represents what
+        the passed flight adds to the running totals.
+        """
+        
+        route = flight.route
+        
+        values = dict((field, getattr(flight, field) or 0)
+                        for field in cls.FLIGHT_FIELDS)
+        
+        values['line_dist'] = route.total_line_all or 0
+        values['p2p'] = flight.total if route.p2p else 0
+        values['atp_xc'] = flight.total if (route.max_width_all or 0) > 49 else 0
+        values['p61_xc'] = flight.total if (route.max_width_land or 0) > 49 else 0
+        values['flights'] = 1
+        
+        return (flight.user_id, flight.plane_id, values)
+    
+    @classmethod
+    def apply_delta(cls, old=None, new=None):
+        """
+        Remove the old contribution and add the new contribution to the
+        running totals table. Rows that are missing only get created when
+        something is being added to them, a rebuild will sort out the rest.
+        When two saves race to create the same row, the loser's create is
+        rolled back to a savepoint and it adds onto the winner's row instead.
+        """
+        
+        if old == new:
+            return
+        
+        deltas = {}
+        for contribution, sign in ((old, -1), (new, 1)):
+            if not contribution:
+                continue
+            
+            user_id, plane_id, values = contribution
+            delta = deltas.setdefault((user_id, plane_id), dict.fromkeys(cls.FIELDS, 0))
+            for field, value in values.items():
+                delta[field] += sign * value
+        
+        for (user_id, plane_id), delta in deltas.items():
+            if not any(delta.values()):
+                continue
+            
+            updates = dict((field, models.F(field) + value)
+                                for field, value in delta.items())
+            
+            rows = cls.objects.filter(user__id=user_id, plane__id=plane_id)
+            
+            if rows.update(**updates) or not (new and new[:2] == (user_id, plane_id)):
+                continue
+            
+            sid = transaction.savepoint()
+            try:
+                cls.objects.create(user_id=user_id, plane_id=plane_id, **delta)
+            except IntegrityError:
+                transaction.savepoint_rollback(sid)
+                rows.update(**updates)
+            else:
+                transaction.savepoint_commit(sid)
+    
+    @classmethod
+    def resum_plane(cls, plane, fields):
+        """
+        Total the passed flight fields again for every user of the plane,
+        for when the flights were changed without being saved one by one.
+        """
+        
+        from django.db import connection
+        
+        sets = ", ".join(
+            """%(f)s = COALESCE((SELECT SUM(logbook_flight.%(f)s)
+                        FROM logbook_flight
+                        WHERE logbook_flight.user_id = logbook_runningtotals.user_id
+                          AND logbook_flight.plane_id = logbook_runningtotals.plane_id), 0)"""
+                % {'f': field} for field in fields if field in cls.FLIGHT_FIELDS)
+        
+        cursor = connection.cursor()
+        cursor.execute("UPDATE logbook_runningtotals SET %s WHERE plane_id = %%s"
+                            % sets, [plane.id])
+    
+    @classmethod
+    def rebuild(cls, user):
+        """
+        Throw away the running totals for the passed user and re-add them
+        from scratch out of the flight table.
+        """
+        
+        from django.db.models import Sum, Count, Q
+        
+        cls.objects.filter(user=user).delete()
+        
+        qs = Flight.objects.filter(user=user).order_by()
+        
+        sums = dict((field, Sum(field)) for field in cls.FLIGHT_FIELDS)
+        sums['line_dist'] = Sum('route__total_line_all')
+        sums['flights'] = Count('id')
+        
+        rows = qs.values('plane').annotate(**sums)
+        
+        extras = (
+            ('p2p', qs.filter(route__p2p=True)),
+            ('atp_xc', qs.filter(route__max_width_all__gt=49)),
+            ('p61_xc', qs.filter(route__max_width_land__gt=49)),
+        )
+        
+        extra_totals = {}
+        for field, extra_qs in extras:
+            for row in extra_qs.values('plane').annotate(val=Sum('total')):
+                extra_totals[(field, row['plane'])] = row['val']
+        
+        for row in rows:
+            plane_id = row.pop('plane')
+            values = dict((field, val or 0) for field, val in row.items())
+            
+            for field, extra_qs in extras:
+                values[field] = extra_totals.get((field, plane_id)) or 0
+            
+            cls.objects.create(user=user, plane_id=plane_id, **values)
+        
+        return len(rows)
+
+def remove_running_totals(sender, **kwargs):
+    """
+    When a flight is deleted, take what it contributed out of the running
+    totals.
+    """
+    
+    flight = kwargs['instance']
+    
+    try:
+        old = RunningTotals.contribution(flight)
+    except (Route.DoesNotExist, Plane.DoesNotExist):
+        return
+    
+    RunningTotals.apply_delta(old=old)
+
+models.signals.post_delete.connect(remove_running_totals, sender=Flight)
+
+######################################################################################################
+
+class IndexedPage(object):
+    """
+    The parts of django's Page that the logbook templates use, for a page
+    that was found through LogbookPage.
+    """
+    
+    def __init__(self, object_list, number, num_pages):
+        self.object_list = object_list
+        self.number = number
+        self.num_pages = num_pages
+        self.paginator = self
+
+class LogbookPage(models.Model):
+    """
+    Where each page of a user's logbook starts: the (date, id) of the first
+    flight of the page. A page is every flight from it's own start up to
+    the start of the next page, so getting any page (including the last
+    one) is an index lookup instead of a COUNT and an OFFSET. The first
+    page has no lower bound and the last page has no upper bound, so no
+    flight is ever left out even if the pages got out of balance.
+    
+    Flight.save() and flight deletion rebalance the pages from the one
+    that changed. The pages of the ALL user are only made again by the
+    `rebuild_logbook_pages` command, which cron runs every night. Until
+    then the new flights of the day pile up on the ALL user's last page.
+    """
+    
+    user =      models.ForeignKey(User)
+    page =      models.PositiveIntegerField()
+    per_page =  models.PositiveIntegerField()
+    
+    date =      models.DateField()
+    
+    # not a foreign key, the flight may have been deleted since
+    flight_id = models.IntegerField()
+    
+    class Meta:
+        unique_together = ('user', 'page')
+        index_together = [('user', 'date', 'flight_id')]
+    
+    def __unicode__(self):
+        return u"%s -- page %s" % (self.user_id, self.page)
+    
+    @property
+    def key(self):
+        return (self.date, self.flight_id)
+    
+    @staticmethod
+    def user_id(user):
+        if user == 'ALL' or user is None:
+            return 1
+        return getattr(user, 'id', user)
+    
+    @classmethod
+    def flights(cls, user):
+        """
+        The flights of the logbook view, in page order
+        """
+        
+        return Flight.objects.user(cls.user_id(user), disable_future=True)\
+                             .order_by('date', 'id')
+    
+    @classmethod
+    def per_page_for(cls, user):
+        from profile.models import Profile
+        
+        try:
+            return Profile.objects.get(user__id=cls.user_id(user)).per_page
+        except Profile.DoesNotExist:
+            return 50
+    
+    @staticmethod
+    def from_key(key):
+        date, id = key
+        return models.Q(date__gt=date) | models.Q(date=date, id__gte=id)
+    
+    @staticmethod
+    def before_key(key):
+        date, id = key
+        return models.Q(date__lt=date) | models.Q(date=date, id__lt=id)
+    
+    @classmethod
+    def rebuild(cls, user, per_page=None, from_page=1):
+        """
+        Make the pages of the user's logbook again, starting at `from_page`
+        which keeps it's current start. Returns the number of pages.
+        """
+        
+        user_id = cls.user_id(user)
+        per_page = per_page or cls.per_page_for(user)
+        flights = cls.flights(user_id)
+        
+        if from_page > 1:
+            try:
+                start = cls.objects.get(user__id=user_id, page=from_page)
+            except cls.DoesNotExist:
+                from_page = 1
+            else:
+                flights = flights.filter(cls.from_key(start.key))
+        
+        cls.objects.filter(user__id=user_id, page__gte=from_page).delete()
+        
+        pages = []
+        keys = flights.values_list('date', 'id').iterator()
+        for i, (date, id) in enumerate(keys):
+            if i % per_page == 0:
+                pages.append(cls(user_id=user_id, per_page=per_page,
+                                 page=from_page + len(pages),
+                                 date=date, flight_id=id))
+        
+        cls.objects.bulk_create(pages)
+        return from_page + len(pages) - 1
+    
+    @classmethod
+    def page_at(cls, user_id, key):
+        """
+        The page the (date, id) key falls on, None if there are no pages
+        """
+        
+        date, id = key
+        
+        pages = cls.objects.filter(user__id=user_id)
+        
+        before = pages.filter(models.Q(date__lt=date) |
+                              models.Q(date=date, flight_id__lte=id))\
+                      .order_by('-date', '-flight_id')\
+                      .values_list('page', flat=True)[:1]
+        
+        if before:
+            return before[0]
+        
+        first = pages.order_by('page').values_list('page', flat=True)[:1]
+        return first[0] if first else None
+    
+    @classmethod
+    def num_pages(cls, user):
+        """
+        The number of pages of the user's logbook, which is also the number
+        of the last page.
+        """
+        
+        user_id = cls.user_id(user)
+        per_page = cls.per_page_for(user)
+        
+        last = cls.objects.filter(user__id=user_id)\
+                          .order_by('-page')\
+                          .values_list('page', 'per_page')[:1]
+        
+        if not last or not last[0][1] == per_page:
+            # never made, or the user changed how many flights go on a page
+            return max(cls.rebuild(user_id, per_page), 1)
+        
+        return last[0][0]
+    
+    @classmethod
+    def filter_page(cls, qs, user, page):
+        """
+        Filter the queryset down to the flights on the page. Pages past the
+        end become the last page. Returns the queryset, the number of the
+        page and the number of pages.
+        """
+        
+        user_id = cls.user_id(user)
+        num_pages = cls.num_pages(user_id)
+        page = min(max(int(page), 1), num_pages)
+        
+        rows = cls.objects.filter(user__id=user_id, page__in=[page, page + 1])\
+                          .values_list('page', 'date', 'flight_id')
+        bounds = dict((p, (date, id)) for p, date, id in rows)
+        
+        if page > 1 and page in bounds:
+            qs = qs.filter(cls.from_key(bounds[page]))
+        
+        if page + 1 in bounds:
+            qs = qs.filter(cls.before_key(bounds[page + 1]))
+        
+        return qs, page, num_pages
+    
+    @classmethod
+    def paginate(cls, qs, user, page):
+        """
+        The same as Flight.make_pagination, for the unfiltered logbook
+        """
+        
+        qs, page, num_pages = cls.filter_page(qs, user, page)
+        
+        b = range(1, page)[-5:]                        # before block
+        a = range(page, num_pages+1)[1:6]              # after block
+        
+        return b, a, IndexedPage(qs, page, num_pages)
+    
+    @classmethod
+    def flight_moved(cls, user_id, old_key=None, new_key=None):
+        """
+        Called after a flight was added, deleted or had it's date changed.
+        Rebalance the pages from the first one that changed.
+        """
+        
+        keys = [key for key in (old_key, new_key) if key]
+        
+        if user_id == 1 or not keys:
+            return
+        
+        pages = [cls.page_at(user_id, key) for key in keys]
+        pages = [page for page in pages if page]
+        
+        if pages:
+            cls.rebuild(user_id, from_page=min(pages))
+
+def remove_from_pages(sender, **kwargs):
+    """
+    When a flight is deleted, the pages after it move over by one.
+    """
+    
+    flight = kwargs['instance']
+    LogbookPage.flight_moved(flight.user_id, old_key=(flight.date, flight.id))
+
+models.signals.post_delete.connect(remove_from_pages, sender=Flight)
+
+######################################################################################################
+
+class SocialIndex(models.Model):
+    """
+    Who has flown where and in what, for the airport, route, tailnumber,
+    type and model profile pages. There is one row for each user and each
+    identifier, route, tailnumber, type or model the user has logged, with
+    the first and last date and the number of flights, so listing the users
+    of a profile is an index lookup instead of a DISTINCT over the flight
+    table joined to the routes and planes. Values are stored uppercased
+    since the profile pages match them case insensitively.
+    
+    Flight.save() and flight deletion refresh the rows of the values that
+    the flight had before and after. Routes that get re-rendered in place
+    (by re_render_routes and the rerender_routes command) and edited
+    planes refresh the user's rows of those kinds.
+    """
+    
+    KINDS = (
+        ('location', 'Location'),
+        ('route', 'Route'),
+        ('tailnumber', 'Tailnumber'),
+        ('type', 'Type'),
+        ('model', 'Model'),
+    )
+    
+    PLANE_KINDS = ('tailnumber', 'type', 'model')
+    ROUTE_KINDS = ('location', 'route')
+    
+    # longer values (only very long routes) are too big for the index
+    MAX_VALUE_LENGTH = 1000
+    
+    _plane_join = """INNER JOIN plane_plane
+                        ON plane_plane.id = logbook_flight.plane_id
+                       AND NOT plane_plane.hidden"""
+    
+    # the value of each kind, and how to get to it from the flight table
+    KIND_SQL = {
+        'location': ("UPPER(airport_location.identifier)",
+                     """INNER JOIN route_routebase
+                           ON route_routebase.route_id = logbook_flight.route_id
+                        INNER JOIN airport_location
+                           ON airport_location.id = route_routebase.location_id"""),
+        'route': ("UPPER(route_route.simple_rendered)",
+                  """INNER JOIN route_route
+                        ON route_route.id = logbook_flight.route_id"""),
+        'tailnumber': ("UPPER(plane_plane.tailnumber)", _plane_join),
+        'type': ("UPPER(plane_plane.type)", _plane_join),
+        'model': ("UPPER(plane_plane.model)", _plane_join),
+    }
+    
+    user =          models.ForeignKey(User)
+    kind =          models.CharField(max_length=10, choices=KINDS)
+    value =         models.TextField()
+    
+    first_date =    models.DateField()
+    last_date =     models.DateField()
+    flights =       models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('kind', 'value', 'user')
+        verbose_name_plural = 'Social Index'
+    
+    def __unicode__(self):
+        return u"%s -- %s %s" % (self.user_id, self.kind, self.value)
+    
+    @classmethod
+    def keys_for(cls, flight, places=None):
+        """
+        Returns the set of (kind, value) that the flight is listed under.
+        `places` are the flight's route_places(), if they were already
+        fetched.
+        """
+        
+        keys = cls.plane_keys(flight.plane)
+        
+        route = flight.route
+        if route.simple_rendered and \
+                len(route.simple_rendered) <= cls.MAX_VALUE_LENGTH:
+            keys.add(('route', route.simple_rendered.upper()))
+        
+        if places is None:
+            places = flight.route_places()
+        
+        for ident, region, country in places:
+            if ident:
+                keys.add(('location', ident.upper()))
+        
+        return keys
+    
+    @classmethod
+    def plane_keys(cls, plane):
+        """
+        Returns the set of (kind, value) that flights in the plane are
+        listed under
+        """
+        
+        keys = set()
+        
+        if not plane.hidden:
+            for kind in cls.PLANE_KINDS:
+                value = getattr(plane, kind)
+                if value and len(value) <= cls.MAX_VALUE_LENGTH:
+                    keys.add((kind, value.upper()))
+        
+        return keys
+    
+    @classmethod
+    def collect(cls, user_id, kind, values=None):
+        """
+        Returns a (value, first date, last date, flights) row for every
+        value of that kind in the user's logbook, or only for the passed
+        values.
+        """
+        
+        from django.db import connection
+        
+        expression, joins = cls.KIND_SQL[kind]
+        
+        where = ["logbook_flight.user_id = %s", "%s <> ''" % expression,
+                 "LENGTH(%s) <= %s" % (expression, cls.MAX_VALUE_LENGTH)]
+        params = [user_id]
+        
+        if values is not None:
+            where.append("%s IN (%s)" % (expression,
+                                         ", ".join(["%s"] * len(values))))
+            params.extend(values)
+        
+        cursor = connection.cursor()
+        cursor.execute(
+            """SELECT %s, MIN(logbook_flight.date), MAX(logbook_flight.date),
+                      COUNT(DISTINCT logbook_flight.id)
+               FROM logbook_flight
+               %s
+               WHERE %s
+               GROUP BY 1""" % (expression, joins, " AND ".join(where)),
+            params)
+        
+        return cursor.fetchall()
+    
+    @classmethod
+    def refresh(cls, user_id, keys):
+        """
+        Count the flights of each of the passed (kind, value) keys of the
+        user's logbook again.
+        """
+        
+        by_kind = {}
+        for kind, value in keys:
+            by_kind.setdefault(kind, set()).add(value)
+        
+        for kind, values in by_kind.items():
+            values = list(values)
+            rows = cls.collect(user_id, kind, values)
+            
+            cls.objects.filter(user__id=user_id, kind=kind, value__in=values)\
+                       .delete()
+            
+            cls.objects.bulk_create(
+                cls(user_id=user_id, kind=kind, value=value, first_date=first,
+                    last_date=last, flights=flights)
+                for value, first, last, flights in rows
+            )
+    
+    @classmethod
+    def rebuild(cls, user, kinds=None):
+        """
+        Throw away the user's rows of the passed kinds (all kinds by
+        default) and make them again from the flight table. Returns the
+        number of rows.
+        """
+        
+        user_id = getattr(user, 'id', user)
+        kinds = kinds or [kind for kind, title in cls.KINDS]
+        
+        cls.objects.filter(user__id=user_id, kind__in=kinds).delete()
+        
+        rows = []
+        for kind in kinds:
+            rows.extend(
+                cls(user_id=user_id, kind=kind, value=value, first_date=first,
+                    last_date=last, flights=flights)
+                for value, first, last, flights in cls.collect(user_id, kind)
+            )
+        
+        cls.objects.bulk_create(rows)
+        return len(rows)
+    
+    @classmethod
+    def flight_changed(cls, user_id, old_keys, new_keys, moved):
+        """
+        Called after a flight was saved or deleted. When the flight was
+        added, deleted or changed date, all of it's keys get refreshed,
+        otherwise only the keys it was added to or taken out of.
+        """
+        
+        if moved:
+            keys = old_keys | new_keys
+        else:
+            keys = old_keys ^ new_keys
+        
+        if keys:
+            cls.refresh(user_id, keys)
+    
+    @classmethod
+    def routes_changed(cls, route_ids):
+        """
+        Called after routes were re-rendered in place, which changes the
+        locations and the rendered route of every flight that uses them.
+        """
+        
+        users = Flight.objects.filter(route__in=route_ids)\
+                              .values_list('user', flat=True)\
+                              .order_by()\
+                              .distinct()
+        
+        for user_id in users:
+            cls.rebuild(user_id, cls.ROUTE_KINDS)
+    
+    @classmethod
+    def profiles(cls, kind, value):
+        """
+        The users who have flown in this location/route/tailnumber/etc,
+        with the first and last date and the number of flights. Only users
+        who have the social option set are listed.
+        """
+        
+        rows = list(cls.objects.filter(kind=kind, value=value.upper())\
+                               .filter(user__profile__social=True)\
+                               .order_by('user__username')\
+                               .values('user__username', 'user__id',
+                                       'user__profile__logbook_share',
+                                       'first_date', 'last_date', 'flights'))
+        
+        for row in rows:
+            row['logbook_share'] = row.pop('user__profile__logbook_share')
+        
+        return rows
+    
+    @classmethod
+    def users(cls, kind, value):
+        """
+        Same as profiles(), but returns a User queryset
+        """
+        
+        return User.objects.filter(profile__social=True)\
+                           .filter(socialindex__kind=kind,
+                                   socialindex__value=value.upper())
+
+def remove_from_social_index(sender, **kwargs):
+    """
+    When a flight is deleted, count the flights of each of it's keys again
+    """
+    
+    flight = kwargs['instance']
+    
+    try:
+        keys = SocialIndex.keys_for(flight)
+    except (Route.DoesNotExist, Plane.DoesNotExist):
+        return
+    
+    SocialIndex.flight_changed(flight.user_id, keys, set(), True)
+
+models.signals.post_delete.connect(remove_from_social_index, sender=Flight)
+
+######################################################################################################
+
 class Columns(models.Model):
     user =      models.ForeignKey(User, blank=False, primary_key=True)
     
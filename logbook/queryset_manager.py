@@ -5,7 +5,95 @@ from constants import AGG_FIELDS, EXTRA_AGG, DB_FIELDS
 from main.enhanced_model import EnhancedQuerySet
 from logbook.utils import proper_format
 
+def _case(condition, field):
+    return "CASE WHEN %s THEN %s ELSE 0 END" % (condition, field)
+
+def _tag(*tags):
+    return "(%s)" % " OR ".join("UPPER(plane_plane.tags) LIKE '%%%%%s%%%%'" % tag
+                                for tag in tags)
+
+NOT_SIM = "plane_plane.cat_class < 15"
+SIM = "plane_plane.cat_class >= 15"
+MULTI = "plane_plane.cat_class IN (2,4)"
+SINGLE = "plane_plane.cat_class IN (1,3)"
+SEA = "plane_plane.cat_class IN (3,4)"
+MES = "plane_plane.cat_class = 4"
+TURBINE = _tag('TURBINE')
+JET = _tag('JET')
+
+TOTAL = "logbook_flight.total"
+PIC = "logbook_flight.pic"
+
+# SQL expressions for each column that gets totaled by `agg_many`. Each one
+# must add up to the same value that `agg` comes up with for that column.
+AGG_SQL = dict((cn, "logbook_flight.%s" % cn) for cn in AGG_FIELDS)
+AGG_SQL.update({
+    'total':      _case(NOT_SIM, TOTAL),
+    'total_s':    _case(NOT_SIM, TOTAL),
+    'sim':        _case(SIM, TOTAL),
+    'day':        _case(NOT_SIM, "logbook_flight.total - logbook_flight.night"),
+    'inst':       _case(NOT_SIM, "logbook_flight.act_inst + logbook_flight.sim_inst"),
+    'line_dist':  "route_route.total_line_all",
+    'p2p':        _case("route_route.p2p", TOTAL),
+    'complex':    _case(_tag('COMPLEX'), TOTAL),
+    'hp':         _case(_tag('HP', 'HIGH PERFORMANCE'), TOTAL),
+    'tail':       _case(_tag('TAILWHEEL'), TOTAL),
+    'multi':      _case(MULTI, TOTAL),
+    'm_pic':      _case(MULTI, PIC),
+    'single':     _case(SINGLE, TOTAL),
+    'single_pic': _case(SINGLE, PIC),
+    'sea':        _case(SEA, TOTAL),
+    'sea_pic':    _case(SEA, PIC),
+    'mes':        _case(MES, TOTAL),
+    'mes_pic':    _case(MES, PIC),
+    'turbine':    _case(TURBINE, TOTAL),
+    't_pic':      _case(TURBINE, PIC),
+    'mt':         _case("%s AND %s" % (MULTI, TURBINE), TOTAL),
+    'mt_pic':     _case("%s AND %s" % (MULTI, TURBINE), PIC),
+    'jet':        _case(JET, TOTAL),
+    'jet_pic':    _case(JET, PIC),
+    'atp_xc':     _case("%s AND route_route.max_width_all > 49" % NOT_SIM, TOTAL),
+    'p61_xc':     _case("%s AND route_route.max_width_land > 49" % NOT_SIM, TOTAL),
+})
+
+# the same expressions, but read from the per-user running totals table
+# instead of the flight table. Route based columns are stored in the table.
+RT = "logbook_runningtotals.%s"
+RUNNING_TOTALS_SQL = dict((cn, sql.replace("logbook_flight.", RT % ""))
+                            for cn, sql in AGG_SQL.items())
+RUNNING_TOTALS_SQL.update({
+    'line_dist':  RT % 'line_dist',
+    'p2p':        RT % 'p2p',
+    'atp_xc':     _case(NOT_SIM, RT % 'atp_xc'),
+    'p61_xc':     _case(NOT_SIM, RT % 'p61_xc'),
+})
+
 class FlightQuerySet(EnhancedQuerySet):
+    
+    def user(self, u, disable_future=False):
+        """
+        Same as the regular user filter, except it remembers the user when
+        the queryset has not been filtered by anything else. Totals from
+        such a queryset are read from the running totals table. Since
+        _clone() does not copy this attribute, any further filtering makes
+        the totals come from the flight table again.
+        """
+        
+        query = self.query
+        unfiltered = (not query.where and not query.low_mark
+                        and query.high_mark is None)
+        
+        qs = super(FlightQuerySet, self).user(u, disable_future)
+        
+        if isinstance(u, (int, long)):
+            user_id = u
+        else:
+            user_id = getattr(u, "id", None)
+        
+        if unfiltered and user_id and not user_id == 1:
+            qs._totals_user_id = user_id
+            
+        return qs
         
     ### by aircraft tags
     
@@ -291,7 +379,10 @@ class FlightQuerySet(EnhancedQuerySet):
         
         ret = None
         
-        if cn in AGG_FIELDS:
+        if getattr(self, '_totals_user_id', None) and cn in RUNNING_TOTALS_SQL:
+            ret = self.agg_many([cn], float=True)[cn]
+        
+        elif cn in AGG_FIELDS:
             ret = self._db_agg(cn)
         
         elif cn in EXTRA_AGG:
@@ -324,6 +415,73 @@ class FlightQuerySet(EnhancedQuerySet):
         else:
             return ret
     
+    def agg_many(self, columns, format='decimal', float=False):
+        """
+        Aggregate this queryset for every column in the passed list with a
+        single SQL query. Each column becomes a conditional
+        SUM(CASE WHEN ... END) expression, so the results are the same as
+        calling agg() once per column. Returns a dict keyed by column name.
+        Values are strings, unless the float argument is True.
+        """
+        
+        from django.db.models.sql.datastructures import EmptyResultSet
+        
+        columns = [cn for cn in columns if cn in AGG_SQL]
+        totals = dict((cn, 0) for cn in columns)
+        
+        user_id = getattr(self, '_totals_user_id', None)
+        
+        if columns and user_id:
+            # totals for the entire logbook come from the running totals
+            row = self._sum_columns(RUNNING_TOTALS_SQL, columns,
+                """FROM logbook_runningtotals
+                   INNER JOIN plane_plane
+                      ON plane_plane.id = logbook_runningtotals.plane_id
+                   WHERE logbook_runningtotals.user_id = %s""", [user_id])
+            totals.update(row)
+        
+        elif columns:
+            try:
+                subquery, params = self.order_by()\
+                                       .values('pk')\
+                                       .query.get_compiler(self.db)\
+                                       .as_sql()
+            except EmptyResultSet:
+                subquery = None
+            
+            if subquery:
+                row = self._sum_columns(AGG_SQL, columns,
+                    """FROM logbook_flight
+                       INNER JOIN plane_plane
+                          ON plane_plane.id = logbook_flight.plane_id
+                       INNER JOIN route_route
+                          ON route_route.id = logbook_flight.route_id
+                       WHERE logbook_flight.id IN (%s)""" % subquery, params)
+                totals.update(row)
+        
+        if float:
+            return totals
+        
+        return dict((cn, proper_format(val, cn, format))
+                        for cn, val in totals.items())
+        
+    def _sum_columns(self, sql_map, columns, from_sql, params):
+        """
+        Run one SELECT SUM(...), SUM(...) query for all the passed columns.
+        `from_sql` is the rest of the statement starting with FROM.
+        Returns a dict of column name to total.
+        """
+        
+        from django.db import connections
+        
+        selects = ", ".join("SUM(%s)" % sql_map[cn] for cn in columns)
+        
+        cursor = connections[self.db].cursor()
+        cursor.execute("SELECT %s %s" % (selects, from_sql), params)
+        row = cursor.fetchone() or []
+        
+        return dict((cn, val or 0) for cn, val in zip(columns, row))
+    
     def filter_by_column(self, cn, *args, **kwargs):
         """filters the queryset to only include flights
            where the conditions exist"""
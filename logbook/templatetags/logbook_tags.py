@@ -123,11 +123,14 @@ class TotalCells(template.Node):
         
         num_format = profile.get_num_format()
         
+        agg_list = columns.agg_list()
+        totals = flights.agg_many(agg_list, num_format)
+        
         html = ""
-        for column in columns.agg_list():
+        for column in agg_list:
             if not column == 'date':
                 title = FIELD_TITLES[column]
-                data = flights.agg(column, num_format)
+                data = totals[column]
                 html += '<td title="%s" class="%s_agg" >%s</td>\n' %\
                             (title, column, data)
             
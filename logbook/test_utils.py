@@ -0,0 +1,19 @@
+from route.models import Route
+
+from logbook.models import Flight
+
+def make_flight(user, plane, **fields):
+    """
+    Saves and returns a flight in the plane, for the tests of every app
+    that need one in the logbook. `route` is a route string, the rest are
+    fields of the flight. Badges are not awarded.
+    """
+
+    fields.setdefault('date', '2009-01-05')
+    fields.setdefault('total', 1.0)
+
+    route = Route.from_string(fields.pop('route', 'mer-lga'))
+
+    flight = Flight(user=user, plane=plane, route=route, **fields)
+    flight.save(no_badges=True)
+    return flight
@@ -2,10 +2,11 @@ from django.test import TestCase
 
 from django.conf import settings
 
-from models import Flight
+from models import Flight, RunningTotals
 from plane.models import Plane
 from route.models import Route
 from django.contrib.auth.models import User
+from test_utils import make_flight
 
 class ColumnsTest(TestCase):
     
@@ -205,21 +206,267 @@ class FuelBurnTest(TestCase):
         
         self.failUnlessEqual(self.f.gallons, 0)
         self.failUnlessEqual(self.f.gph, 56)
+    
+    def test_plane_recalculation(self):
+        """
+        Tests that recalculating all of a plane's flights at once comes up
+        with the same values as saving each flight
+        """
+        
+        from fuel_recalc import recalculate_fuel
+        
+        for fuel_burn in ('60 gph', '874.5 g', '20 pphj'):
+            self.p.fuel_burn = fuel_burn
+            recalculate_fuel(self.p)
+            
+            flight = Flight.objects.get(pk=self.f.pk)
+            flight.plane = self.p
+            flight.calc_fuel()
+            
+            saved = Flight.objects.get(pk=self.f.pk)
+            
+            for column in ('gallons', 'gph', 'mpg'):
+                expected = getattr(flight, column)
+                self.failUnlessEqual(getattr(saved, column),
+                                     expected and float(expected))
 
+class AggManyTest(TestCase):
+    
+    def setUp(self):
+        self.u = User(username='alice')
+        self.u.save()
+        
+        self.multi = Plane(tailnumber="N1111", cat_class=2, tags="TURBINE")
+        self.multi.save()
+        
+        self.sim = Plane(tailnumber="SIM", cat_class=16)
+        self.sim.save()
+        
+        for plane, total in ((self.multi, 2.0), (self.multi, 1.5), (self.sim, 3.0)):
+            make_flight(self.u, plane, total=total, pic=total, night=0.5,
+                        day_l=1)
+    
+    def test_matches_agg(self):
+        """
+        Tests that the single query totals are the same as the totals
+        calculated one column at a time
+        """
+        
+        columns = ['total', 'total_s', 'sim', 'pic', 'day', 'night', 'day_l',
+                   'multi', 'm_pic', 'mt_pic', 'single', 'inst', 'line_dist']
+        
+        qs = Flight.objects.user(self.u)
+        totals = qs.agg_many(columns)
+        
+        for column in columns:
+            self.failUnlessEqual(totals[column], qs.agg(column))
 
+class RunningTotalsTest(TestCase):
+    
+    def setUp(self):
+        self.u = User(username='carol')
+        self.u.save()
+        
+        self.p = Plane(tailnumber="N2222", cat_class=1)
+        self.p.save()
+        
+        self.f = make_flight(self.u, self.p, total=2.0, pic=2.0)
+        
+    def totals(self):
+        return Flight.objects.user(self.u).agg_many(['total', 'pic', 'line_dist'],
+                                                   float=True)
+    
+    def test_edit_and_delete(self):
+        """
+        Tests that the running totals follow the flight table when a flight
+        is added, edited and deleted
+        """
+        
+        self.failUnlessEqual(self.totals()['total'], 2.0)
+        
+        self.f.total = 5.0
+        self.f.save(no_badges=True)
+        
+        self.failUnlessEqual(self.totals()['total'], 5.0)
+        self.failUnlessEqual(self.totals()['pic'], 2.0)
+        
+        self.f.delete()
+        
+        self.failUnlessEqual(self.totals()['total'], 0)
+    
+    def test_rebuild(self):
+        """
+        Tests that a rebuild comes up with the same numbers as the flight
+        table
+        """
+        
+        RunningTotals.objects.all().delete()
+        RunningTotals.rebuild(self.u)
+        
+        qs = Flight.objects.user(self.u).filter(pk__gt=0)   # skip the table
+        self.failUnlessEqual(self.totals(),
+                             qs.agg_many(['total', 'pic', 'line_dist'], float=True))
 
+class FlightPagesTest(TestCase):
+    
+    def setUp(self):
+        from profile.models import Profile
+        
+        self.u = User(username='dave')
+        self.u.save()
+        
+        Profile.objects.create(user=self.u, per_page=2)
+        
+        p = Plane(tailnumber="N3333", cat_class=1)
+        p.save()
+        
+        for day in range(1, 8):
+            make_flight(self.u, p, date='2009-01-0%s' % day)
+    
+    def test_flight_pages(self):
+        """
+        Tests that only the pages holding the edited dates expire, and that
+        adding or removing a flight expires every page after it
+        """
+        
+        import datetime
+        from utils import flight_pages
+        
+        d = lambda day: datetime.date(2009, 1, day)
+        
+        self.failUnlessEqual(flight_pages(self.u, [d(3)]), [2])
+        self.failUnlessEqual(flight_pages(self.u, [d(2), d(5)]), [1, 2, 3])
+        self.failUnlessEqual(flight_pages(self.u, [d(5)], shift=True), [3, 4, 5])
+    
+    def test_page_index(self):
+        """
+        Tests that the page index follows flights being added and deleted
+        """
+        
+        from models import LogbookPage
+        
+        def page_dates(page):
+            qs = LogbookPage.filter_page(LogbookPage.flights(self.u),
+                                         self.u, page)[0]
+            return [str(date) for date in qs.values_list('date', flat=True)]
+        
+        self.failUnlessEqual(LogbookPage.num_pages(self.u), 4)
+        self.failUnlessEqual(page_dates(2), ['2009-01-03', '2009-01-04'])
+        
+        Flight.objects.filter(user=self.u, date='2009-01-02').delete()
+        
+        self.failUnlessEqual(LogbookPage.num_pages(self.u), 3)
+        self.failUnlessEqual(page_dates(2), ['2009-01-04', '2009-01-05'])
+        
+        # past the end is the last page
+        self.failUnlessEqual(page_dates(10), ['2009-01-06', '2009-01-07'])
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+class SocialIndexTest(TestCase):
+    
+    def setUp(self):
+        from profile.models import Profile
+        
+        self.u = User(username='erin')
+        self.u.save()
+        
+        Profile.objects.create(user=self.u, social=True)
+        
+        self.p = Plane(tailnumber="N4444", type='C-172', cat_class=1)
+        self.p.save()
+        
+        self.f = make_flight(self.u, self.p)
+    
+    def test_flight_changes(self):
+        """
+        Tests that the social index follows flights being added, edited
+        and deleted
+        """
+        
+        from models import SocialIndex
+        
+        users = SocialIndex.profiles('tailnumber', 'n4444')
+        self.failUnlessEqual([u['user__username'] for u in users], ['erin'])
+        self.failUnlessEqual(users[0]['flights'], 1)
+        
+        make_flight(self.u, self.p, date='2009-01-09')
+        
+        row = SocialIndex.objects.get(user=self.u, kind='type', value='C-172')
+        self.failUnlessEqual(row.flights, 2)
+        self.failUnlessEqual(str(row.last_date), '2009-01-09')
+        
+        other = Plane(tailnumber="N5555", type='C-172', cat_class=1)
+        other.save()
+        
+        self.f.plane = other
+        self.f.save(no_badges=True)
+        
+        self.failUnlessEqual(SocialIndex.profiles('tailnumber', 'N5555')[0]['flights'], 1)
+        self.failUnlessEqual(SocialIndex.profiles('tailnumber', 'N4444')[0]['flights'], 1)
+        self.failUnlessEqual(SocialIndex.profiles('type', 'C-172')[0]['flights'], 2)
+        
+        Flight.objects.filter(user=self.u).delete()
+        
+        self.failUnlessEqual(SocialIndex.profiles('type', 'c-172'), [])
+        self.failUnlessEqual(SocialIndex.objects.filter(user=self.u).count(), 0)
+    
+    def test_rebuild(self):
+        """
+        Tests that a rebuild comes up with the same rows as the ones kept
+        up to date by saving flights
+        """
+        
+        from models import SocialIndex
+        
+        fields = ('kind', 'value', 'first_date', 'last_date', 'flights')
+        saved = sorted(SocialIndex.objects.filter(user=self.u).values_list(*fields))
+        
+        SocialIndex.objects.all().delete()
+        SocialIndex.rebuild(self.u)
+        
+        self.failUnlessEqual(
+            sorted(SocialIndex.objects.filter(user=self.u).values_list(*fields)),
+            saved)
+    
+    def test_plane_edit(self):
+        """
+        Tests that editing a plane moves it's flights to the new values
+        """
+        
+        from models import SocialIndex
+        
+        self.p.user = self.u
+        self.p.type = 'C-152'
+        self.p.save()
+        
+        self.failUnlessEqual(SocialIndex.profiles('type', 'C-172'), [])
+        self.failUnlessEqual(SocialIndex.profiles('type', 'c-152')[0]['flights'], 1)
+        self.failUnlessEqual(SocialIndex.profiles('tailnumber', 'N4444')[0]['flights'], 1)
+    
+    def test_rerender(self):
+        """
+        Tests that re-rendering routes after an unknown identifier was added
+        to the airport database moves the location and route rows along
+        """
+        
+        from django.contrib.gis.geos import Point
+        from airport.models import Location, LocationChange
+        from route.rerender import rerender
+        from models import SocialIndex
+        
+        def values(kind):
+            return sorted(SocialIndex.objects.filter(user=self.u, kind=kind)
+                                             .values_list('value', flat=True))
+        
+        self.failUnlessEqual(values('location'), [])
+        
+        klga = Location.objects.create(identifier='KLGA', loc_class=1,
+                                       location=Point(-73.87, 40.77))
+        LocationChange.objects.create(location=klga, identifier='KLGA')
+        
+        rerender('test', processes=1)
+        
+        route = Route.objects.get(pk=self.f.route_id)
+        
+        self.failUnlessEqual(values('location'), ['KLGA'])
+        self.failUnlessEqual(values('route'), [route.simple_rendered.upper()])
+        self.failUnlessEqual(SocialIndex.profiles('location', 'klga')[0]['flights'], 1)
@@ -1,19 +1,19 @@
-from django.db.models import Sum
-from constants import AGG_FIELDS, EXTRA_AGG
 from utils import to_minutes
 
 def column_total_by_list(queryset, columns, format='decimal'):
     """takes a list of columns, returns a list of totals for those columns
     """
     
+    totals = queryset.agg_many(columns, float=True)
+    
     ret = []
     for cn in columns:
        
-        total = queryset.agg(cn)
+        total = totals.get(cn, "??")
         
         if not total == "??":  
             if cn in ['night_l','day_l','app']:
-                ret.append(str(total))          # write as int
+                ret.append(str(int(total)))          # write as int
             else:
                 if format == "decimal":
                     ret.append( "%.1f" % total )  # write as decimal
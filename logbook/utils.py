@@ -81,62 +81,208 @@ def proper_plane_widget(profile):
     if profile.text_plane:
         return PlaneTextInput()
 
-def expire_logbook_cache_totals(user=None):
+LOGBOOK_VERSION_TIMEOUT = 60 * 60 * 24 * 365
+
+def _logbook_version_key(user):
+    return 'logbook.version.%s' % getattr(user, 'id', user)
 
+def logbook_version(user):
+    """
+    Returns a number that changes every time the user's logbook gets
+    edited. Anything that is made out of the logbook can put this in it's
+    cache key instead of having to be expired.
+    """
+    
     from django.core.cache import cache
-    from django.utils.hashcompat import md5_constructor
-    from django.utils.http import urlquote
+    import time
+    
+    key = _logbook_version_key(user)
+    version = cache.get(key)
+    
+    if version is None:
+        # if the counter got lost, start it somewhere that has never been
+        # used before, so nothing stale can get picked up
+        cache.add(key, int(time.time() * 1000), LOGBOOK_VERSION_TIMEOUT)
+        version = cache.get(key)
+        
+    return version
 
-    fragment_name = 'logbook_totals'
-    variables = [user,]
+def logbook_digest(user, version, *parts):
+    """
+    The key of something made out of the user's logbook at that version
+    """
     
-    args = md5_constructor(u':'.join([urlquote(var) for var in variables]))
-    cache_key = 'template.cache.%s.%s' % (fragment_name, args.hexdigest())
-    cache.delete(cache_key)
+    import hashlib
+    
+    parts = [getattr(user, 'id', user), version] + list(parts)
+    return hashlib.md5(":".join(str(p) for p in parts)).hexdigest()
+
+def cached_image(request, key_parts, content_type, render, get, put):
+    """
+    Returns the image of the display user's logbook made by `render`
+    (which returns an HttpResponse), or the one that `get` finds by it's
+    digest if the logbook hasn't changed since it was made. New images are
+    handed to `put` along with their digest. The digest is also the ETag,
+    so a browser that already has the image gets a 304 without the image
+    being looked up at all. Without a logbook version there is no way to
+    tell if an image is still good, so it is made every time.
+    """
+    
+    from django.http import HttpResponse, HttpResponseNotModified
+    
+    user = request.display_user
+    version = logbook_version(user)
     
+    if version is None:
+        return render()
+    
+    digest = logbook_digest(user, version, *key_parts)
+    etag = '"%s"' % digest
+    
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    
+    data = get(digest)
+    
+    if data is None:
+        response = render()
+        
+        if response.status_code != 200:
+            return response
+        
+        data = response.content
+        put(digest, data)
+    
+    response = HttpResponse(data, content_type=content_type)
+    response['ETag'] = etag
+    return response
 
+def bump_logbook_version(user):
+    """
+    Called through the edit_logbook signal
+    """
+    
+    from django.core.cache import cache
+    
+    try:
+        cache.incr(_logbook_version_key(user))
+    except ValueError:
+        # not in the cache, the next call to logbook_version starts a
+        # new counter
+        pass
 
-def expire_logbook_cache_page(user=None, page=None):
+def _cache_generation_key(user):
+    return 'logbook.cache_generation.%s' % getattr(user, 'id', user)
 
+def logbook_cache_generation(user):
+    """
+    Returns the number that goes into the cache key of every cached part
+    of the user's logbook page. Changing it expires all of them at once.
+    """
+    
     from django.core.cache import cache
+    import time
+    
+    key = _cache_generation_key(user)
+    generation = cache.get(key)
+    
+    if generation is None:
+        cache.add(key, int(time.time() * 1000), LOGBOOK_VERSION_TIMEOUT)
+        generation = cache.get(key)
+    
+    return generation
+
+def bump_logbook_cache_generation(user):
+    """
+    Expire every cached logbook page of the user
+    """
+    
+    from django.core.cache import cache
+    
+    try:
+        cache.incr(_cache_generation_key(user))
+    except ValueError:
+        # not in the cache, the next call to logbook_cache_generation
+        # starts a new one
+        pass
+
+def _fragment_key(fragment_name, variables):
+    """
+    The same key the {% cache %} template tag makes
+    """
+    
     from django.utils.hashcompat import md5_constructor
     from django.utils.http import urlquote
-
-    fragment_name = 'logbook'
-    variables = [page, user]
     
     args = md5_constructor(u':'.join([urlquote(var) for var in variables]))
-    cache_key = 'template.cache.%s.%s' % (fragment_name, args.hexdigest())
-    cache.delete(cache_key)
+    return 'template.cache.%s.%s' % (fragment_name, args.hexdigest())
+
+def expire_logbook_cache_totals(user=None):
+
+    from django.core.cache import cache
+
+    generation = logbook_cache_generation(user)
+    cache.delete(_fragment_key('logbook_totals', [user, generation]))
+
+def expire_logbook_cache_page(user=None, page=None):
+
+    expire_logbook_cache_pages(user, [page])
+
+def expire_logbook_cache_pages(user, pages):
+    """
+    Expire the passed pages of the user's logbook, and the totals
+    """
+    
+    from django.core.cache import cache
     
-    expire_logbook_cache_totals(user)
+    generation = logbook_cache_generation(user)
     
+    keys = [_fragment_key('logbook', [page, user, generation])
+                for page in pages]
+    keys.append(_fragment_key('logbook_totals', [user, generation]))
+    
+    cache.delete_many(keys)
 
-        
-def expire_all(user=None, profile=None):
+def flight_pages(user, dates, shift=False):
     """
-    Expire all logbook pages in the passed user's logbook section
-    This function is used after the user changes his preferences and it
-    effects all pages in his logbook
+    Returns the numbers of the logbook pages that show flights from the
+    earliest to the latest of the passed dates. When a flight was added or
+    removed every flight after it moves over, so with `shift` every page
+    from the earliest date to the end of the logbook is returned.
     """
     
-    from logbook.models import Flight
-    import math
+    from logbook.models import LogbookPage
     
-    if user:
-        try:
-            per_page = user.get_profile().per_page
-        except:
-            return
+    last_page = LogbookPage.num_pages(user)
     
-    elif profile:
-        per_page = profile.per_page
-        user = profile.user
+    # the page of the first flight on or after the earliest date
+    first_key = LogbookPage.flights(user).filter(date__gte=min(dates))\
+                                         .values_list('date', 'id')[:1]
     
-    total_flights = Flight.objects.user(user).count()
-    last_page = int(math.ceil(total_flights / float(per_page)))
-
-    for page in range(1,last_page+1):
-        expire_logbook_cache_page(user, page)
-
+    if first_key:
+        first = LogbookPage.page_at(user.id, first_key[0]) or 1
+    else:
+        first = last_page
+    
+    if shift:
+        # one past the end, for when a flight was removed from the last page
+        last = last_page + 1
+    else:
+        last = LogbookPage.page_at(user.id, (max(dates), 2 ** 31 - 1)) or 1
+    
+    return range(first, max(first, last) + 1)
 
+def expire_flight_pages(user, dates, shift=False):
+    """
+    Expire only the logbook pages where flights on the passed dates are
+    (or were) shown.
+    """
+    
+    dates = [date for date in dates if date]
+    
+    if not dates:
+        return
+    
+    expire_logbook_cache_pages(user, flight_pages(user, dates, shift))
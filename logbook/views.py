@@ -12,10 +12,10 @@ from route.models import Route
 from profile.models import Profile, AutoButton
 from plane.models import Plane
 
-from models import Flight, Columns
+from models import Flight, Columns, LogbookPage
 from constants import *
 import forms
-from utils import proper_plane_widget, logbook_url
+from utils import proper_plane_widget, logbook_url, logbook_cache_generation
 
 ###############################################################################
 
@@ -25,23 +25,13 @@ def root_logbook(request):
     """
     
     from django.shortcuts import redirect
-    import math
-    
-    try:
-        per_page = request.display_user.get_profile().per_page
-    except:
-        per_page = 50
     
     if hasattr(request, 'display_user'):
         user = request.display_user
     else:
         user = request.user
 
-    flights = Flight.objects.user(user).count()
-    last_page = int(math.ceil(flights / float(per_page)))
-    
-    if last_page == 0:
-        last_page = 1
+    last_page = LogbookPage.num_pages(user)
     
     url = reverse("logbook-page", kwargs={"page": last_page,
                                           "username": user})
@@ -58,10 +48,14 @@ def delete_flight(request, page):
         
     if request.display_user.username != 'ALL':
         flight_id = request.POST['id']
+        dates = Flight.objects.filter(pk=flight_id, user=request.display_user)\
+                              .values_list('date', flat=True)
+        dates = list(dates)
+        
         Flight(pk=flight_id, user=request.display_user).delete()
         
         from backup.models import edit_logbook
-        edit_logbook.send(sender=request.display_user, page=page)
+        edit_logbook.send(sender=request.display_user, dates=dates, shift=True)
     
     return HttpResponseRedirect(url)
 
@@ -79,6 +73,10 @@ def edit_flight(request, page):
     
     flight_id = request.POST['id']
     flight = Flight(pk=flight_id, user=request.display_user)
+    flight.defer_route = True
+    
+    old_dates = list(Flight.objects.filter(pk=flight_id)
+                                   .values_list('date', flat=True))
 
     form = forms.PopupFlightForm(request.POST,
                            plane_widget=plane_widget,
@@ -87,10 +85,12 @@ def edit_flight(request, page):
                            prefix="new")
 
     if form.is_valid() and request.display_user.username != 'ALL':
-        form.save()
+        flight = form.save()
         
+        # the pages between the old and new date expire
         from backup.models import edit_logbook
-        edit_logbook.send(sender=request.display_user, page=page)
+        edit_logbook.send(sender=request.display_user,
+                          dates=old_dates + [flight.date])
         
         return HttpResponseRedirect(url)
         
@@ -107,6 +107,7 @@ def new_flight(request, page):
     plane_widget = proper_plane_widget(profile)
 
     flight = Flight(user=request.display_user)
+    flight.defer_route = True
     
     form = forms.PopupFlightForm(request.POST,
                            plane_widget=plane_widget,
@@ -115,10 +116,11 @@ def new_flight(request, page):
                            prefix="new")
     
     if form.is_valid() and request.display_user.username != 'ALL':
-        form.save()
+        flight = form.save()
         
         from backup.models import edit_logbook
-        edit_logbook.send(sender=request.display_user)
+        edit_logbook.send(sender=request.display_user, dates=[flight.date],
+                          shift=True)
         
         url = logbook_url(request.display_user, page)
         return HttpResponseRedirect(url)
@@ -184,8 +186,18 @@ def logbook(request, page=0, form=None, fail=None):
     
     ############### pagination stuff below ############################
     
-    before_block, after_block, page_of_flights = \
+    if request.GET:
+        before_block, after_block, page_of_flights = \
                    Flight.make_pagination(filtered_flights, profile, int(page))
+    else:
+        # the unfiltered logbook uses the page index instead of OFFSET
+        before_block, after_block, page_of_flights = \
+                   LogbookPage.paginate(filtered_flights, request.display_user,
+                                        page)
+    
+    # the page that is actually shown, for the cache key
+    page = page_of_flights.number
+    cache_generation = logbook_cache_generation(request.display_user)
     
     #only make the page table if there are more than one pages overall
     do_pagination = page_of_flights.paginator.num_pages > 1
@@ -268,10 +280,10 @@ def mass_edit(request, page=0):
     flights = Flight.objects.filter(user=request.display_user)
     profile,c = Profile.objects.get_or_create(user=request.display_user)
     
-    start = (int(page)-1) * int(profile.per_page)
-    duration = int(profile.per_page)
-    qs = Flight.objects.filter(user=request.display_user)\
-                       .order_by('date')[start:start+duration]
+    # the same flights as the logbook page
+    qs, page, num_pages = LogbookPage.filter_page(
+                            flights.order_by('date', 'id'),
+                            request.display_user, page)
     
     NewFlightFormset = modelformset_factory(
         Flight,
@@ -293,9 +305,10 @@ def mass_edit(request, page=0):
             formset.save()
             
             ## send signal to mark this user as having
-            ## edited their logbook for today
+            ## edited their logbook for today. Dates may have been changed
+            ## and flights deleted, so every page expires.
             from backup.models import edit_logbook
-            edit_logbook.send(sender=request.display_user, page=page)
+            edit_logbook.send(sender=request.display_user)
             
             return HttpResponseRedirect(
                 reverse('logbook-page',
@@ -3,3 +3,12 @@ from models import *
 
 admin.site.register(NewsItem)
 admin.site.register(HelpItem)
+
+
+class QueuedJobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'user', 'flight_id', 'created', 'claimed',
+                    'failed')
+    list_filter = ('kind', 'failed')
+    raw_id_fields = ('user', )
+
+admin.site.register(QueuedJob, QueuedJobAdmin)
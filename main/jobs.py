@@ -0,0 +1,304 @@
+"""
+Deferred work that used to happen while the user waited for the response.
+Views and models call enqueue(), the run_jobs management command then
+drains the QueuedJob table with a pool of threads or processes. All jobs
+for a single user go to the same worker, so duplicate jobs can be
+coalesced: a route only gets rendered once, a plane's fuel only gets
+recalculated once, any number of badge jobs become one badge calculation,
+and the backup signal is sent once and the default graphs and the PDF are
+rendered once.
+
+Jobs are claimed before they are ran and only deleted afterwards, so the
+jobs of a worker that dies are picked up again once their claim goes
+stale. A worker holds a lock on the user while it runs their jobs, so
+when two drainers claim jobs of the same user, the user's jobs still
+never run at the same time.
+
+When settings.DEFERRED_JOBS is not True, jobs are ran right away.
+"""
+
+import time
+import datetime
+import traceback
+
+from django.conf import settings
+from django.utils import simplejson
+
+def jobs_enabled():
+    return getattr(settings, 'DEFERRED_JOBS', False)
+
+def enqueue(kind, user, flight_id=None, **args):
+    """
+    Add a job to the queue, or run it now if deferred jobs are turned off.
+    """
+    
+    job = {'kind': kind, 'flight_id': flight_id, 'args': args}
+    
+    if not jobs_enabled():
+        run_user_jobs(user.id, [job])
+        return
+    
+    from main.models import QueuedJob
+    QueuedJob.objects.create(kind=kind,
+                             user=user,
+                             flight_id=flight_id,
+                             args=simplejson.dumps(args))
+
+###############################################################################
+
+def _render_route(flight_id):
+    from logbook.models import Flight
+    from route.models import Route
+    
+    flight = Flight.goon(pk=flight_id)
+    if not flight:
+        return
+    
+    old_route_id = flight.route_id
+    flight.render_route()
+    
+    # the cached logbook page still shows the placeholder route
+    from logbook.utils import expire_flight_pages
+    expire_flight_pages(flight.user, [flight.date])
+    
+    # the placeholder route is not attached to anything anymore
+    Route.objects.filter(pk=old_route_id, flight__isnull=True).delete()
+
+def _award_badges(flight_ids, rescan):
+    from logbook.models import Flight
+    from badges.models import award_badges
+    
+    flights = Flight.objects.filter(pk__in=flight_ids).order_by('-id')
+    
+    if not flights:
+        return
+    
+    if len(flights) > 1:
+        # more than one flight changed, the progress has to be rebuilt
+        # from the whole logbook anyway
+        rescan = True
+    
+    award_badges(flights[0], rescan=rescan)
+
+def _backup(user_id):
+    from django.contrib.auth.models import User
+    from backup.models import add_to_email_queue
+    
+    add_to_email_queue(User.objects.get(pk=user_id))
+
+def _warm_graphs(user_id):
+    from django.contrib.auth.models import User
+    from graphs.cache import warm_graphs
+    
+    warm_graphs(User.objects.get(pk=user_id))
+
+def _print_pdf(user_id):
+    from django.contrib.auth.models import User
+    from pdf.pdf import PDF
+    
+    PDF(User.objects.get(pk=user_id)).save()
+
+def _recalc_fuel(user_id, plane_ids):
+    from django.contrib.auth.models import User
+    from plane.models import Plane
+    from logbook.fuel_recalc import recalculate_fuel
+    from logbook.utils import bump_logbook_version, bump_logbook_cache_generation
+    
+    for plane in Plane.objects.filter(pk__in=plane_ids):
+        recalculate_fuel(plane)
+    
+    # the flights were updated without the edit_logbook signal
+    user = User(pk=user_id)
+    bump_logbook_version(user)
+    bump_logbook_cache_generation(user)
+
+def run_user_jobs(user_id, jobs):
+    """
+    Run all of the passed jobs for a single user. `jobs` is a list of dicts
+    with the keys kind, flight_id and args. Routes are rendered first so the
+    badges see the finished routes. Returns a list of (job, error) tuples
+    for every job that failed.
+    """
+    
+    by_kind = {}
+    for job in jobs:
+        by_kind.setdefault(job['kind'], []).append(job)
+    
+    failures = []
+    
+    route_jobs = dict((job['flight_id'], job)
+                            for job in by_kind.get('render_route', []))
+    for flight_id, job in route_jobs.items():
+        try:
+            _render_route(flight_id)
+        except Exception:
+            failures.append((job, traceback.format_exc()))
+    
+    if route_jobs:
+        # the rendered routes change the distance graphs
+        from django.contrib.auth.models import User
+        from logbook.utils import bump_logbook_version
+        bump_logbook_version(User(pk=user_id))
+    
+    fuel_jobs = by_kind.get('recalc_fuel', [])
+    if fuel_jobs:
+        plane_ids = set(job['args']['plane_id'] for job in fuel_jobs)
+        try:
+            _recalc_fuel(user_id, plane_ids)
+        except Exception:
+            failures.extend((job, traceback.format_exc()) for job in fuel_jobs)
+    
+    badge_jobs = by_kind.get('award_badges', [])
+    if badge_jobs and getattr(settings, 'BADGES_ENABLE', False):
+        flight_ids = set(job['flight_id'] for job in badge_jobs)
+        rescan = any(job['args'].get('rescan') for job in badge_jobs)
+        try:
+            _award_badges(flight_ids, rescan)
+        except Exception:
+            failures.extend((job, traceback.format_exc()) for job in badge_jobs)
+    
+    backup_jobs = by_kind.get('backup', [])
+    if backup_jobs:
+        try:
+            _backup(user_id)
+        except Exception:
+            failures.append((backup_jobs[0], traceback.format_exc()))
+    
+    graph_jobs = by_kind.get('warm_graphs', [])
+    if graph_jobs:
+        try:
+            _warm_graphs(user_id)
+        except Exception:
+            failures.append((graph_jobs[0], traceback.format_exc()))
+    
+    pdf_jobs = by_kind.get('print_pdf', [])
+    if pdf_jobs:
+        try:
+            _print_pdf(user_id)
+        except Exception:
+            failures.append((pdf_jobs[0], traceback.format_exc()))
+    
+    return failures
+
+# a claimed job that is still in the queue after this long belonged to a
+# worker that died, and is ran again
+CLAIM_TIMEOUT = datetime.timedelta(hours=1)
+
+# the first key of the postgres advisory locks held on users by workers
+USER_LOCK = 8101
+
+def claim(limit):
+    """
+    Take up to `limit` jobs that no one is running. The rows are locked
+    while they are claimed, so two drainers never get the same job.
+    """
+    
+    from django.db import transaction
+    from django.db.models import Q
+    from django.utils import timezone
+    from main.models import QueuedJob
+    
+    now = timezone.now()
+    
+    with transaction.commit_on_success():
+        jobs = list(QueuedJob.objects.select_for_update()
+                             .filter(failed=False)
+                             .filter(Q(claimed__isnull=True) |
+                                     Q(claimed__lt=now - CLAIM_TIMEOUT))
+                             [:limit])
+        
+        QueuedJob.objects.filter(pk__in=[job.pk for job in jobs])\
+                         .update(claimed=now)
+    
+    return jobs
+
+def finish(job_ids, failures):
+    """
+    Take the jobs that ran off the queue. The failed ones are kept, marked
+    as failed along with their error.
+    """
+    
+    from main.models import QueuedJob
+    
+    failed = {}
+    for job, error in failures:
+        failed[job['id']] = error
+    
+    QueuedJob.objects.filter(pk__in=set(job_ids) - set(failed)).delete()
+    
+    for job_id, error in failed.items():
+        QueuedJob.objects.filter(pk=job_id)\
+                         .update(failed=True, error=error, claimed=None)
+
+def _lock_user(user_id, lock=True):
+    """
+    Take (or let go of) the lock on the user. Returns False when another
+    worker has it.
+    """
+    
+    from django.db import connection
+    
+    function = "pg_try_advisory_lock" if lock else "pg_advisory_unlock"
+    
+    cursor = connection.cursor()
+    cursor.execute("SELECT %s(%%s, %%s)" % function, [USER_LOCK, user_id])
+    return cursor.fetchone()[0]
+
+def _run_in_worker(item):
+    """
+    Entry point for each thread/process in the pool.
+    """
+    
+    from main.models import QueuedJob
+    
+    user_id, jobs = item
+    start = time.time()
+    ids = [job['id'] for job in jobs]
+    
+    if not _lock_user(user_id):
+        # another drainer is running this user's jobs, these ones get
+        # ran by the next drain
+        QueuedJob.objects.filter(pk__in=ids).update(claimed=None)
+        return user_id, 0, [], time.time() - start
+    
+    try:
+        failures = run_user_jobs(user_id, jobs)
+        finish(ids, failures)
+    finally:
+        _lock_user(user_id, lock=False)
+    
+    return user_id, len(jobs), failures, time.time() - start
+
+def drain(workers=4, processes=False, limit=1000):
+    """
+    Claim up to `limit` jobs, group them by user and run each user's jobs
+    in a pool of threads (or processes). Jobs that fail are left in the
+    queue marked as failed. Returns a (user id, number of jobs, failures,
+    seconds) tuple for each user.
+    """
+    
+    from main.utils import run_pool
+    
+    jobs = claim(limit)
+    
+    if not jobs:
+        return []
+    
+    by_user = {}
+    for job in jobs:
+        args = simplejson.loads(job.args)
+        
+        if job.claimed and job.kind == 'award_badges':
+            # the claim went stale, the badges may have been folded in
+            # already before the worker died
+            args['rescan'] = True
+        
+        by_user.setdefault(job.user_id, []).append({
+            'id': job.pk,
+            'kind': job.kind,
+            'flight_id': job.flight_id,
+            'args': args,
+        })
+    
+    return run_pool(_run_in_worker, by_user.items(), workers,
+                    threads=not processes)
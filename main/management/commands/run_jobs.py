@@ -0,0 +1,75 @@
+import time
+import datetime
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from main.jobs import drain
+
+class Command(NoArgsCommand):
+    help = 'Run the deferred jobs (badges, route rendering, backup signal)'
+    
+    option_list = NoArgsCommand.option_list + (
+            make_option('--workers',
+                        '-w',
+                        dest='workers',
+                        type='int',
+                        default=4,
+                        help="Number of threads/processes in the pool",
+            ),
+            
+            make_option('--processes',
+                        '-p',
+                        dest='processes',
+                        action='store_true',
+                        help="Use a process pool instead of a thread pool",
+            ),
+            
+            make_option('--batch',
+                        '-b',
+                        dest='batch',
+                        type='int',
+                        default=1000,
+                        help="Max number of jobs taken off the queue at once",
+            ),
+            
+            make_option('--loop',
+                        '-l',
+                        dest='loop',
+                        action='store_true',
+                        help="Keep polling the queue instead of exiting when it's empty",
+            ),
+            
+            make_option('--sleep',
+                        dest='sleep',
+                        type='float',
+                        default=2.0,
+                        help="Seconds to wait between polls when looping",
+            ),
+    )
+    
+    def handle(self, *args, **options):
+        
+        while True:
+            start = datetime.datetime.now()
+            results = drain(workers=options['workers'],
+                            processes=options['processes'],
+                            limit=options['batch'])
+            
+            count = 0
+            for user_id, jobs, failures, seconds in results:
+                print "user %s: %s jobs in %.3f s" % (user_id, jobs, seconds)
+                for job, error in failures:
+                    print error
+                count += jobs
+            
+            if count:
+                print "%s -- %s jobs in %s" % (start, count,
+                                    datetime.datetime.now() - start)
+            
+            if not count:
+                if not options['loop']:
+                    # without --loop, exit once the queue is empty
+                    break
+                
+                time.sleep(options['sleep'])
@@ -26,3 +26,40 @@ class HelpItem(models.Model):
     
     def __unicode__(self):
         return self.title
+
+class QueuedJob(models.Model):
+    """
+    A piece of work that was taken out of the request/response cycle, like
+    awarding badges or rendering a route. The run_jobs management command
+    drains this table. See main/jobs.py
+    """
+    
+    KINDS = (
+        ('render_route', 'Render Route'),
+        ('award_badges', 'Award Badges'),
+        ('backup', 'Backup Signal'),
+        ('warm_graphs', 'Warm Graph Cache'),
+        ('print_pdf', 'Print PDF'),
+        ('recalc_fuel', 'Recalculate Fuel'),
+    )
+    
+    kind = models.CharField(max_length=32, choices=KINDS)
+    user = models.ForeignKey('auth.User')
+    
+    # not a foreign key because the flight may be deleted before
+    # the job gets ran
+    flight_id = models.IntegerField(null=True, blank=True)
+    args = models.TextField(default='{}')
+    
+    created = models.DateTimeField(auto_now_add=True)
+    failed = models.BooleanField(default=False)
+    
+    # when a worker took the job, the job is deleted after it has ran
+    claimed = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    
+    class Meta:
+        ordering = ["id"]
+    
+    def __unicode__(self):
+        return "%s - %s (%s)" % (self.kind, self.user_id, self.flight_id)
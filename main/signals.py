@@ -2,14 +2,18 @@ from django.db import models
 from django.conf import settings
 
 from logbook.fuel_burn import FuelBurn
-from logbook.utils import expire_all, expire_logbook_cache_page
+from logbook.utils import (expire_logbook_cache_page, expire_flight_pages,
+                           bump_logbook_cache_generation, bump_logbook_version)
     
 from profile.models import Profile
 from airport.models import Location
 from plane.models import Plane
 from backup.models import edit_logbook
-from logbook.models import Flight
-from route.models import Route
+from logbook.models import Flight, SocialIndex
+from maps.models import VisitedPlace
+from route.models import Route, RouteBase
+from route.resolver import invalidate_index
+from main.jobs import jobs_enabled
 
 def calculate_flight(sender, **kwargs):
     """
@@ -19,7 +23,13 @@ def calculate_flight(sender, **kwargs):
     flight = kwargs['instance']
     
     if not flight.route_is_rendered():
-        flight.render_route()
+        if getattr(flight, 'defer_route', False) and jobs_enabled():
+            # attach an empty route that shows the raw route string until
+            # the job queue gets to render the real one
+            flight.route = Route.objects.create(fallback_string=flight.route_string)
+            flight._route_deferred = True
+        else:
+            flight.render_route()
     
     route = flight.route
     
@@ -38,78 +48,244 @@ def calculate_flight(sender, **kwargs):
     
 ###############################################################################
     
+def remember_fuel_burn(sender, **kwargs):
+    """
+    Keep the fuel burn, the social index keys and the fields the badges
+    go by that the plane had before it was saved, so the flights only get
+    recalculated and reindexed when they change.
+    """
+    
+    plane = kwargs['instance']
+    plane._old_fuel_burn = None
+    plane._old_social_keys = set()
+    plane._old_badge_fields = None
+    
+    if plane.pk:
+        old = Plane.objects.filter(pk=plane.pk)\
+                           .values('fuel_burn', 'hidden', 'cat_class', 'tags',
+                                   *SocialIndex.PLANE_KINDS)
+        if old:
+            old = old[0]
+            plane._old_fuel_burn = old.pop('fuel_burn')
+            plane._old_badge_fields = (old.pop('cat_class'), old.pop('tags'),
+                                       old['type'])
+            plane._old_social_keys = SocialIndex.plane_keys(Plane(**old))
+
 def recalculate_fuel(sender, **kwargs):
     """
-    When a plane is saved, all flights in that plane need to be recalculated
-    to reflect the potentially updated fuelburn value
+    When a plane's fuel burn changes, all flights in that plane need to be
+    recalculated to reflect the updated fuelburn value. This is done by the
+    job queue in one go, instead of saving each flight.
+    """
+    
+    plane = kwargs['instance']
+    
+    if not plane.fuel_burn or plane.fuel_burn == getattr(plane, '_old_fuel_burn', None):
+        return
+    
+    if plane.user:
+        from main.jobs import enqueue
+        enqueue('recalc_fuel', plane.user, plane_id=plane.pk)
+    else:
+        from logbook.fuel_recalc import recalculate_fuel
+        recalculate_fuel(plane)
+
+def reindex_plane(sender, **kwargs):
+    """
+    The tailnumber, type, model or hidden flag of the plane may have
+    changed, so the owner's social index rows of the plane's old and new
+    values are counted again. A new plane has no flights yet.
+    """
+    
+    plane = kwargs['instance']
+    
+    if kwargs.get('created') or not plane.user_id or \
+            plane.user_id == settings.COMMON_USER_ID:
+        return
+    
+    old = getattr(plane, '_old_social_keys', set())
+    new = SocialIndex.plane_keys(plane)
+    
+    if not old == new:
+        SocialIndex.refresh(plane.user_id, old | new)
+
+def reset_plane_badges(sender, **kwargs):
+    """
+    The cat_class, tags and type of the plane are folded into the badge
+    progress of everyone who flew it, so it gets thrown out when they
+    change.
     """
     
     plane = kwargs['instance']
+    old = getattr(plane, '_old_badge_fields', None)
     
-    if not plane.fuel_burn:
+    if kwargs.get('created') or old is None or \
+            old == (plane.cat_class, plane.tags, plane.type):
         return
     
-    for f in Flight.objects.filter(plane=plane).iterator():
-        f.calc_fuel()
-        f.save(no_badges=True)
+    from badges.models import BadgeProgress
+    
+    users = Flight.objects.filter(plane=plane)\
+                          .values_list('user', flat=True)\
+                          .order_by()\
+                          .distinct()
+    BadgeProgress.reset(users)
 
 ###############################################################################
 
 def expire_logbook_cache(sender, **kwargs):
     """
     When the user save new preferences, expire the caches on all logbook
-    pages. This function is called two was: one was is by the Profile
-    save signal, where sender will be the profile class, and the other way
-    is by the edit_logbook signasl, in which the user instance will be the
-    sender
+    pages. This function is called three ways: by the Profile save signal
+    and the Plane pre_save signal, where sender will be the model class,
+    and by the edit_logbook signal, in which the user instance will be the
+    sender. Expiring all pages is done by changing the generation number
+    that is part of every cache key. When the dates of the edited flights
+    are sent with the signal, only the pages with those flights expire.
     """
     
     page = kwargs.get('page', None)
+    dates = kwargs.get('dates', None)
     
-    if page:
-        user = sender
-        expire_logbook_cache_page(user, page)
-        
-    elif getattr(sender, "__name__", "ff") == "Profile":
-        profile = kwargs.pop('instance')
-        expire_all(profile=profile)
+    if sender in (Profile, Plane):
+        user = kwargs['instance'].user
+        if user:
+            bump_logbook_cache_generation(user)
+    
+    elif not kwargs.get('touch_cache', True):
+        return
+    
+    elif dates:
+        expire_flight_pages(sender, dates, shift=kwargs.get('shift', False))
+    
+    elif page:
+        expire_logbook_cache_page(sender, page)
 
     else:
-        user = sender
-        expire_all(user=user)
+        bump_logbook_cache_generation(sender)
         
 ###############################################################################
 
+def new_logbook_version(sender, **kwargs):
+    """
+    The sender of the edit_logbook signal is the user whose logbook was
+    edited.
+    """
+    
+    bump_logbook_version(sender)
+    
+    # render the default graphs ahead of time, but not during the request
+    if jobs_enabled():
+        from main.jobs import enqueue
+        enqueue('warm_graphs', sender)
+        
+###############################################################################
+
+def remember_location_routes(sender, **kwargs):
+    """
+    The routebases of a deleted location get deleted along with it, so
+    the routes that went through it have to be found beforehand.
+    """
+    
+    instance = kwargs['instance']
+    instance._route_ids = set(RouteBase.objects.filter(location=instance)
+                                               .values_list('route', flat=True))
+
+def remember_location_identifier(sender, **kwargs):
+    """
+    Keep the identifier the location had before it was saved, the routes
+    that went through it need to know when it got renamed.
+    """
+    
+    instance = kwargs['instance']
+    instance._old_identifier = None
+    
+    if instance.pk and instance.user_id and \
+            not instance.user_id == settings.COMMON_USER_ID:
+        old = Location.objects.filter(pk=instance.pk)\
+                              .values_list('identifier', flat=True)
+        if old:
+            instance._old_identifier = old[0]
+
 def re_render_routes(sender, **kwargs):
     """
-    When the user edits their locations, re-render all custom/unknown routes
+    When the user edits their locations, re-render only the routes that go
+    through the edited location, or that have the location's identifier
+    as an unknown. The routes are updated in place, which also moves the
+    running totals of their flights. The distances change, so the graphs
+    and signatures of the logbook are made again.
     """
     
     instance = kwargs.get('instance', None)
     
-    if not instance or instance.user.id == settings.COMMON_USER_ID:
+    if not instance or not instance.user or \
+            instance.user.id == settings.COMMON_USER_ID:
         #disable this functionality when doing a location database update
         return
+    
+    if kwargs.get('signal') == models.signals.post_delete:
+        # the routebases pointing to the location are gone, so those
+        # routes need their identifiers resolved again
+        easy, hard = set(), getattr(instance, '_route_ids', set())
+    else:
+        easy, hard = RouteBase.routes_for([instance.pk], [instance.identifier],
+                                          user=instance.user)
+        
+        old = getattr(instance, '_old_identifier', None)
+        if old and not old == instance.identifier:
+            # the route strings still have the old identifier, which is
+            # now unknown, so those routes get their identifiers resolved
+            # again instead of showing the new one
+            hard |= easy
+            easy = set()
+    
+    if easy:
+        Route.easy_render_batch(list(easy))
+    
+    if hard:
+        Route.rebuild_batch(list(hard))
+    
+    if easy or hard:
+        bump_logbook_cache_generation(instance.user)
+        bump_logbook_version(instance.user)
+        SocialIndex.routes_changed(easy | hard)
+        VisitedPlace.routes_changed(easy | hard)
+    
+###############################################################################
 
-    qs = Route.objects\
-              .user(instance.user)\
-              .filter( models.Q(routebase__location__loc_class=3) | 
-                       models.Q(routebase__unknown__isnull=False) |
-                       models.Q(fallback_string__contains='!')
-                     )\
-              .distinct()
-
-    for r in qs.iterator():
-        r.hard_render()
+def invalidate_location_index(sender, **kwargs):
+    """
+    The identifier index used when making routes only holds airports,
+    navaids and historical idents, so custom places don't reset it. The
+    airports and navaids of the 'ALL' user come from the importers, which
+    reset it once when they are done, and the admin resets it for edits.
+    """
+    
+    instance = kwargs.get('instance', None)
+    
+    if getattr(instance, 'loc_class', None) == 3 or \
+            getattr(instance, 'user_id', None) == settings.COMMON_USER_ID:
+        return
+    
+    invalidate_index()
     
 ###############################################################################
 
+models.signals.pre_save.connect(remember_location_identifier, sender=Location)
 models.signals.post_save.connect(re_render_routes, sender=Location)
+models.signals.pre_delete.connect(remember_location_routes, sender=Location)
 models.signals.post_delete.connect(re_render_routes, sender=Location)
 
+models.signals.post_save.connect(invalidate_location_index, sender=Location)
+models.signals.post_delete.connect(invalidate_location_index, sender=Location)
+
 models.signals.pre_save.connect(calculate_flight, sender=Flight)
+models.signals.pre_save.connect(remember_fuel_burn, sender=Plane)
 models.signals.post_save.connect(recalculate_fuel, sender=Plane)    
+models.signals.post_save.connect(reindex_plane, sender=Plane)
+models.signals.post_save.connect(reset_plane_badges, sender=Plane)
 
 models.signals.pre_save.connect(expire_logbook_cache, sender=Plane)
 models.signals.post_save.connect(expire_logbook_cache, sender=Profile)
 edit_logbook.connect(expire_logbook_cache)
+edit_logbook.connect(new_logbook_version)
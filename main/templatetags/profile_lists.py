@@ -19,14 +19,21 @@ def list_users(profiles):
         username = user['user__username']
         share = user['logbook_share']
         
+        # the social index also has when and how many times they flew it
+        flown = ""
+        if user.get('flights'):
+            flown = "%s flights from %s to %s. " % (user['flights'],
+                                                    user['first_date'],
+                                                    user['last_date'])
+        
         if share:
             url = reverse('logbook', kwargs={"username": username})
-            out += """<a href="%s" title="Click to see this user's logbook">%s</a>"""\
-                    % (url, username)
+            out += """<a href="%s" title="%sClick to see this user's logbook">%s</a>"""\
+                    % (url, flown, username)
                
         else:
-            out += """<a title="This user does not allow others to view his/her logbook"
-                         class="noshare" href="">%s</a>""" % username
+            out += """<a title="%sThis user does not allow others to view his/her logbook"
+                         class="noshare" href="">%s</a>""" % (flown, username)
         
         out += ", "
 
@@ -104,3 +104,69 @@ def track(event, properties=None):
 
 
 
+
+def reserve_ids(model, count):
+    """
+    Pulls `count` primary keys out of the model's postgres sequence in one
+    query, so objects that reference each other can be inserted with
+    bulk_create.
+    """
+    
+    from django.db import connection
+    
+    if not count:
+        return []
+    
+    sequence = "%s_%s_seq" % (model._meta.db_table, model._meta.pk.column)
+    
+    cursor = connection.cursor()
+    cursor.execute("SELECT nextval(%s) FROM generate_series(1, %s)",
+                   [sequence, count])
+    
+    return [row[0] for row in cursor.fetchall()]
+
+def _in_worker(item):
+    """
+    Runs one item of run_pool() and closes the worker's connection after,
+    every process or thread has it's own and they shouldn't pile up.
+    """
+    
+    from django.db import connection
+    
+    func, arg = item
+    
+    try:
+        return func(arg)
+    finally:
+        connection.close()
+
+def run_pool(func, items, processes, threads=False):
+    """
+    Returns func(item) for each of the items, ran by a pool of `processes`
+    processes (or threads). The parent's connection is closed before
+    forking, since the children can't share it. With one process (or
+    item), everything runs right here instead. `func` has to be a module
+    level function so it can be sent to the processes.
+    """
+    
+    from django.db import connection
+    
+    items = list(items)
+    processes = min(processes, len(items))
+    
+    if processes <= 1:
+        return map(func, items)
+    
+    if threads:
+        from multiprocessing.pool import ThreadPool as Pool
+    else:
+        from multiprocessing import Pool
+        # forked processes can not share the parent's connection
+        connection.close()
+    
+    pool = Pool(processes)
+    try:
+        return pool.map(_in_worker, [(func, item) for item in items])
+    finally:
+        pool.close()
+        pool.join()
@@ -21,4 +21,14 @@ class ImportFlightForm(PopupFlightForm):
    # 	# disable badges checking when adding flights via the import feature
     	# because after the import is done, we calculate badges once.
     #	kwargs['no_badges'] = True
-   # 	return super(ImportFlightForm, self).save(*args, **kwargs)
\ No newline at end of file
+   # 	return super(ImportFlightForm, self).save(*args, **kwargs)
+
+class BulkFlightForm(ImportFlightForm):
+    """
+    Used by the bulk importer, which resolves the plane out of its own
+    preloaded map and sets it on the instance before validation.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super(BulkFlightForm, self).__init__(*args, **kwargs)
+        del self.fields['plane']
@@ -1,6 +1,9 @@
 import datetime
+import time
 import csv
 
+from django.conf import settings
+
 from records.forms import NonFlightForm
 from logbook.models import Flight
 from records.models import Records, NonFlight
@@ -291,6 +294,183 @@ class DatabaseImport(PreviewImport):
             super(DatabaseImport, self).handle_plane, line, message
         )
 
+class BulkDatabaseImport(DatabaseImport):
+    """
+    Same as DatabaseImport, except flights are collected into batches. For
+    each batch the planes and route identifiers are resolved out of maps that
+    are loaded once, and the routes, routebases and flights are written with
+    one bulk insert each. The whole import runs in a single transaction.
+    """
+    
+    BATCH_SIZE = 500
+    
+    def action(self):
+        from django.db import transaction
+        from route.resolver import IdentResolver
+        
+        self.pending = []
+        self.planes = None
+        self.resolver = IdentResolver(user=self.user)
+        self.flight_count = 0
+        
+        start = time.time()
+        
+        with transaction.commit_on_success():
+            super(BulkDatabaseImport, self).action()
+            self.flush()
+            self.rebuild_summaries()
+        
+        self.elapsed = time.time() - start
+        self.throughput = "%s flights imported in %.1f seconds (%.0f/sec)" % (
+            self.flight_count, self.elapsed,
+            self.flight_count / max(self.elapsed, 0.001)
+        )
+    
+    def handle_flight(self, line):
+        """
+        Queue up the line, the output for it gets filled in when the batch
+        it belongs to is written.
+        """
+        
+        if len(self.pending) >= self.BATCH_SIZE:
+            self.flush()
+        
+        self.pending.append((len(self.flight_out), line))
+        return None
+    
+    def handle_plane(self, line):
+        # the plane map gets reloaded before the next batch is written
+        self.planes = None
+        return super(BulkDatabaseImport, self).handle_plane(line)
+    
+    ###########################################################################
+    
+    def load_planes(self):
+        """
+        Returns a dict of (tailnumber, type) -> plane, and tailnumber -> plane
+        for the lines that have no type.
+        """
+        
+        planes = {}
+        for plane in Plane.objects.filter(user=self.user).order_by('id'):
+            planes.setdefault((plane.tailnumber, plane.type), plane)
+            planes.setdefault(plane.tailnumber, plane)
+            
+        return planes
+    
+    def get_plane(self, line):
+        """
+        Same rules as DatabaseImport.handle_flight, but out of the plane map.
+        """
+        
+        tailnumber = line.get("tailnumber") or ""
+        type_ = line.get("type")
+        
+        if not tailnumber:
+            unknown = settings.UNKNOWN_PLANE_ID
+            if unknown not in self.planes:
+                self.planes[unknown] = Plane.objects.get(pk=unknown)
+            return self.planes[unknown]
+        
+        key = (tailnumber, type_) if type_ else tailnumber
+        plane = self.planes.get(key)
+        
+        if not plane:
+            plane = Plane.objects.create(user=self.user,
+                                         tailnumber=tailnumber,
+                                         type=type_ or "")
+            self.planes.setdefault((tailnumber, plane.type), plane)
+            self.planes.setdefault(tailnumber, plane)
+        
+        return plane
+    
+    def flush(self):
+        """
+        Validate and write all pending lines.
+        """
+        
+        from forms import BulkFlightForm
+        from route.make_route import MakeRoute
+        from route.models import Route, RouteBase
+        from main.utils import reserve_ids
+        
+        if not self.pending:
+            return
+        
+        if self.planes is None:
+            self.planes = self.load_planes()
+        
+        valid = []
+        for index, line in self.pending:
+            plane = self.get_plane(line)
+            line.update({"plane": plane.pk})
+            
+            flight = Flight(user=self.user, plane=plane)
+            form = BulkFlightForm(line, instance=flight, user=self.user)
+            
+            if form.is_valid():
+                valid.append((index, line, form.save(commit=False)))
+            else:
+                self.flight_out[index] = status_decorator(
+                    super(DatabaseImport, self).handle_flight, line, form.errors
+                )
+        
+        self.pending = []
+        
+        self.resolver.preload(flight.route_string for i, l, flight in valid)
+        
+        route_ids = reserve_ids(Route, len(valid))
+        routes = []
+        routebases = []
+        
+        for route_id, (index, line, flight) in zip(route_ids, valid):
+            mr = MakeRoute(flight.route_string, self.user, date=flight.date,
+                           resolver=self.resolver, commit=False)
+            
+            route = mr.route
+            route.id = route_id
+            
+            for routebase in mr.routebases:
+                routebase.route = route
+            
+            routes.append(route)
+            routebases.extend(mr.routebases)
+            
+            # same as what the calculate_flight signal does
+            flight.route = route
+            distance = route.total_line_all
+            if distance > 0 and flight.total > 0:
+                flight.speed = distance / flight.total
+            flight.calc_fuel()
+            
+            self.flight_out[index] = status_decorator(
+                super(DatabaseImport, self).handle_flight, line, 'good'
+            )
+        
+        Route.objects.bulk_create(routes)
+        RouteBase.objects.bulk_create(routebases)
+        Flight.objects.bulk_create([flight for i, l, flight in valid])
+        
+        self.flight_count += len(valid)
+    
+    def rebuild_summaries(self):
+        """
+        The flights were inserted without going through Flight.save, so the
+        running totals, logbook pages, social index, visited states and
+        countries and badge progress get rebuilt once at the end.
+        """
+        
+        from logbook.models import RunningTotals, LogbookPage, SocialIndex
+        from maps.models import VisitedPlace
+        from badges.models import BadgeProgress, BADGE_CLASSES
+        
+        RunningTotals.rebuild(self.user)
+        LogbookPage.rebuild(self.user)
+        SocialIndex.rebuild(self.user)
+        VisitedPlace.rebuild(self.user)
+        BadgeProgress.rebuild(self.user,
+                              [Badge for Badge in BADGE_CLASSES if Badge.fold])
+
 def status_decorator(func, line, message):
     
     result = func(line)
@@ -4,7 +4,7 @@ from annoying.decorators import render_to
 from forms import ImportForm
 from share.decorator import no_share
 
-from import_class import PreviewImport, DatabaseImport, BaseImport
+from import_class import PreviewImport, BulkDatabaseImport, BaseImport
 from handle_uploads import save_php, save_upload, get_last
 
 from backupfromphp import PHPBackup, InvalidToken, InvalidURL
@@ -95,7 +95,7 @@ def do_import(preview, user, force_tsv):
     #######################################################
 
     if not preview:
-        im = DatabaseImport(user, f, force_tsv)
+        im = BulkDatabaseImport(user, f, force_tsv)
         
     else:
         im = PreviewImport(user, f, force_tsv)
@@ -115,6 +115,8 @@ def do_import(preview, user, force_tsv):
     non_flight_header = im.non_flight_header
     plane_header = im.plane_header
     
+    throughput = getattr(im, 'throughput', None)
+    
     del im
     
     return locals()
@@ -0,0 +1,10 @@
+from django.contrib import admin
+from models import *
+
+class VisitedPlaceAdmin(admin.ModelAdmin):
+    list_display = ('user', 'kind', 'code', 'unique_airports', 'landings')
+    list_filter = ('kind', )
+    search_fields = ('user__username', 'code')
+    raw_id_fields = ('user', )
+
+admin.site.register(VisitedPlace, VisitedPlaceAdmin)
@@ -40,7 +40,7 @@ def single_route_kml(request, pk, f=False):
     f = RouteFolder(name="Route", qs=[r], style="#red_line")
     a = AirportFolder(name='Points', qs=l)
 
-    return folders_to_kmz_response([f,a], add_icon=True)
+    return folders_to_kmz_response([f,a], add_icon=True, stream=False)
 
 @cache_page(60 * 60 * 900)
 def single_location_kml(request, ident):
@@ -53,11 +53,12 @@ def single_location_kml(request, ident):
                      
     f = AirportFolder(name=ident, qs=[l])
 
-    return folders_to_kmz_response([f], add_icon=True)
+    return folders_to_kmz_response([f], add_icon=True, stream=False)
 
 #------------------------------------------------------------------------------
+# The exports below are streamed as they are made, which the page cache
+# can't store, so they are not cached.
 
-@cache_page(60 * 60)
 def routes_location_kml(request, ident, type):
     """
     Returns a KMZ of all routes flown to the passed location identifier,
@@ -75,9 +76,7 @@ def routes_location_kml(request, ident, type):
     l = Location.goof(identifier=ident, loc_class=lc)
     
     qs = Route.objects\
-              .filter(routebase__location__identifier=ident.upper())\
-              .values('kml_rendered', 'simple_rendered')\
-              .distinct()
+              .filter(routebase__location__identifier=ident.upper())
     
     name = l.identifier
     
@@ -85,7 +84,6 @@ def routes_location_kml(request, ident, type):
 
 #------------------------------------------------------------------------------
 
-@cache_page(60 * 60)
 def routes_model_kml(request, model):
     "Returns a KMZ of all routes flown by the passed aircraft model"
     
@@ -94,7 +92,6 @@ def routes_model_kml(request, model):
 
 #------------------------------------------------------------------------------
 
-@cache_page(60 * 60)
 def routes_type_kml(request, ty):
     "Returns a KMZ of all routes flown by the passed aircraft type"
     
@@ -103,7 +100,6 @@ def routes_type_kml(request, ty):
 
 #------------------------------------------------------------------------------
 
-@cache_page(60 * 60)
 def routes_tailnumber_kml(request, tn):
     "Returns a KMZ of all routes flown by the passed tailnumber"
     
@@ -115,7 +111,6 @@ def routes_tailnumber_kml(request, tn):
                 
     return qs_to_time_kmz(qs, points=("Airports", l))
 
-@cache_page(60 * 5)
 def single_user(request):
     """
     Returns a combined KML file with both the routes and airports a single user
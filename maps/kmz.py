@@ -0,0 +1,65 @@
+"""
+Writing KMZ files as a stream. zipfile needs to know the size of each
+file before it is written, so the KML would have to be in memory all at
+once. Instead, doc.kml is deflated a chunk at a time by the same zip
+writer the backups use, so each chunk can be sent to the client as soon
+as it is made.
+"""
+
+import os
+
+from backup.zipstream import ZipStream
+
+# filesystem path to the directory where icons are stored.
+ICON_DIR = os.path.abspath(os.path.join(__file__, '..', 'static', 'icons'))
+
+# the name of each icon inside the KMZ, and the file it comes from
+ICON_FILES = (
+    ("files/icon_unknown.png", "white_pad.png"),
+    ("files/cyan.png", "cyan_pad.png"),
+    ("files/gray.png", "gray_pad.png"),
+    ("files/yellow.png", "yellow_pad.png"),
+    ("files/red.png", "red_pad.png"),
+    ("files/teal.png", "teal_pad.png"),
+    ("files/white.png", "white_pad.png"),
+    ("files/orange.png", "orange_pad.png"),
+    ("files/green.png", "green_pad.png"),
+    ("files/purple.png", "purple_pad.png"),
+)
+
+_icons = None
+
+def icons():
+    """
+    The (name, bytes) of every icon, read from disk once per process
+    """
+
+    global _icons
+
+    if _icons is None:
+        loaded = []
+        for name, filename in ICON_FILES:
+            with open(os.path.join(ICON_DIR, filename), 'rb') as f:
+                loaded.append((name, f.read()))
+        _icons = loaded
+
+    return _icons
+
+def kmz_stream(kml_chunks, add_icon=False):
+    """
+    Yields the KMZ file made of doc.kml (from the chunks of KML) and the
+    icons, if they are used.
+    """
+
+    z = ZipStream()
+
+    for data in z.deflated("doc.kml", kml_chunks):
+        yield data
+
+    if add_icon:
+        for name, icon in icons():
+            for data in z.stored(name, icon):
+                yield data
+
+    for data in z.close():
+        yield data
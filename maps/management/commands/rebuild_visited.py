@@ -0,0 +1,33 @@
+import datetime
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.contrib.auth.models import User
+
+from maps.models import VisitedPlace
+
+class Command(NoArgsCommand):
+    help = 'Rebuild the visited states and countries of the maps, run after the airport database gets updated'
+    
+    option_list = NoArgsCommand.option_list + (
+            make_option('--user',
+                        '-u',
+                        dest='username',
+                        help="Only rebuild the states and countries of this username",
+            ),
+    )
+    
+    def handle(self, *args, **options):
+        
+        if options['username']:
+            users = User.objects.filter(username=options['username'])
+        else:
+            users = User.objects.filter(flight__isnull=False).distinct()
+        
+        start = datetime.datetime.now()
+        for user in users.order_by('id').iterator():
+            rows = VisitedPlace.rebuild(user)
+            print "%s [%s rows]" % (user.username, rows)
+        
+        print "\n=====\ntotal processing time: %s" % \
+                                (datetime.datetime.now() - start)
@@ -0,0 +1,198 @@
+from django.db import models, connection
+from django.contrib.auth.models import User
+
+from logbook.models import Flight
+
+class VisitedPlace(models.Model):
+    """
+    The states and countries each user has been to, for the states and
+    countries maps. There is one row for each user and each region or
+    country, with the number of unique airports visited there and the
+    number of times the user has been there (every routebase of every
+    flight), so the maps read the user's rows instead of joining the
+    locations to the regions through the whole routebase history.
+
+    Flight.save() and flight deletion refresh the regions and countries
+    of the flight's route before and after. Routes re-rendered in place
+    keep their ids, so whatever re-renders them (re_render_routes and the
+    rerender_routes command) calls routes_changed() to rebuild the rows of
+    their users.
+    """
+
+    KINDS = (
+        ('region', 'Region'),
+        ('country', 'Country'),
+    )
+
+    # the code of each kind, and how to get to it from the location table
+    KIND_SQL = {
+        'region': ("airport_region.code",
+                   """INNER JOIN airport_region
+                         ON airport_region.id = airport_location.region_id"""),
+        'country': ("airport_location.country_id", ""),
+    }
+
+    user =              models.ForeignKey(User)
+    kind =              models.CharField(max_length=10, choices=KINDS)
+    code =              models.CharField(max_length=48)
+
+    unique_airports =   models.IntegerField(default=0)
+    landings =          models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'kind', 'code')
+
+    def __unicode__(self):
+        return u"%s -- %s %s" % (self.user_id, self.kind, self.code)
+
+    @classmethod
+    def keys_for_places(cls, places):
+        """
+        Returns the set of (kind, code) of the places, as returned by
+        Flight.route_places()
+        """
+
+        keys = set()
+        for ident, region, country in places:
+            if region:
+                keys.add(('region', region))
+            if country:
+                keys.add(('country', country))
+
+        return keys
+
+    @classmethod
+    def collect(cls, user_id, kind, codes=None):
+        """
+        Returns a (code, unique airports, landings) row for every region or
+        country in the user's logbook, or only for the passed codes.
+        """
+
+        expression, join = cls.KIND_SQL[kind]
+
+        where = ["logbook_flight.user_id = %s", "%s IS NOT NULL" % expression]
+        params = [user_id]
+
+        if codes is not None:
+            where.append("%s IN (%s)" % (expression,
+                                         ", ".join(["%s"] * len(codes))))
+            params.extend(codes)
+
+        cursor = connection.cursor()
+        cursor.execute(
+            """SELECT %s, COUNT(DISTINCT airport_location.id), COUNT(*)
+               FROM logbook_flight
+               INNER JOIN route_routebase
+                  ON route_routebase.route_id = logbook_flight.route_id
+               INNER JOIN airport_location
+                  ON airport_location.id = route_routebase.location_id
+               %s
+               WHERE %s
+               GROUP BY 1""" % (expression, join, " AND ".join(where)),
+            params)
+
+        return cursor.fetchall()
+
+    @classmethod
+    def refresh(cls, user_id, keys):
+        """
+        Count the airports and landings of each of the passed (kind, code)
+        keys of the user's logbook again.
+        """
+
+        by_kind = {}
+        for kind, code in keys:
+            by_kind.setdefault(kind, set()).add(code)
+
+        for kind, codes in by_kind.items():
+            codes = list(codes)
+            rows = cls.collect(user_id, kind, codes)
+
+            cls.objects.filter(user__id=user_id, kind=kind, code__in=codes)\
+                       .delete()
+
+            cls.objects.bulk_create(
+                cls(user_id=user_id, kind=kind, code=code,
+                    unique_airports=unique, landings=landings)
+                for code, unique, landings in rows
+            )
+
+    @classmethod
+    def rebuild(cls, user):
+        """
+        Throw away all of the user's rows and make them again from the
+        flight table. Returns the number of rows.
+        """
+
+        user_id = getattr(user, 'id', user)
+
+        cls.objects.filter(user__id=user_id).delete()
+
+        rows = []
+        for kind, title in cls.KINDS:
+            rows.extend(
+                cls(user_id=user_id, kind=kind, code=code,
+                    unique_airports=unique, landings=landings)
+                for code, unique, landings in cls.collect(user_id, kind)
+            )
+
+        cls.objects.bulk_create(rows)
+        return len(rows)
+
+    @classmethod
+    def flight_changed(cls, user_id, old, new):
+        """
+        Called after a flight was saved or deleted with the (route id, keys)
+        of the flight before and after. Nothing changes unless the flight
+        went onto another route.
+        """
+
+        old_route, old_keys = old
+        new_route, new_keys = new
+
+        if not old_route == new_route and (old_keys or new_keys):
+            cls.refresh(user_id, old_keys | new_keys)
+
+    @classmethod
+    def routes_changed(cls, route_ids):
+        """
+        Called after routes were re-rendered in place, which changes the
+        locations of every flight that uses them.
+        """
+
+        users = Flight.objects.filter(route__in=route_ids)\
+                              .values_list('user', flat=True)\
+                              .order_by()\
+                              .distinct()
+
+        for user_id in users:
+            cls.rebuild(user_id)
+
+    @classmethod
+    def counts(cls, user, kind, by):
+        """
+        The code and count of each region or country the user has been to.
+        by='unique' -> count is the number of unique airports visited
+        by='landings' -> count is the total number of landings
+        """
+
+        field = 'unique_airports' if by == 'unique' else 'landings'
+
+        return cls.objects.filter(user=user, kind=kind)\
+                          .values_list('code', field)
+
+def remove_from_visited(sender, **kwargs):
+    """
+    When a flight is deleted, count the places of it's route again
+    """
+
+    flight = kwargs['instance']
+
+    if not flight.route_id:
+        return
+
+    keys = VisitedPlace.keys_for_places(flight.route_places())
+    VisitedPlace.flight_changed(flight.user_id, (flight.route_id, keys),
+                                (None, set()))
+
+models.signals.post_delete.connect(remove_from_visited, sender=Flight)
@@ -1,12 +1,30 @@
 from django.db.models import Count
 from airport.models import Region, Location, Country
 
+from models import VisitedPlace
+
+def is_all(user):
+    """
+    The rollups are per user, so the unique airports of the whole site
+    can't be added up from them. The 'ALL' user goes through the locations.
+    """
+
+    return user == 'ALL' or user is None or getattr(user, "id", 0) == 1
+
 def get_states_data(user, by):
     """
     Get the list of states that need to be lit up.
     by='unique' -> Count is total unique airports visited in each state
     by='landings' -> Count is the total number of landings in each state
     """
+
+    if not is_all(user):
+        ret = VisitedPlace.counts(user, 'region', by)\
+                          .filter(code__startswith='US-')
+
+        # change the code value from 'US-CA' to just 'CA'
+        return [{'count': count, 'code': code[3:]} for code, count in ret]
+
     if by == 'unique':
         all_points = Location.objects\
                              .user(user)\
@@ -40,6 +58,11 @@ def get_countries_data(user, by):
     by='unique' -> Count is total unique airports visited in each state
     by='landings' -> Count is the total number of landings in each state
     """
+
+    if not is_all(user):
+        return [{'c': count, 'code': code} for code, count
+                        in VisitedPlace.counts(user, 'country', by)]
+
     if by == 'unique':
         all_points = Location.objects\
                              .user(user)\
@@ -56,4 +79,4 @@ def get_countries_data(user, by):
                      .user(user)\
                      .values('code')\
                      .distinct()\
-                     .annotate(c=Count('code'))
\ No newline at end of file
+                     .annotate(c=Count('code'))
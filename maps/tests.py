@@ -10,3 +10,109 @@ class SimpleTest(TestCase):
         self.failUnlessEqual(response.status_code, 200)
         
         self.failUnlessEqual(1 + 1, 2)
+
+class KMZStreamTest(TestCase):
+    def test_zip(self):
+        """
+        Tests that the streamed KMZ reads back as a regular zip file
+        """
+        
+        import zipfile
+        import cStringIO
+        from kmz import kmz_stream, ICON_FILES
+        
+        kml = ["<kml>", "<Folder></Folder>" * 1000, "</kml>"]
+        data = "".join(kmz_stream(iter(kml), add_icon=True))
+        
+        z = zipfile.ZipFile(cStringIO.StringIO(data))
+        
+        self.failUnlessEqual(z.testzip(), None)
+        self.failUnlessEqual(z.read("doc.kml"), "".join(kml))
+        self.failUnlessEqual(len(z.namelist()), len(ICON_FILES) + 1)
+
+class VisitedPlaceTest(TestCase):
+    
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from django.contrib.gis.geos import Point
+        from airport.models import Location, Region, Country
+        from plane.models import Plane
+        
+        self.u = User(username='erin')
+        self.u.save()
+        
+        self.p = Plane(tailnumber="N4444", type='C-172', cat_class=1)
+        self.p.save()
+        
+        us = Country.objects.create(code='US', name='United States')
+        ca = Region.objects.create(code='US-CA', country='US', name='California')
+        ny = Region.objects.create(code='US-NY', country='US', name='New York')
+        
+        for ident, region, x, y in (('KSFO', ca, -122.37, 37.62),
+                                    ('KLAX', ca, -118.41, 33.94),
+                                    ('KJFK', ny, -73.78, 40.64)):
+            Location.objects.create(identifier=ident, loc_class=1, country=us,
+                                    region=region, location=Point(x, y))
+    
+    def fly(self, route):
+        from logbook.test_utils import make_flight
+        return make_flight(self.u, self.p, route=route)
+    
+    def test_flight_changes(self):
+        """
+        Tests that the visited states follow flights being added, edited
+        and deleted, and that rebuilding them gives the same rows
+        """
+        
+        from models import VisitedPlace
+        from states import get_states_data, get_countries_data
+        
+        f = self.fly('ksfo-klax')
+        self.fly('ksfo-ksfo')
+        
+        self.failUnlessEqual(get_states_data(self.u, 'unique'),
+                             [{'count': 2, 'code': 'CA'}])
+        self.failUnlessEqual(get_states_data(self.u, 'landings'),
+                             [{'count': 4, 'code': 'CA'}])
+        self.failUnlessEqual(get_countries_data(self.u, 'landings'),
+                             [{'c': 4, 'code': 'US'}])
+        
+        f.route_string = 'ksfo-kjfk'
+        f.render_route()
+        
+        states = sorted(get_states_data(self.u, 'unique'))
+        self.failUnlessEqual(states, [{'count': 1, 'code': 'CA'},
+                                      {'count': 1, 'code': 'NY'}])
+        
+        rows = sorted(VisitedPlace.objects.filter(user=self.u)\
+                                  .values_list('kind', 'code', 'landings'))
+        VisitedPlace.rebuild(self.u)
+        rebuilt = sorted(VisitedPlace.objects.filter(user=self.u)\
+                                     .values_list('kind', 'code', 'landings'))
+        self.failUnlessEqual(rows, rebuilt)
+        
+        f.delete()
+        self.failUnlessEqual(get_states_data(self.u, 'unique'),
+                             [{'count': 1, 'code': 'CA'}])
+    
+    def test_rerender(self):
+        """
+        Tests that re-rendering routes after an airport moved to another
+        state moves the rows along with it
+        """
+        
+        from airport.models import Location, LocationChange, Region
+        from route.rerender import rerender
+        from states import get_states_data
+        
+        self.fly('ksfo-kjfk')
+        
+        kjfk = Location.objects.get(identifier='KJFK')
+        Location.objects.filter(pk=kjfk.pk)\
+                        .update(region=Region.objects.get(code='US-CA'))
+        LocationChange.objects.create(location=kjfk, identifier='KJFK')
+        
+        rerender('test', processes=1)
+        
+        self.failUnlessEqual(get_states_data(self.u, 'unique'),
+                             [{'count': 2, 'code': 'CA'}])
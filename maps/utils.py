@@ -1,11 +1,26 @@
-import os
-
 from django.template.loader import get_template
 from django.template import Context
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.core.urlresolvers import reverse, NoReverseMatch
+from django.utils.html import escape
+
+from kmz import kmz_stream
+
+def _iterate(qs):
+    """
+    Querysets are iterated without filling their result cache, so the
+    rows of a big export are never all in memory at once.
+    """
+    
+    if hasattr(qs, 'iterator'):
+        return qs.iterator()
+    return iter(qs)
 
-# filesystem path to the directory where icons are stored.
-ICON_DIR = os.path.abspath(os.path.join(__file__, '..', 'static', 'icons'))
+def _url(name, arg):
+    try:
+        return reverse(name, args=[arg])
+    except NoReverseMatch:
+        return ""
 
 class RenderedRoute(object):
     name = ""
@@ -16,45 +31,48 @@ class RenderedRoute(object):
         self.name = name
 
 class BaseFolder(object):
-    index = 0
     name = ""
+    style = "#red_line"
     
-    def __iter__(self):
-        return self
-               
-class RouteFolder(BaseFolder):
-    
-    rendered_routes = []
-    
-    style="#red_line"
-    has_routes = True
-
     def __init__(self, name, qs, style=None):
-        self.rendered_routes=[]
         self.name = name
         self.qs = qs
         if style:
             self.style = style
-            
-        self.figure_qs()
+               
+class RouteFolder(BaseFolder):
+    
+    has_routes = True
     
     def __unicode__(self):
-        return "<RouteFolder: %s routes>" % len(self.rendered_routes)
+        return "<RouteFolder: %s>" % self.name
 
-    def figure_qs(self):
-        for route in self.qs:
-            self.rendered_routes.append(
-                RenderedRoute(name=route['simple_rendered'],
-                              kml=route['kml_rendered'],)
-            )
-    def next(self):
-        try:
-            ret = self.rendered_routes[self.index]
-        except IndexError:
-            raise StopIteration
-            
-        self.index+=1
-        return ret
+    def __iter__(self):
+        for route in _iterate(self.qs):
+            yield RenderedRoute(name=route['simple_rendered'],
+                                kml=route['kml_rendered'])
+    
+    def kml(self):
+        """
+        Yields the KML of the folder, one placemark at a time
+        """
+        
+        yield u"<Folder>\n<name>%s</name>\n" % escape(self.name)
+        
+        for route in self:
+            url = _url("profile-route", route.name)
+            yield (u"<Placemark>\n"
+                   u"<name>%s</name>\n"
+                   u"<styleUrl>%s</styleUrl>\n"
+                   u"<description><![CDATA[<a href=\"http://flightlogg.in%s\">"
+                   u"See who has flown this route</a>]]></description>\n"
+                   u"<LineString>\n<tessellate>1</tessellate>\n"
+                   u"<coordinates>%s</coordinates>\n"
+                   u"</LineString>\n"
+                   u"</Placemark>\n") % (escape(route.name), self.style,
+                                          escape(url), escape(route.kml))
+        
+        yield u"</Folder>\n"
         
 ###############################################################################
 
@@ -72,103 +90,163 @@ class RenderedAirport(object):
         self.icon = destination.kml_icon()
     
 class AirportFolder(BaseFolder):
-    name = ""
-    rendered_airports = []
-    index = 0
-    style="#red_line"
-    has_points = True
     
-    def __init__(self, name, qs, style=None):
-        self.rendered_airports=[]
-        self.name = name
-        self.qs = qs
-        if style:
-            self.style = style
-            
-        self.figure_qs()
+    has_points = True
 
     def __unicode__(self):
-        return "<AirportFolder: %s points>" % len(self.rendered_airports)
+        return "<AirportFolder: %s>" % self.name
 
-    def figure_qs(self):
-        for airport in self.qs:
+    def __iter__(self):
+        qs = self.qs
+        if hasattr(qs, 'select_related'):
+            # the location summary needs the region and country
+            qs = qs.select_related('region', 'country')
+        
+        for airport in _iterate(qs):
             if airport.location:
-                ra=RenderedAirport(destination=airport)
-                self.rendered_airports.append(ra)
-
-    def next(self):
-        try:
-            ret = self.rendered_airports[self.index]
-        except IndexError:
-            raise StopIteration
-            
-        self.index+=1
-        return ret
+                yield RenderedAirport(destination=airport)
+    
+    def kml(self):
+        """
+        Yields the KML of the folder, one placemark at a time
+        """
+        
+        yield u"<Folder>\n<name>%s</name>\n" % escape(self.name)
+        
+        for point in self:
+            url = _url("profile-location", point.identifier)
+            yield (u"<Placemark>\n"
+                   u"<name>%s</name>\n"
+                   u"<styleUrl>%s</styleUrl>\n"
+                   u"<description><![CDATA[<b><a href=\"http://flightlogg.in%s\">"
+                   u"%s</a></b><br>%s]]></description>\n"
+                   u"<Point><coordinates>%s</coordinates></Point>\n"
+                   u"</Placemark>\n") % (escape(point.identifier), point.icon,
+                                          escape(url), escape(point.name),
+                                          escape(point.ls), point.kml)
+        
+        yield u"</Folder>\n"
 
 ###############################################################################
 
-def folders_to_kmz_response(folders, title=None,
-                            add_icon=False, compression=True):
+def kml_chunks(folders, title=None):
+    """
+    Yields the KML document, utf-8 encoded, a folder's placemark at a time.
+    The styles at the top come from a template.
+    """
     
-    import zipfile
-    import cStringIO
+    header = get_template('kml_header.kml').render(Context({"title": title}))
+    yield header.encode('utf-8')
     
-    kml = get_template('base.kml').render(
-        Context({"folders": folders})         
-    )
+    for folder in folders:
+        for chunk in folder.kml():
+            yield chunk.encode('utf-8')
     
-    kml = kml.encode('utf-8')
+    yield "</Document>\n</kml>\n"
+
+def folders_to_kmz_response(folders, title=None,
+                            add_icon=False, compression=True, stream=True):
+    """
+    The KML of the folders zipped into a KMZ file (with the icons for the
+    points, if add_icon is True). The zip file is made as it is sent to
+    the client. Views that get cached need stream=False, since streaming
+    responses can't be cached.
+    """
     
     if not compression:
-        return HttpResponse(kml, mimetype="text/plain")
-    
-    #################################
-     
-    sio = cStringIO.StringIO()
+        content = kml_chunks(folders, title)
+        mimetype = "text/plain"
+    else:
+        content = kmz_stream(kml_chunks(folders, title), add_icon)
+        mimetype = "application/vnd.google-earth.kmz"
     
-    z = zipfile.ZipFile(sio, 'w', compression=zipfile.ZIP_DEFLATED)
-    z.writestr("doc.kml", kml)
+    if not stream:
+        return HttpResponse("".join(content), mimetype=mimetype)
     
-    if add_icon:
-        from django.conf import settings
-        icon = "{0}/white_pad.png".format(ICON_DIR)
-        z.write(icon, "files/icon_unknown.png")
-        
-        ############################################
-        
-        icon = "{0}/cyan_pad.png".format(ICON_DIR)
-        z.write(icon, "files/cyan.png")
-
-        icon = "{0}/gray_pad.png".format(ICON_DIR)
-        z.write(icon, "files/gray.png")
+    return StreamingHttpResponse(content, content_type=mimetype)
 
-        icon = "{0}/yellow_pad.png".format(ICON_DIR)
-        z.write(icon, "files/yellow.png")
+###############################################################################
 
-        icon = "{0}/red_pad.png".format(ICON_DIR)
-        z.write(icon, "files/red.png")
-        
-        icon = "{0}/teal_pad.png".format(ICON_DIR)
-        z.write(icon, "files/teal.png")
+# the folders of each export: the name, the line style, and which flights
+# have their route put in the folder, as a condition on the flight and
+# plane tables
+TIME_FOLDERS = (
+    ("Dual Given", "#orange_line", "logbook_flight.dual_g > 0"),
+    ("Solo", "#red_line", "logbook_flight.solo > 0"),
+    ("PIC", "#red_line", """logbook_flight.pic > 0
+                            AND COALESCE(logbook_flight.dual_g, 0) = 0
+                            AND COALESCE(logbook_flight.solo, 0) = 0"""),
+    ("Dual Received", "#blue_line", "logbook_flight.dual_r > 0"),
+    ("SIC", "#purple_line", "logbook_flight.sic > 0"),
+    ("Actual Instrument", "#green_line", "logbook_flight.act_inst > 0"),
+)
 
-        icon = "{0}/white_pad.png".format(ICON_DIR)
-        z.write(icon, "files/white.png")
-        
-        icon = "{0}/orange_pad.png".format(ICON_DIR)
-        z.write(icon, "files/orange.png")
+CATCLASS_FOLDERS = (
+    ("Single-Engine", "#red_line", "plane_plane.cat_class IN (1, 3)"),
+    ("Multi-Engine", "#blue_line", "plane_plane.cat_class IN (2, 4)"),
+    ("Other", "#green_line", "plane_plane.cat_class > 4 AND plane_plane.cat_class < 15"),
+)
 
-        icon = "{0}/green_pad.png".format(ICON_DIR)
-        z.write(icon, "files/green.png")
-        
-        icon = "{0}/purple_pad.png".format(ICON_DIR)
-        z.write(icon, "files/purple.png")
-        
-    z.close()
+def _routes_by_id(ids, batch=500):
+    """
+    Yields the rendered routes of the ids, a batch at a time, so only one
+    batch of KML is in memory at once.
+    """
+    
+    from route.models import Route
     
-    return HttpResponse(sio.getvalue(),
-                        mimetype="application/vnd.google-earth.kmz")
+    for i in range(0, len(ids), batch):
+        rows = Route.objects.filter(pk__in=ids[i:i + batch])\
+                            .order_by('id')\
+                            .values('simple_rendered', 'kml_rendered')
+        for row in rows.iterator():
+            yield row
 
-###############################################################################
+def route_folders(qs, folders):
+    """
+    Sort the routes of the queryset into the folders with one query that
+    groups the routes by their rendering, so routes that look the same only
+    come up once. The query only returns an id and a flag for each folder;
+    the KML of each folder is fetched while it is being sent. Returns a
+    RouteFolder for each folder that got any routes.
+    """
+    
+    from django.db import connection
+    from django.db.models.sql.datastructures import EmptyResultSet
+    
+    try:
+        subquery, params = qs.order_by()\
+                             .values('pk')\
+                             .query.get_compiler(qs.db)\
+                             .as_sql()
+    except EmptyResultSet:
+        return []
+    
+    flags = ", ".join("COALESCE(BOOL_OR(%s), FALSE)" % condition
+                            for name, style, condition in folders)
+    
+    cursor = connection.cursor()
+    cursor.execute(
+        """SELECT MIN(route_route.id), %s
+           FROM route_route
+           INNER JOIN logbook_flight
+              ON logbook_flight.route_id = route_route.id
+           INNER JOIN plane_plane
+              ON plane_plane.id = logbook_flight.plane_id
+           WHERE route_route.id IN (%s)
+           GROUP BY route_route.simple_rendered, route_route.kml_rendered
+           ORDER BY 1""" % (flags, subquery), params)
+    
+    ids = [[] for folder in folders]
+    
+    for row in cursor.fetchall():
+        for folder_ids, flag in zip(ids, row[1:]):
+            if flag:
+                folder_ids.append(row[0])
+    
+    return [RouteFolder(name=name, qs=_routes_by_id(folder_ids), style=style)
+                for (name, style, condition), folder_ids in zip(folders, ids)
+                if folder_ids]
 
 def qs_to_time_kmz(qs, **kwargs):
     """
@@ -178,68 +256,7 @@ def qs_to_time_kmz(qs, **kwargs):
     
     title = "Routes by type of flight time"
     
-    dual_g = qs.filter(flight__dual_g__gt=0)\
-               .values('kml_rendered', 'simple_rendered')\
-               .order_by()\
-               .distinct()
-              
-    dual_r = qs.filter(flight__dual_r__gt=0)\
-               .values('kml_rendered', 'simple_rendered')\
-               .order_by()\
-               .distinct()
-                          
-    solo =   qs.filter(flight__solo__gt=0)\
-               .values('kml_rendered', 'simple_rendered')\
-               .order_by()\
-               .distinct()
-                          
-    sic =    qs.filter(flight__sic__gt=0)\
-               .values('kml_rendered', 'simple_rendered')\
-               .order_by()\
-               .distinct()
-                          
-    inst =   qs.filter(flight__act_inst__gt=0)\
-               .values('kml_rendered', 'simple_rendered')\
-               .order_by()\
-               .distinct()
-                          
-    pic =    qs.filter(flight__pic__gt=0,
-                       flight__dual_g=0,
-                       flight__solo=0)\
-               .values('kml_rendered', 'simple_rendered')\
-               .order_by()\
-               .distinct()
-
-    folders = []
-    if dual_g:
-        folders.append(
-            RouteFolder(name="Dual Given", qs=dual_g, style="#orange_line")
-        )
-        
-    if solo:
-        folders.append(
-            RouteFolder(name="Solo", qs=solo, style="#red_line")
-        )
-        
-    if pic:
-        folders.append(
-            RouteFolder(name="PIC", qs=pic, style="#red_line")
-        )
-        
-    if dual_r:
-        folders.append(
-            RouteFolder(name="Dual Received", qs=dual_r, style="#blue_line")
-        )
-
-    if sic:
-        folders.append(
-            RouteFolder(name="SIC", qs=sic, style="#purple_line")
-        )
-
-    if inst:
-        folders.append(
-            RouteFolder(name="Actual Instrument", qs=inst, style="#green_line")
-        )
+    folders = route_folders(qs, TIME_FOLDERS)
 
     kwargs['add_icon'] = False
     
@@ -254,8 +271,6 @@ def qs_to_time_kmz(qs, **kwargs):
 
     return folders_to_kmz_response(folders, title, **kwargs)
 
-
-
 def qs_to_catclass_kmz(qs):
     """
     From a routes queryset, return a folder'd up kmz file split up
@@ -263,37 +278,7 @@ def qs_to_catclass_kmz(qs):
     """
     
     title = "Routes by Multi/Single Engine"
-        
-    single = qs.filter(flight__plane__cat_class__in=[1,3])\
-               .values('kml_rendered', 'simple_rendered')\
-               .order_by()\
-               .distinct()
-                          
-    multi = qs.filter(flight__plane__cat_class__in=[2,4])\
-              .values('kml_rendered', 'simple_rendered')\
-              .order_by()\
-              .distinct()
-                         
-    other = qs.exclude(flight__plane__cat_class__lte=4)\
-              .exclude(flight__plane__cat_class__gte=15)\
-              .values('kml_rendered', 'simple_rendered')\
-              .order_by()\
-              .distinct()
     
-    folders = []
-    if single:
-        folders.append(
-            RouteFolder(name="Single-Engine", qs=single, style="#red_line")
-        )
-        
-    if multi:
-        folders.append(
-            RouteFolder(name="Multi-Engine", qs=multi, style="#blue_line")
-        )
-    
-    if other:
-        folders.append(
-            RouteFolder(name="Other", qs=other, style="#green_line")
-        )
+    folders = route_folders(qs, CATCLASS_FOLDERS)
         
     return folders_to_kmz_response(folders, title)
@@ -1,23 +1,46 @@
+import os
+import glob
 import datetime
+import tempfile
 from django.utils.dateformat import format
 
-from django.template.loader import get_template
-from django.http import HttpResponse
-from django.template import Context
+from django.conf import settings
+from django.core.servers.basehttp import FileWrapper
+from django.http import StreamingHttpResponse
 
 from logbook.models import Flight
-from logbook.constants import FIELD_ABBV
+from logbook.constants import FIELD_ABBV, NUMERIC_FIELDS
+from logbook.utils import proper_format, logbook_version
 
 from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import Table, TableStyle, Paragraph, SimpleDocTemplate
+from reportlab.platypus import Table, TableStyle, Paragraph
+from reportlab.pdfgen.canvas import Canvas
 from reportlab.lib.units import inch
 from reportlab.lib.pagesizes import landscape, letter
 
 class PDF(object):
+    """
+    Renders the user's logbook one page at a time. Flights are read from
+    the database with an iterator and each printed page gets it's own
+    table, ending with the totals of that page, the amount forwarded from
+    the pages before it and the totals to date. Only the flights of the
+    current page are ever held in memory.
+    """
     
     PRINT_FIELDS = ('date', 'plane', 'route', 'total_s', 'pic', 'sic', 'solo', 
                     'act_inst', 'sim_inst', 'act_inst','xc','night','day_l',
                     'night_l','person', 'r_remarks')
+
+    # columns that get totaled at the bottom of each page
+    SUM_FIELDS = ['total_s'] + NUMERIC_FIELDS
+
+    ROWS_PER_PAGE = 60
+    ROW_HEIGHT = 0.10 * inch
+    PAGE_SIZE = landscape(letter)
+    MARGIN = inch / 4
+
+    # logbooks with more flights than this get made by the job queue
+    BACKGROUND_FLIGHTS = getattr(settings, 'PDF_BACKGROUND_FLIGHTS', 5000)
                     
     def __init__(self, user):
         
@@ -28,23 +51,11 @@ class PDF(object):
     
         self.flights = Flight.objects\
                              .user(user)\
-                             .order_by('date')\
+                             .order_by('date', 'id')\
                              .select_related()
                              
-        cd = 'attachment; filename=logbook{0}.pdf'.format(self.s_date)
-        self.response = HttpResponse(mimetype='application/pdf')
-        self.response['Content-Disposition'] = cd
-        
-        self.doc = SimpleDocTemplate(self.response,
-                                     pagesize=landscape(letter), 
-                                     showBoundary=1,
-                                     leftMargin=inch/4,
-                                     rightMargin=inch/4,
-                                     topMargin=inch/4,
-                                     bottomMargin=inch/4,
-                                     title="FlightLogg.in Logbook",
-                                     author="FlightLogg.in")
-                                     
+    def filename(self):
+        return 'logbook{0}.pdf'.format(self.s_date)
         
     def define_style(self):
         """
@@ -59,7 +70,7 @@ class PDF(object):
                  ('FONTSIZE',       (0,0), (-1,-1), 4),
                  ('ALIGN',          (0,0), (-2,-1), 'CENTER'),
                  ('VALIGN',         (0,0), (-1,-1), 'TOP'),
-                 ('ALIGN',          (0,-1),(-1,-1), 'LEFT'),
+                 ('ALIGN',          (0,-3),(-1,-1), 'LEFT'),
                  ('LEFTPADDING',    (0,0), (-1,-1), 1),
                  ('RIGHTPADDING',   (0,0), (-1,-1), 1),
                  ('TOPPADDING',     (0,0), (-1,-1), 1),
@@ -70,60 +81,223 @@ class PDF(object):
                  ('BOX',            (0,0), (-1,-1), 0.25, colors.gray),
                 ])
     
-    def make_elements(self):
+    def headings(self):
         """
-        Returns a list of all elements that will be rendered onto the document
+        Returns the elements that go on top of the first page
         """
         
-        self.define_style()
-        
         heading_style = self.styles['Heading1']
         sub_heading_style = self.styles['Normal']
         
         real_name = self.user.get_profile().real_name
         name = real_name or self.user.username
         
-        elements = []
-        
         big_heading = Paragraph("{0}'s Logbook".format(name), heading_style)
         sub_heading = Paragraph(self.f_date, sub_heading_style)
         
-        elements.append(big_heading)
-        elements.append(sub_heading)
-        
-        elements += self.construct_rows()
+        return [big_heading, sub_heading]
         
-        return elements
-        
-    def construct_rows(self):
+    def pages(self):
         """
-        Create the table elements with the user's flight data
+        Yields the flights of each page, as lists of ROWS_PER_PAGE flights
         """
         
-        elements = []
+        page = []
+        for flight in self.flights.iterator():
+            page.append(flight)
         
-        rows = self.flights.count() + 1  #+1 because of the header
+            if len(page) == self.ROWS_PER_PAGE:
+                yield page
+                page = []
+
+        if page:
+            yield page
+
+    def flight_values(self, flight):
+        """
+        Returns the value of each SUM_FIELDS column for this flight
+        """
+
+        values = dict((field, getattr(flight, field, 0) or 0)
+                        for field in NUMERIC_FIELDS)
+
+        if flight.plane.is_sim():
+            values['total_s'] = 0
+        else:
+            values['total_s'] = flight.total or 0
+
+        return values
+
+    def totals_row(self, title, totals):
+        row = []
+        for field in self.PRINT_FIELDS:
+            if field in totals:
+                row.append(proper_format(totals[field], field, 'decimal'))
+            else:
+                row.append("")
+
+        row[0] = title
+        return row
+
+    def construct_table(self, flights, forward):
+        """
+        Create the table of a single page. `forward` is the totals of all
+        pages before this one. Returns the table and the totals up to and
+        including this page.
+        """
+
         header = [FIELD_ABBV[f] for f in self.PRINT_FIELDS]
         data = [header,]
-        for f in self.flights:
+
+        page_totals = dict((field, 0) for field in self.SUM_FIELDS)
+
+        for f in flights:
             subdata = []
             for field in self.PRINT_FIELDS:
                 subdata.append(f.column(field))
             data.append(subdata)
+        
+            for field, value in self.flight_values(f).items():
+                page_totals[field] += value
          
-        # Create the table with the necessary style, and add it to the
-        # elements list.
+        to_date = dict((field, forward[field] + page_totals[field])
+                            for field in self.SUM_FIELDS)
+
+        data.append(self.totals_row("Page Totals", page_totals))
+        data.append(self.totals_row("Amount Forward", forward))
+        data.append(self.totals_row("Totals to Date", to_date))
+
         table = Table(data,
-                      rowHeights=rows*[0.10*inch],
-                      style=self.ts,
-                      repeatRows=1)
+                      rowHeights=len(data) * [self.ROW_HEIGHT],
+                      style=self.ts)
         
-        elements.append(table)
+        return table, to_date
         
-        return elements
+    def draw_page(self, canvas, elements, number):
+        """
+        Draw the elements top to bottom onto the page and finish it.
+        """
+
+        width, height = self.PAGE_SIZE
+        frame_width = width - 2 * self.MARGIN
+        frame_height = height - 2 * self.MARGIN
+
+        canvas.rect(self.MARGIN, self.MARGIN, frame_width, frame_height)
+
+        y = height - self.MARGIN
+        for element in elements:
+            w, h = element.wrapOn(canvas, frame_width, frame_height)
+            y -= h
+            element.drawOn(canvas, self.MARGIN + (frame_width - w) / 2, y)
+
+        canvas.setFont("Helvetica", 6)
+        canvas.drawRightString(width - self.MARGIN - 2, self.MARGIN + 2,
+                               "Page %s" % number)
+        canvas.showPage()
+
+    def write(self, file_):
+        """
+        Write the PDF into the passed file object
+        """
+
+        self.define_style()
+
+        canvas = Canvas(file_, pagesize=self.PAGE_SIZE, pageCompression=1)
+        canvas.setTitle("FlightLogg.in Logbook")
+        canvas.setAuthor("FlightLogg.in")
+
+        forward = dict((field, 0) for field in self.SUM_FIELDS)
+
+        elements = self.headings()
+        number = 0
+
+        for number, flights in enumerate(self.pages(), 1):
+            table, forward = self.construct_table(flights, forward)
+            self.draw_page(canvas, elements + [table], number)
+            elements = []
+
+        if not number:
+            # no flights, still make a page with the headings
+            self.draw_page(canvas, elements, 1)
+
+        canvas.save()
+
+    def stream(self, file_):
+        """
+        Returns a response that streams the passed (already written) file
+        """
+
+        file_.seek(0)
+
+        cd = 'attachment; filename={0}'.format(self.filename())
+        response = StreamingHttpResponse(FileWrapper(file_),
+                                         content_type='application/pdf')
+        response['Content-Disposition'] = cd
+        return response
     
     def as_response(self):
-        elements = self.make_elements()
-        self.doc.build(elements)
-        return self.response
+        """
+        The PDF is written to a temporary file, which is then streamed to
+        the user.
+        """
         
+        file_ = tempfile.TemporaryFile()
+        self.write(file_)
+        return self.stream(file_)
+
+    ############################ background generation
+
+    def is_big(self):
+        return self.flights.count() > self.BACKGROUND_FLIGHTS
+
+    def path(self):
+        """
+        Where the PDF made by the job queue for the current version of the
+        logbook is saved. None if there is no logbook version to go by.
+        """
+
+        version = logbook_version(self.user)
+        pdf_dir = getattr(settings, 'PDF_DIR', None)
+
+        if version is None or not pdf_dir:
+            return None
+
+        return os.path.join(pdf_dir, "%s-%s.pdf" % (self.user.id, version))
+
+    def save(self):
+        """
+        Called from the job queue. Write the PDF to `path()` and remove any
+        PDF made of an older version of the logbook.
+        """
+
+        path = self.path()
+
+        if not path or os.path.exists(path):
+            return
+
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            self.write(f)
+        os.rename(tmp, path)
+
+        old = os.path.join(directory, "%s-*.pdf" % self.user.id)
+        for old_path in glob.glob(old):
+            if not old_path == path:
+                os.remove(old_path)
+
+    def saved_response(self):
+        """
+        Returns a response streaming the PDF made by the job queue, or None
+        if it has not been made yet.
+        """
+
+        path = self.path()
+
+        if not path or not os.path.exists(path):
+            return None
+
+        return self.stream(open(path, 'rb'))
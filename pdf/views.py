@@ -1,9 +1,26 @@
+from annoying.decorators import render_to
+
 from share.decorator import no_share
+from main.jobs import jobs_enabled, enqueue
 from pdf import PDF
 
 @no_share('logbook')
 def pdf(request):
-    
+
     pdf = PDF(request.display_user)
-    
+
+    response = pdf.saved_response()
+    if response:
+        return response
+
+    if jobs_enabled() and pdf.path() and pdf.is_big():
+        # too big to make during the request, the job queue makes it and
+        # the next request for it gets the file
+        enqueue('print_pdf', request.display_user)
+        return pdf_pending(request)
+
     return pdf.as_response()
+
+@render_to('pdf_pending.html')
+def pdf_pending(request):
+    return {}
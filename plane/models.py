@@ -60,10 +60,8 @@ class Plane(EnhancedModel):
         Returns the users who also have flown in this tailnumber
         """
         
-        from django.contrib.auth.models import User
-        return User.objects\
-                   .filter(profile__social=True)\
-                   .filter(plane__tailnumber=tailnumber).distinct()
+        from logbook.models import SocialIndex
+        return SocialIndex.users('tailnumber', tailnumber)
 
     @classmethod
     def get_profiles(cls, **kwarg):
@@ -75,16 +73,8 @@ class Plane(EnhancedModel):
         field = kwarg.keys()[0]
         val = kwarg.values()[0]
         
-        kwarg = {"user__flight__plane__%s__iexact" % field: val,
-                 "user__flight__plane__hidden": False}
-        
-        from profile.models import Profile
-        return Profile.objects\
-                   .filter(**kwarg)\
-                   .filter(social=True)\
-                   .values('user__username', 'user__id', 'logbook_share')\
-                   .order_by('user__username')\
-                   .distinct()
+        from logbook.models import SocialIndex
+        return SocialIndex.profiles(field, val)
                    
     def __unicode__(self):
         if self.type:
@@ -27,8 +27,14 @@ class RouteBaseAdmin(admin.ModelAdmin):
     list_display = ('location', 'unknown', 'land', RouteBase.admin_loc_class,
                      RouteBase.owner)
     raw_id_fields = ('location', 'route')
+
+class RenderProgressAdmin(admin.ModelAdmin):
+    list_display = ('job', 'start', 'end', 'position', 'rendered', 'finished',
+                    'updated')
+    list_filter = ('job', 'finished')
     
 ####################################################
 
 admin.site.register(Route, RouteAdmin)
 admin.site.register(RouteBase, RouteBaseAdmin)
+admin.site.register(RenderProgress, RenderProgressAdmin)
@@ -0,0 +1,149 @@
+"""
+Vectorized versions of the great circle calculations done on routes. The
+points of a route are passed as (location_id, x, y, land) tuples in the order
+they appear in the route, and all distances are in nautical miles, using
+the same formula as route.utils.coord_dist.
+"""
+
+import numpy as np
+
+from django.db import connection
+
+EARTH_RADIUS = 3443.92
+DEGREES_TO_RADIANS = np.pi / 180.0
+
+DISTANCE_FIELDS = ('max_start_all', 'max_start_land', 'max_width_all',
+                   'max_width_land', 'total_line_all', 'total_line_land')
+
+def arc(lat1, lng1, lat2, lng2):
+    """
+    Great circle distance between each pair of coordinates. Takes anything
+    that can be broadcast against each other.
+    """
+
+    phi1 = (90.0 - lat1) * DEGREES_TO_RADIANS
+    phi2 = (90.0 - lat2) * DEGREES_TO_RADIANS
+    theta1 = lng1 * DEGREES_TO_RADIANS
+    theta2 = lng2 * DEGREES_TO_RADIANS
+
+    cos = (np.sin(phi1) * np.sin(phi2) * np.cos(theta1 - theta2) +
+           np.cos(phi1) * np.cos(phi2))
+
+    # rounding errors can put identical points just outside of acos' domain
+    return np.arccos(np.clip(cos, -1.0, 1.0)) * EARTH_RADIUS
+
+def pairwise(lat, lng):
+    """
+    Matrix of the distance between every two points
+    """
+
+    return arc(lat[:, np.newaxis], lng[:, np.newaxis],
+               lat[np.newaxis, :], lng[np.newaxis, :])
+
+def from_start(lat, lng):
+    """
+    Distance of every point from the first point
+    """
+
+    return arc(lat, lng, lat[0], lng[0])
+
+def legs(lat, lng):
+    """
+    Distance of each leg between consecutive points
+    """
+
+    return arc(lat[:-1], lng[:-1], lat[1:], lng[1:])
+
+def _first_occurrences(ids):
+    """
+    Indexes of the first time each location appears, in route order
+    """
+
+    unique, index = np.unique(ids, return_index=True)
+    return np.sort(index)
+
+def route_distances(points):
+    """
+    Returns a dict of all the distance fields of a route. Returns None if
+    there are less than two distinct points, in which case the route keeps
+    its defaults.
+    """
+
+    if not points:
+        return None
+
+    ids = np.array([p[0] for p in points])
+    lng = np.array([p[1] for p in points], dtype=float)
+    lat = np.array([p[2] for p in points], dtype=float)
+    land = np.array([bool(p[3]) for p in points])
+
+    distinct = _first_occurrences(ids)
+
+    if len(distinct) <= 1:
+        return None
+
+    if land.any():
+        land_distinct = np.flatnonzero(land)[_first_occurrences(ids[land])]
+    else:
+        # with no landing points at all, the landing values are
+        # measured from all points
+        land_distinct = distinct
+
+    def max_start(index):
+        return float(from_start(lat[index], lng[index]).max())
+
+    def max_width(index):
+        return float(pairwise(lat[index], lng[index]).max())
+
+    def total_line(mask):
+        return float(legs(lat[mask], lng[mask]).sum())
+
+    return {
+        'max_start_all': max_start(distinct),
+        'max_start_land': max_start(land_distinct),
+        'max_width_all': max_width(distinct),
+        'max_width_land': max_width(land_distinct),
+        'total_line_all': total_line(np.ones(len(points), dtype=bool)),
+        'total_line_land': total_line(land),
+    }
+
+###############################################################################
+
+def points_for_routes(route_ids):
+    """
+    Returns a dict of route id -> list of points, for every routebase of the
+    passed routes that has coordinates. One query for all routes.
+    """
+
+    route_ids = list(route_ids)
+
+    if not route_ids:
+        return {}
+
+    sql = """
+        SELECT rb.route_id, rb.location_id,
+               ST_X(l.location), ST_Y(l.location), rb.land
+        FROM route_routebase rb
+        INNER JOIN airport_location l ON l.id = rb.location_id
+        WHERE rb.route_id IN %s AND l.location IS NOT NULL
+        ORDER BY rb.route_id, rb.sequence
+    """
+
+    cursor = connection.cursor()
+    cursor.execute(sql, [tuple(route_ids)])
+
+    ret = {}
+    for route_id, location_id, x, y, land in cursor.fetchall():
+        ret.setdefault(route_id, []).append((location_id, x, y, land))
+
+    return ret
+
+def distances_for_routes(route_ids):
+    """
+    Returns a dict of route id -> distance dict (or None) for the passed
+    routes, with the coordinates fetched in one query.
+    """
+
+    points = points_for_routes(route_ids)
+    return dict((route_id, route_distances(points.get(route_id)))
+                    for route_id in route_ids)
@@ -1,7 +1,7 @@
 import re
 
-from airport.models import Location, HistoricalIdent
 from models import RouteBase, Route
+from resolver import IdentResolver
 
 class MakeRoute(object):
     """
@@ -10,23 +10,46 @@ class MakeRoute(object):
     looking up custom places.
     """
     
-    def __init__(self, fallback_string, user, date=None):
+    def __init__(self, fallback_string, user, date=None, resolver=None,
+                 commit=True):
         self.user = user
         
         # the date of this route, so we know which identifiers to look for
         self.date = date
+        
+        # answers the identifier lookups, see route/resolver.py
+        if not resolver:
+            resolver = IdentResolver(user)
+        
+        self.resolver = resolver
+        
+        self.routebases = []
        
         if not fallback_string:     #return empty route
             self.route = Route()
-            self.route.save()
+            if commit:
+                self.route.save()
             return None
         
+        resolver.preload([fallback_string])
+        
         route = Route(fallback_string=fallback_string, p2p=False)
-        route.save()
+        
+        if commit:
+            route.save()
         
         is_p2p, routebases = self.make_routebases_from_fallback_string(route)
         
         route.p2p = is_p2p
+        self.routebases = routebases
+        
+        if not commit:
+            # the caller is responsible for saving the route and its
+            # routebases
+            route.render_html(routebases)
+            route.render_distances_from(routebases)
+            self.route = route
+            return None
         
         for routebase in routebases:
             routebase.route = route
@@ -42,8 +65,9 @@ class MakeRoute(object):
     ###########################################################
     ###########################################################
    
-            
-    def normalize(self, string):
+    
+    @staticmethod
+    def normalize(string):
         """
         removes all cruf away from the route string, returns only the
         alpha numeric characters with clean seperators
@@ -60,32 +84,12 @@ class MakeRoute(object):
         
     def find_navaid(self, ident, i, last_rb=None):
         """
-        Searches the database for the navaid object according to ident.
+        Looks up the navaid according to ident. If more than one navaid has
+        this ident, the one nearest to the last routebase is used.
         if it finds a match, creates and returns a routebase object
         """
-               
-        if last_rb:
-            navaid = Location.objects.filter(loc_class=2, identifier=ident)
-            #if more than 1 navaids come up,
-            if navaid.count() > 1:
-                #run another query to find the nearest
-                last_point = last_rb.location 
-                navaid = navaid.distance(last_point.location)\
-                               .order_by('distance')[0]
-                               
-            elif navaid.count() == 0:
-                navaid = None
-            else:
-                navaid = navaid[0]
-        else:
-            # no previous routebases,
-            # dont other with the extra queries trying to find the nearest 
-            # based on the last
-            try:
-                navaid = Location.objects.filter(loc_class=2,
-                                   identifier=ident)[0]
-            except IndexError:
-                navaid = None
+        
+        navaid = self.resolver.find_navaid(ident, last_rb and last_rb.location)
                 
         if navaid:
             return RouteBase(location=navaid, sequence=i)
@@ -93,8 +97,6 @@ class MakeRoute(object):
             # wasn't a navaid, maybe it was an airport that they flew over?
             return self.find_airport(ident, i)
         
-        return None
-        
     ###########################################################################
 
     def find_custom(self, ident, i, force=False):
@@ -103,19 +105,7 @@ class MakeRoute(object):
         force = True, it adds it to the user's custom list.
         """
         
-        ident = ident[:8]
-        
-        if force:
-            cu,cr = Location.objects.get_or_create(user=self.user,
-                                                  loc_class=3,
-                                                  identifier=ident)
-        else:
-            try:
-                cu = Location.objects.filter(loc_class=3,
-                               user=self.user,
-                               identifier=ident)[0]
-            except IndexError:
-                cu = None
+        cu = self.resolver.find_custom(ident, force)
 
         if cu:
             return RouteBase(location=cu, sequence=i)
@@ -172,44 +162,12 @@ class MakeRoute(object):
             return RouteBase(location=airport, sequence=i)
         
     def search_airport(self, ident, date):
-        hi = HistoricalIdent.objects.filter(identifier=ident)
-        ex = Location.goon(loc_class=1, identifier=ident)
-        
-        valid_hi = None
-        invalid_hi = None
-        airport_ident = None
-        airport = None
-        
-        if hi.count() > 0:
-            try:
-                valid_hi = hi.get(start__lte=date, end__gte=date)
-                invalid_hi = None
-            except HistoricalIdent.DoesNotExist:
-                valid_hi = None
-                invalid_hi = hi.latest('end')
-        elif ex:
-            return ex
-        
-        ##############
-        
-        if invalid_hi and not valid_hi and not ex:
-            #we dont have anything but an expired HI, just use it
-            return invalid_hi.current_location
-        
-        elif invalid_hi and not valid_hi and ex:
-            # an ex trumps an invalid HI
-            return ex
-            
-        elif valid_hi:
-            # we have a valid HI, use it no matter what!
-            return valid_hi.current_location
+        """
+        A historical ident that was valid on the date of the route wins,
+        then a current airport, then an expired historical ident.
+        """
         
-        elif not valid_hi and not invalid_hi and not ex:
-            #we have nothing :(
-            return None
-            
-        else:
-            assert False, "Some weird corner case"
+        return self.resolver.search_airport(ident, date)
 
     def make_routebases_from_fallback_string(self, route):
         """
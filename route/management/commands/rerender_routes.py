@@ -0,0 +1,55 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from route.rerender import rerender
+
+class Command(NoArgsCommand):
+    help = 'Re-render the routes affected by the last airport/navaid import'
+    
+    option_list = NoArgsCommand.option_list + (
+            make_option('--processes',
+                        '-p',
+                        dest='processes',
+                        type='int',
+                        default=4,
+                        help="Number of processes to render with",
+            ),
+            
+            make_option('--batch',
+                        '-b',
+                        dest='batch',
+                        type='int',
+                        default=500,
+                        help="Number of routes rendered per transaction",
+            ),
+            
+            make_option('--all',
+                        '-a',
+                        dest='all',
+                        action='store_true',
+                        help="Re-render every route, not just the changed ones",
+            ),
+            
+            make_option('--job',
+                        '-j',
+                        dest='job',
+                        help="Name of the checkpoints to resume from",
+            ),
+    )
+    
+    def progress(self, message):
+        print message
+    
+    def handle(self, *args, **options):
+        all_routes = options['all']
+        job = options['job'] or ('all' if all_routes else 'changes')
+        
+        count, seconds = rerender(job,
+                                  processes=options['processes'],
+                                  batch=options['batch'],
+                                  all_routes=all_routes,
+                                  progress=self.progress)
+        
+        print "%s routes in %.1f s (%.1f routes/sec)" % (
+                    count, seconds, count / max(seconds, 0.001))
@@ -15,11 +15,45 @@ class RouteBase(models.Model):
     route =    models.ForeignKey("Route")
     
     location =  models.ForeignKey(Location, null=True, blank=True)
-    unknown =  models.CharField(max_length=30, blank=True, null=True)
+    unknown =  models.CharField(max_length=30, blank=True, null=True,
+                                db_index=True)
     sequence = models.PositiveIntegerField()
     
     land = models.BooleanField()
     
+    @classmethod
+    def routes_for(cls, locations=(), identifiers=(), user=None):
+        """
+        The index from places to the routes that go through them. Returns
+        two sets of route ids: the routes with a routebase pointing to one
+        of the locations (their rendering only needs to be redone), and
+        the routes with an unknown routebase that may now resolve to one of
+        the identifiers (those need their identifiers resolved again). If
+        a user is passed, the unknowns are only looked for in that user's
+        routes.
+        """
+        
+        from resolver import IdentResolver
+        
+        unknowns = set()
+        for ident in identifiers:
+            unknowns.update(IdentResolver.variations(ident.upper()))
+        
+        easy = set()
+        hard = set()
+        
+        if locations:
+            easy = set(cls.objects.filter(location__in=locations)
+                                  .values_list('route', flat=True))
+        
+        if unknowns:
+            qs = cls.objects.filter(unknown__in=unknowns)
+            if user:
+                qs = qs.filter(route__flight__user=user)
+            hard = set(qs.values_list('route', flat=True))
+        
+        return easy - hard, hard
+    
     def __unicode__(self):
         
         loc_class = self.loc_class
@@ -105,9 +139,8 @@ class Route(EnhancedModel):
     
     p2p = models.BooleanField(default=False)
     
-    # a queryset of all landing points and all points, internal only
-    land_points = None
-    all_points = None
+    # how many routes easy_render_all renders at a time
+    RENDER_BATCH = 1000
     
     def __unicode__(self):
         return self.simple_rendered or "Empty"
@@ -131,15 +164,8 @@ class Route(EnhancedModel):
         route
         """
         
-        kwarg = {"user__flight__route__%s__iexact" % field: val}
-        
-        from profile.models import Profile
-        return Profile.objects\
-                   .filter(**kwarg)\
-                   .filter(social=True)\
-                   .values('user__username', 'user__id', 'logbook_share')\
-                   .order_by('user__username')\
-                   .distinct()
+        from logbook.models import SocialIndex
+        return SocialIndex.profiles('route', val)
     
     
     @classmethod
@@ -161,11 +187,53 @@ class Route(EnhancedModel):
         qs = cls.objects.order_by('-id')
         
         if only_unknowns:
-            qs = qs.filter(routebase__unknown__isnull=False)
+            qs = qs.filter(routebase__unknown__isnull=False).distinct()
         
-        for r in qs.iterator():
-            r.easy_render()            
-            
+        ids = list(qs.values_list('id', flat=True))
+        
+        for start in range(0, len(ids), cls.RENDER_BATCH):
+            cls.easy_render_batch(ids[start:start + cls.RENDER_BATCH])
+    
+    @classmethod
+    def easy_render_batch(cls, ids):
+        """
+        Same as calling easy_render on each of the passed routes, except the
+        routes and all of their routebases are fetched with one query each,
+        and the distances are calculated in memory. The running totals of
+        the flights on these routes follow the new distances.
+        """
+        
+        from logbook.models import Flight, RunningTotals
+        
+        routes = cls.objects.in_bulk(ids)
+        
+        # what each flight added to the running totals with the old route
+        flights = list(Flight.objects.filter(route__in=ids)
+                                     .select_related('route'))
+        before = [RunningTotals.contribution(f) for f in flights]
+        
+        rbs = RouteBase.objects\
+                       .filter(route__in=ids)\
+                       .select_related('location__region', 'location__country')\
+                       .order_by('route', 'sequence')
+        
+        by_route = {}
+        for rb in rbs:
+            by_route.setdefault(rb.route_id, []).append(rb)
+        
+        for id, route in routes.items():
+            routebases = by_route.get(id, [])
+            route.render_html(routebases)
+            route.render_distances_from(routebases)
+            route.save()
+        
+        for flight, old in zip(flights, before):
+            flight.route = routes[flight.route_id]
+            RunningTotals.apply_delta(old, RunningTotals.contribution(flight))
+        
+        # the distances and places are folded into the badge progress
+        from badges.models import BadgeProgress
+        BadgeProgress.reset(set(flight.user_id for flight in flights))
     
     @classmethod
     def hard_render_user(cls, user):
@@ -204,147 +272,59 @@ class Route(EnhancedModel):
     #################################
     
     def render_distances(self):
-        all_points = self._get_AllPoints()
-        
-        if not all_points or all_points.count() == 1:
-            return ## nothing to measure, keep the defaults
-        
-        land_points = self._get_LandingPoints()
-        
-        self.max_start_all = self.calc_max_start(all_points)
-        self.max_start_land = self.calc_max_start(land_points)
-        
-        self.max_width_all = self.calc_max_width(all_points)
-        self.max_width_land = self.calc_max_width(land_points)
-        
-        self.total_line_all = self.calc_total_line(points="all")
-        self.total_line_land = self.calc_total_line(points="land")
-        
-    #################################
-    
-    def _get_LandingPoints(self):
-        """
-        return a queryset containing all points where a landing took place.
-        """
-        
-        if not self.land_points:
-            self.land_points = Location.objects.filter(
-                    location__isnull=False,    # has valid coordinates
-                    routebase__route=self,     # is connected to this route
-                    routebase__land=True,      # depicts a landing
-            ).distinct()
-            
-        return self.land_points
-    
-    def _get_AllPoints(self):
-        """
-        Return a queryset of all points, regardless whether a landing
-        was done there or not
-        """
-        
-        if not self.all_points:
-            self.all_points = Location.objects.filter(
-                    location__isnull=False,
-                    routebase__route=self,
-            ).distinct()
-            
-            #self.line_kml = self.all_points.make_line().kml
-            
-        return self.all_points
-    
-    def calc_max_width(self, a=None):
         """
-        Returns the max distance between any two points in the route
+        Calculate all of the distance fields out of the coordinates of
+        this route's routebases.
         """
         
-        if not a:
-            a = self._get_AllPoints()
+        from distances import distances_for_routes
         
-        mp = a.collect()
+        distances = distances_for_routes([self.id])[self.id]
         
-        dist = []
-        from utils import coord_dist
-        for i,point1 in enumerate(mp):
-            for j,point2 in enumerate(mp):
-                dist.append(coord_dist(point1, point2))
+        if not distances:
+            return ## nothing to measure, keep the defaults
         
-        diameter = max(dist)
+        for field, value in distances.items():
+            setattr(self, field, value)
         
-        return diameter
+    #################################
     
     def get_users(self):
         """
         Returns all users who have flown this exact route
         """
         
-        from django.contrib.auth.models import User
-        return User.objects.filter(profile__social=True)\
-                   .filter(flight__route__simple_rendered=self.simple_rendered)
+        from logbook.models import SocialIndex
+        return SocialIndex.users('route', self.simple_rendered)
     
     ################################
     
-    def calc_max_start(self, a=None):
+    def easy_render(self):
         """
-        Returns the max distance between any point in the route and the
-        starting point. Used for ATP XC distance.
+        Rerenders the HTML for displaying the route. Takes info from the
+        already defines routebases. For rerendering after updating Airport
+        info, use hard_render()
         """
         
-        if not a:
-            a = self._get_AllPoints()
-        
-        mp = a.collect()
-        start = a[0].location
-        
-        dist = []
-        from utils import coord_dist
-        for i,po in enumerate(mp):
-            dist.append(coord_dist(po, start))
-         
-        return max(dist)
-    
-    def calc_total_line(self, points="all"):
-        """
-        returns the distance between each point in the route
-        """
+        rbs = self.routebase_set.all().order_by('sequence')
         
-        rbs = self.routebase_set.order_by('sequence')          
-            
-        if points == "land":
-            rbs = rbs.exclude(land=False)
+        self.render_html(rbs)
         
-        # convert to [(lat,lng), ...] while maintaining the same order
-        # skipping any routebase that has no location
-        points = [(rb.location.location.x, rb.location.location.y)
-                        for rb in rbs if rb.location and rb.location.location]
+        self.render_distances()
         
-        dist = []
-        from utils import coord_dist
-        for i,po in enumerate(points):
-            try:
-                next = points[1+i]
-            except IndexError:
-                pass
-            else:
-                from django.contrib.gis.geos import Point
-                dist.append(coord_dist(Point(po), Point(next)))
-         
-        return sum(dist)
-    
-    ################################
+        self.save()
     
-    def easy_render(self):
+    def render_html(self, rbs):
         """
-        Rerenders the HTML for displaying the route. Takes info from the
-        already defines routebases. For rerendering after updating Airport
-        info, use hard_render()
+        Fills in the fancy, simple and kml fields from the passed routebases.
+        Does not save or query anything by itself, so it can be used on
+        routes that have not been saved yet.
         """
         
         fancy = []
         simple = []
         kml = []
         
-        rbs = self.routebase_set.all().order_by('sequence')
-        
         if not rbs:
             # a route was made, but no routebases were attached, must
             # be a local flight
@@ -387,10 +367,24 @@ class Route(EnhancedModel):
         self.kml_rendered = "\n".join(kml)
         self.fancy_rendered = "-".join(fancy)
         self.simple_rendered = "-".join(simple)
+    
+    def render_distances_from(self, rbs):
+        """
+        Same as render_distances, except the points come from the passed
+        routebases instead of the database.
+        """
         
-        self.render_distances()
+        from distances import route_distances
         
-        self.save()
+        points = [(rb.location.id, rb.location.location.x,
+                   rb.location.location.y, rb.land)
+                        for rb in rbs if rb.location and rb.location.location]
+        
+        distances = route_distances(points)
+        
+        if distances:
+            for field, value in distances.items():
+                setattr(self, field, value)
         
     def hard_render(self, user=None, username=None, flight_id=None):
         """
@@ -433,3 +427,111 @@ class Route(EnhancedModel):
         f.save(no_badges=True)
         
         return new_route
+    
+    def rebuild_routebases(self, user, date=None, resolver=None):
+        """
+        Re-resolves this route's identifiers and replaces its routebases,
+        keeping the same route object. Unlike hard_render, no new route is
+        created and the flight does not need to be re-pointed.
+        """
+        
+        from make_route import MakeRoute
+        from distances import DISTANCE_FIELDS
+        
+        mr = MakeRoute(self.fallback_string, user, date=date,
+                       resolver=resolver, commit=False)
+        
+        self.routebase_set.all().delete()
+        
+        for routebase in mr.routebases:
+            routebase.route = self
+        
+        RouteBase.objects.bulk_create(mr.routebases)
+        
+        new = mr.route
+        fields = ('p2p', 'fancy_rendered', 'simple_rendered',
+                  'kml_rendered') + DISTANCE_FIELDS
+        
+        for field in fields:
+            setattr(self, field, getattr(new, field))
+        
+        self.save()
+    
+    @classmethod
+    def rebuild_batch(cls, ids):
+        """
+        Calls rebuild_routebases on each of the passed routes, then re-saves
+        their flights so the speed and fuel columns and the running totals
+        follow the new distances.
+        """
+        
+        from logbook.models import Flight
+        from django.contrib.auth.models import User
+        from resolver import IdentResolver
+        
+        routes = cls.objects.in_bulk(ids)
+        flights = Flight.objects.filter(route__in=ids)\
+                                .select_related('plane', 'route')
+        
+        by_user = {}
+        for flight in flights:
+            by_user.setdefault(flight.user_id, []).append(flight)
+        
+        for user_id, user_flights in by_user.items():
+            user = User(pk=user_id)
+            resolver = IdentResolver(user)
+            resolver.preload(routes[f.route_id].fallback_string
+                                for f in user_flights)
+            
+            for flight in user_flights:
+                route = routes.pop(flight.route_id, None)
+                
+                if not route:
+                    continue
+                
+                # the route is saved before the flight is, so the flight
+                # can't find what it looked like before in the database
+                flight._before = flight.snapshot()
+                
+                route.rebuild_routebases(user, flight.date, resolver)
+                
+                flight.route = route
+                flight.save(no_badges=True)
+        
+        # orphaned routes, there is no flight to take a user or date from
+        for route in routes.values():
+            route.easy_render()
+        
+        # the distances and places are folded into the badge progress
+        from badges.models import BadgeProgress
+        BadgeProgress.reset(by_user.keys())
+
+###############################################################################
+
+class RenderProgress(models.Model):
+    """
+    A checkpoint for one id range of a rerender_routes run. If the run gets
+    interrupted, the next run with the same job name continues each range
+    from `position`.
+    """
+    
+    job = models.CharField(max_length=32)
+    
+    start = models.IntegerField()
+    end = models.IntegerField()
+    
+    # the last route id that was rendered
+    position = models.IntegerField(default=0)
+    rendered = models.IntegerField(default=0)
+    finished = models.BooleanField(default=False)
+    
+    # the newest LocationChange that this job covers
+    last_change = models.IntegerField(default=0)
+    
+    updated = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ('job', 'start')
+    
+    def __unicode__(self):
+        return "%s: %s-%s (%s)" % (self.job, self.start, self.end, self.position)
@@ -0,0 +1,161 @@
+"""
+Bulk re-rendering of routes after the airport database has been updated.
+The routes are split into id ranges which are rendered by a pool of
+processes. Each range keeps a RenderProgress row so an interrupted run can
+be resumed.
+"""
+
+import time
+
+from django.db import transaction
+from django.db.models import F, Max
+
+from airport.models import LocationChange
+from models import Route, RouteBase, RenderProgress
+from logbook.models import Flight, SocialIndex
+from logbook.utils import bump_logbook_version, bump_logbook_cache_generation
+from maps.models import VisitedPlace
+from main.utils import run_pool
+
+# the highest id a route can have, the last range always ends here
+MAX_ID = 2 ** 31 - 1
+
+def changed_routes(last_change):
+    """
+    Returns two sets of route ids affected by the LocationChange rows up to
+    `last_change`. Routes that point to a changed location only need their
+    html and distances redone. Routes that have an unknown identifier that
+    now exists need their identifiers resolved again.
+    """
+
+    changes = LocationChange.objects.filter(pk__lte=last_change)
+
+    location_ids = set(changes.values_list('location', flat=True))
+    identifiers = set(changes.values_list('identifier', flat=True))
+
+    return RouteBase.routes_for(location_ids, identifiers)
+
+def make_ranges(ids, count):
+    """
+    Split the ids into `count` ranges with about the same number of
+    routes in each. The ranges cover every possible id.
+    """
+
+    ids = sorted(ids)
+    count = max(1, min(count, len(ids)))
+    size = len(ids) // count + 1
+
+    starts = [0] + [ids[i] for i in range(size, len(ids), size)][:count - 1]
+    ends = [start - 1 for start in starts[1:]] + [MAX_ID]
+
+    return zip(starts, ends)
+
+def render_range(item):
+    """
+    Renders all routes of the range that come after the checkpoint, one
+    batch per transaction.
+    """
+
+    progress_id, easy, hard, batch = item
+
+    start_time = time.time()
+
+    progress = RenderProgress.objects.get(pk=progress_id)
+    ids = sorted(id for id in (easy | hard) if id > progress.position)
+
+    for i in range(0, len(ids), batch):
+        chunk = ids[i:i + batch]
+
+        easy_chunk = [id for id in chunk if id in easy]
+        hard_chunk = [id for id in chunk if id in hard]
+
+        with transaction.commit_on_success():
+            if easy_chunk:
+                Route.easy_render_batch(easy_chunk)
+            if hard_chunk:
+                Route.rebuild_batch(hard_chunk)
+
+            # the flights kept their route ids, so the rows that depend on
+            # the routebases aren't refreshed when they get saved
+            VisitedPlace.routes_changed(chunk)
+            SocialIndex.routes_changed(chunk)
+
+            RenderProgress.objects.filter(pk=progress_id)\
+                          .update(position=chunk[-1],
+                                  rendered=F('rendered') + len(chunk))
+
+        # the distances changed, so the signatures, graphs and logbook
+        # pages of everyone who flew these routes are made again
+        users = Flight.objects.filter(route__in=chunk)\
+                              .values_list('user', flat=True)\
+                              .order_by()\
+                              .distinct()
+
+        for user_id in users:
+            bump_logbook_version(user_id)
+            bump_logbook_cache_generation(user_id)
+
+    RenderProgress.objects.filter(pk=progress_id).update(finished=True)
+
+    return progress.start, progress.end, len(ids), time.time() - start_time
+
+def rerender(job, processes=4, batch=500, all_routes=False, progress=None):
+    """
+    Re-render either every route, or the routes affected by the pending
+    LocationChange rows. Running again with the same job name continues
+    where an interrupted run left off. `progress` is called with a message
+    about how the run is going. Returns (routes, seconds).
+    """
+
+    progress = progress or (lambda message: None)
+
+    start_time = time.time()
+
+    ranges = list(RenderProgress.objects.filter(job=job).order_by('start'))
+
+    if ranges:
+        last_change = ranges[0].last_change
+        progress("resuming %s, %s ranges" % (job, len(ranges)))
+    else:
+        last_change = LocationChange.objects.aggregate(m=Max('id'))['m'] or 0
+
+    if all_routes:
+        easy = set(Route.objects.values_list('id', flat=True))
+        hard = set()
+    else:
+        easy, hard = changed_routes(last_change)
+
+    if not ranges:
+        for start, end in make_ranges(easy | hard, processes):
+            ranges.append(RenderProgress.objects.create(job=job, start=start,
+                                                        end=end,
+                                                        last_change=last_change))
+
+    items = []
+    for r in ranges:
+        if r.finished:
+            continue
+
+        def in_range(ids):
+            return set(id for id in ids if r.start <= id <= r.end)
+
+        items.append((r.pk, in_range(easy), in_range(hard), batch))
+
+    progress("%s routes to render, %s need their identifiers resolved" % (
+                len(easy | hard), len(hard)))
+
+    results = run_pool(render_range, items, processes)
+
+    count = 0
+    for start, end, routes, seconds in results:
+        count += routes
+        progress("%s-%s: %s routes in %.1f s" % (start, end, routes, seconds))
+
+    # everything is rendered, the checkpoints and changes are not needed
+    # anymore
+    if not all_routes:
+        LocationChange.objects.filter(pk__lte=last_change).delete()
+
+    RenderProgress.objects.filter(job=job).delete()
+
+    return count, time.time() - start_time
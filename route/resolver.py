@@ -0,0 +1,278 @@
+import time
+
+from django.core.cache import cache
+
+from airport.models import Location, HistoricalIdent
+from utils import lat_lng_dist
+
+INDEX_VERSION_KEY = 'route.location_index.version'
+
+class LocationIndex(object):
+    """
+    Every airport and navaid identifier and every historical ident date range,
+    kept in plain dicts and tuples. One of these is shared by the whole
+    process (see get_index) and is thrown away when the airport database
+    gets updated. Location objects are fetched the first time one of them
+    is needed and kept for the life of the index.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+
+        self.airports = {}      # ident -> location id
+        self.navaids = {}       # ident -> [(location id, x, y), ...]
+        self.historical = {}    # ident -> [(start, end, location id), ...]
+
+        self.objects = {}       # location id -> Location
+
+    def load(self):
+        airports = Location.objects\
+                           .filter(loc_class=1)\
+                           .order_by('id')\
+                           .values_list('id', 'identifier')
+
+        for id, ident in airports.iterator():
+            self.airports.setdefault(ident, id)
+
+        navaids = Location.objects\
+                          .filter(loc_class=2)\
+                          .order_by('id')\
+                          .values_list('id', 'identifier', 'location')
+
+        for id, ident, point in navaids.iterator():
+            x, y = (point.x, point.y) if point else (None, None)
+            self.navaids.setdefault(ident, []).append((id, x, y))
+
+        his = HistoricalIdent.objects\
+                             .order_by('end')\
+                             .values_list('identifier', 'start', 'end',
+                                          'current_location')
+
+        for ident, start, end, location_id in his.iterator():
+            self.historical.setdefault(ident, []).append((start, end, location_id))
+
+        return self
+
+    def knows(self, ident):
+        return (ident in self.airports or ident in self.navaids or
+                ident in self.historical)
+
+    def candidates(self, ident):
+        """
+        All location ids that this identifier may resolve to.
+        """
+
+        ret = [n[0] for n in self.navaids.get(ident, [])]
+        ret += [hi[2] for hi in self.historical.get(ident, [])]
+
+        if ident in self.airports:
+            ret.append(self.airports[ident])
+
+        return ret
+
+    def fetch(self, ids):
+        """
+        Make sure the Location objects for the passed ids are loaded.
+        """
+
+        missing = set(ids) - set(self.objects)
+
+        if missing:
+            locations = Location.objects\
+                                .filter(id__in=missing)\
+                                .select_related('region', 'country')
+
+            for loc in locations:
+                self.objects[loc.id] = loc
+
+    def get(self, id):
+        if id is None:
+            return None
+
+        if id not in self.objects:
+            self.fetch([id])
+
+        return self.objects.get(id)
+
+    ###########################################################################
+
+    def search_airport(self, ident, date):
+        """
+        A historical ident that was valid on the passed date wins, then a
+        current airport, then the most recently expired historical ident.
+        Returns a location id.
+        """
+
+        ex = self.airports.get(ident)
+        his = self.historical.get(ident)
+
+        if not his:
+            return ex
+
+        for start, end, location_id in his:
+            if date and start <= date <= end:
+                return location_id
+
+        if ex:
+            return ex
+
+        # sorted by end date
+        return his[-1][2]
+
+    def find_navaid(self, ident, last_point=None):
+        """
+        Returns the id of the navaid with this identifier. If there are
+        more than one, the one nearest to last_point is picked.
+        """
+
+        navaids = self.navaids.get(ident)
+
+        if not navaids:
+            return None
+
+        located = [n for n in navaids if n[1] is not None]
+
+        if len(located) > 1 and last_point:
+            nearest = min(located,
+                          key=lambda n: lat_lng_dist(n[2], n[1],
+                                                     last_point.y, last_point.x))
+            return nearest[0]
+
+        return navaids[0][0]
+
+_index = None
+
+def get_index():
+    """
+    Returns the process wide LocationIndex, reloading it if another process
+    has invalidated it since it was loaded.
+    """
+
+    global _index
+
+    version = cache.get(INDEX_VERSION_KEY)
+
+    if _index is None or _index.version != version:
+        _index = LocationIndex(version).load()
+
+    return _index
+
+def invalidate_index():
+    """
+    Called after the airport database has changed. Every process reloads
+    its index the next time it parses a route.
+    """
+
+    global _index
+
+    _index = None
+    cache.set(INDEX_VERSION_KEY, time.time(), 60 * 60 * 24 * 365)
+
+###############################################################################
+
+class IdentResolver(object):
+    """
+    Answers the lookups MakeRoute needs. Airports, navaids and historical
+    idents come from the process wide LocationIndex, and the user's custom
+    places are loaded per resolver. After preload() has been called, routes
+    made up of known identifiers resolve without any queries.
+    """
+
+    def __init__(self, user=None):
+        self.user = user
+        self.index = get_index()
+
+        self.customs = {}       # ident -> the user's loc_class=3 Location
+        self.loaded_customs = set()
+
+    @staticmethod
+    def swap(ident):
+        "Swaps zero's and o's"
+
+        new = ident.replace('O', '&').replace('0', '$')
+        return new.replace('&', '0').replace('$', 'O')
+
+    @classmethod
+    def variations(cls, ident):
+        """
+        Every form of the identifier that MakeRoute.find_airport may end up
+        searching for.
+        """
+
+        ret = set([ident, "K" + ident, ident[1:]])
+        ret.update([cls.swap(i) for i in ret])
+        return ret
+
+    def preload(self, fallback_strings):
+        """
+        Load all locations that may be needed to resolve the passed route
+        strings.
+        """
+
+        from make_route import MakeRoute
+
+        ids = set()
+        customs = set()
+
+        for fallback_string in fallback_strings:
+            for token in MakeRoute.normalize(fallback_string or '').split():
+                ident = token.replace('!', '').replace('@', '')
+                known = False
+
+                for variation in self.variations(ident):
+                    if self.index.knows(variation):
+                        ids.update(self.index.candidates(variation))
+                        known = True
+
+                if '!' in token or not known:
+                    customs.add(ident[:8])
+
+        self.index.fetch(ids)
+
+        customs -= self.loaded_customs
+        self.loaded_customs.update(customs)
+
+        if customs and self.user:
+            self.load_customs(customs)
+
+    def load_customs(self, idents):
+        customs = Location.objects\
+                          .filter(user=self.user, loc_class=3,
+                                  identifier__in=idents)\
+                          .select_related('region', 'country')\
+                          .order_by('id')
+
+        for loc in customs:
+            self.customs.setdefault(loc.identifier, loc)
+
+    ###########################################################################
+
+    def search_airport(self, ident, date):
+        return self.index.get(self.index.search_airport(ident, date))
+
+    def find_navaid(self, ident, last_location=None):
+        last_point = last_location and last_location.location
+        return self.index.get(self.index.find_navaid(ident, last_point))
+
+    def find_custom(self, ident, force=False):
+        """
+        Returns the user's custom place with this identifier, creating it
+        when force is True.
+        """
+
+        ident = ident[:8]
+
+        if ident not in self.loaded_customs:
+            self.loaded_customs.add(ident)
+            if self.user:
+                self.load_customs([ident])
+
+        cu = self.customs.get(ident)
+
+        if not cu and force:
+            cu, cr = Location.objects.get_or_create(user=self.user,
+                                                   loc_class=3,
+                                                   identifier=ident)
+            self.customs[ident] = cu
+
+        return cu
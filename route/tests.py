@@ -30,3 +30,83 @@ class SimpleTest(TestCase):
         response = self.client.get('/route-%s.html' % r.pk)
         self.failUnlessEqual(response.status_code, 200)
 
+    def test_resolver_matches_database(self):
+        from make_route import MakeRoute
+        from resolver import IdentResolver, invalidate_index
+        
+        route_string = 'SNTR @derp SSBT'
+        
+        invalidate_index()
+        r = Route.from_string(route_string)
+        
+        resolver = IdentResolver()
+        resolver.preload([route_string])
+        
+        with self.assertNumQueries(0):
+            mr = MakeRoute(route_string, None, resolver=resolver, commit=False)
+        
+        s = "%3.3f"
+        self.failUnlessEqual(s % mr.route.max_start_all, s % r.max_start_all)
+        self.failUnlessEqual(s % mr.route.total_line_all, s % r.total_line_all)
+        self.failUnlessEqual(mr.route.simple_rendered, r.simple_rendered)
+    
+    def test_known_idents_no_queries(self):
+        from make_route import MakeRoute
+        
+        route_string = 'SNTR SSBT SNTR SSBT SNTR SSBT SNTR SSBT SNTR SSBT'
+        
+        # warm up the process wide index
+        MakeRoute(route_string, None, commit=False)
+        
+        with self.assertNumQueries(0):
+            mr = MakeRoute(route_string, None, commit=False)
+        
+        self.failUnlessEqual(len(mr.routebases), 10)
+    
+    def test_easy_render_all(self):
+        r = Route.from_string('SNTR SSBT')
+        Route.objects.filter(pk=r.pk).update(max_start_all=0, simple_rendered='')
+        
+        Route.easy_render_all()
+        
+        r2 = Route.objects.get(pk=r.pk)
+        s = "%3.3f"
+        self.failUnlessEqual(s % r2.max_start_all, s % r.max_start_all)
+        self.failUnlessEqual(r2.simple_rendered, r.simple_rendered)
+    
+    def test_rerender_changes(self):
+        from airport.models import Location, LocationChange
+        from rerender import rerender, make_ranges
+        from models import RenderProgress
+        
+        self.failUnlessEqual(make_ranges([], 4), [(0, 2 ** 31 - 1)])
+        self.failUnlessEqual(len(make_ranges(range(1, 100), 4)), 4)
+        
+        r = Route.from_string('SNTR SSBT')
+        Route.objects.filter(pk=r.pk).update(simple_rendered='')
+        
+        sntr = Location.objects.filter(identifier='SNTR')[0]
+        LocationChange.objects.create(location=sntr, identifier='SNTR')
+        
+        count, seconds = rerender('test', processes=1)
+        
+        self.failUnlessEqual(count, 1)
+        self.failUnlessEqual(Route.objects.get(pk=r.pk).simple_rendered,
+                             r.simple_rendered)
+        self.failIf(LocationChange.objects.exists())
+        self.failIf(RenderProgress.objects.exists())
+    
+    def test_routes_for(self):
+        from airport.models import Location
+        from models import RouteBase
+        
+        r = Route.from_string('SNTR derp SSBT')
+        sntr = Location.objects.filter(identifier='SNTR')[0]
+        
+        easy, hard = RouteBase.routes_for([sntr.pk])
+        self.failUnless(r.pk in easy)
+        
+        # derp is unknown, the whole route needs to be resolved again
+        easy, hard = RouteBase.routes_for([sntr.pk], ['derp'])
+        self.failUnless(r.pk in hard)
+        self.failIf(r.pk in easy)
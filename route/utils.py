@@ -15,10 +15,12 @@ def coord_dist(p1, p2):
     
     """
     
-    lat1=p1.y
-    long1=p1.x
-    lat2=p2.y
-    long2=p2.x
+    return lat_lng_dist(p1.y, p1.x, p2.y, p2.x)
+
+def lat_lng_dist(lat1, long1, lat2, long2):
+    """
+    Same as coord_dist, but takes the raw coordinates instead of points
+    """
     
     # Convert latitude and longitude to 
     # spherical coordinates in radians.
@@ -50,3 +52,4 @@ def coord_dist(p1, p2):
     # Remember to multiply arc by the radius of the earth 
     # in your favorite set of units to get length.
     return arc * 3443.92
+
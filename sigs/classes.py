@@ -51,8 +51,7 @@ class TotalsSig(BaseSig):
         """
         
         from logbook.models import Flight
-        for column in self.columns:
-            self.data[column] = Flight.objects.user(self.user).agg(column, float=True)
+        self.data = Flight.objects.user(self.user).agg_many(self.columns, float=True)
         
     
     def output(self):
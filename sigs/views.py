@@ -54,32 +54,57 @@ def sigs(request):
     return locals()
 
 
+# rendered images are keyed by logbook version, so they never go stale
+SIG_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+def cached_png(request, make_sig, *key_parts):
+    """
+    Returns the png made by `make_sig`, out of the cache if the user's
+    logbook hasn't changed since it was last made.
+    """
+    
+    from django.core.cache import cache
+    from django.http import HttpResponse
+    from logbook.utils import cached_image
+    
+    def render():
+        response = HttpResponse(mimetype="image/png")
+        make_sig().output().save(response, "png")
+        return response
+    
+    def put(digest, png):
+        cache.set('sigs.png.%s' % digest, png, SIG_CACHE_TIMEOUT)
+    
+    return cached_image(request, key_parts, "image/png", render,
+                        get=lambda digest: cache.get('sigs.png.%s' % digest),
+                        put=put)
+
 @no_share('other')
 def make_totals_sig(request, columns, logo, font, size=12):
     from classes import TotalsSig
     columns = columns.split('-')
     
-    sig = TotalsSig(request.display_user,
-                    columns=columns,
-                    font=font,
-                    logo=logo,
-                    size=size)
+    def make_sig():
+        return TotalsSig(request.display_user,
+                         columns=columns,
+                         font=font,
+                         logo=logo,
+                         size=size)
     
-    from django.http import HttpResponse
-    response = HttpResponse(mimetype="image/png")
-    sig.output().save(response, "png")
-    return response
+    return cached_png(request, make_sig, 'totals', "-".join(columns), logo,
+                      font, size)
 
 @no_share('other')
 def make_days_since_sig(request, mode, font, size=12):
     from classes import DaysSinceSig
+    import datetime
     
-    sig = DaysSinceSig(request.display_user,
-                       mode=mode,
-                       font=font,
-                       size=size)
+    def make_sig():
+        return DaysSinceSig(request.display_user,
+                            mode=mode,
+                            font=font,
+                            size=size)
     
-    from django.http import HttpResponse
-    response = HttpResponse(mimetype="image/png")
-    sig.output().save(response, "png")
-    return response
+    # the number of days changes every day, even if the logbook doesn't
+    return cached_png(request, make_sig, 'days_since', mode, font, size,
+                      datetime.date.today())
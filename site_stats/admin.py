@@ -4,4 +4,9 @@ from models import *
 class StatsAdmin(admin.ModelAdmin):
     list_display = ('dt', 'total_hours', 'total_logged', 'users')
     
+class DayTotalsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'date', 'entries', 'flights', 'hours')
+    raw_id_fields = ('user', )
+    
 admin.site.register(StatDB, StatsAdmin)
+admin.site.register(DayTotals, DayTotalsAdmin)
@@ -1,3 +1,4 @@
+import numpy
 from collections import deque
 
 from graphs.linegraph import ProgressGraph, Plot
@@ -44,7 +45,10 @@ class SiteStatsPlot(Plot):
         
         self.interval_start = self.start # no need to use a pre-interval
         
-        return data
+        dates = numpy.array([item['date'] for item in data], dtype=object)
+        values = numpy.array([item['value'] or 0 for item in data], dtype=float)
+        
+        return dates, values
     
     def _moving_value(self, iterable):
         """
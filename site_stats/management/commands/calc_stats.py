@@ -2,7 +2,6 @@ import datetime
 from optparse import make_option
 
 from django.core.management.base import BaseCommand
-from django.contrib.auth.models import User
 
 from route.models import Route
 from site_stats.models import Stat
@@ -10,14 +9,35 @@ from site_stats.models import Stat
 class Command(BaseCommand):
     help = 'Calculate all stats and save to the database'
     
+    option_list = BaseCommand.option_list + (
+            make_option('--processes',
+                        '-p',
+                        dest='processes',
+                        type='int',
+                        default=4,
+                        help="How many stats to calculate at the same time",
+            ),
+            make_option('--rebuild',
+                        action='store_true',
+                        dest='rebuild',
+                        default=False,
+                        help="Make the day totals of every user again",
+            ),
+    )
+    
     def handle(self, *args, **options):
         
         # remove all empty routes first for accurate distance values
         Route.objects.filter(flight__pk__isnull=True).delete()
         
+        def progress(name, seconds):
+            print "%s [%.2f sec]" % (name, seconds)
+        
         start = datetime.datetime.now()
         ss = Stat()
-        ss.save_to_db()
+        ss.save_to_db(processes=options['processes'],
+                      rebuild=options['rebuild'],
+                      progress=progress)
         stop = datetime.datetime.now()
         
         print "%s -- %s" % (datetime.datetime.now(), stop - start)
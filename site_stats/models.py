@@ -1,13 +1,16 @@
+import time
 import datetime
 
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Count, Sum, Avg
+from django.db import models, connection
+from django.db.models import Count, Sum, Max
 
 from logbook.models import Flight
 from route.models import RouteBase, Route
 from plane.models import Plane
 from airport.models import Location
+from main.utils import run_pool
 
 class MostCommonPlane(object):
     title = "??"
@@ -77,6 +80,114 @@ class MostTraveledTail(MostCommonPlane):
              .annotate(c=Count('flight__route__routebase__location__id', distinct=True))\
              .order_by('-c')[:10]
 
+class DayTotals(models.Model):
+    """
+    The flights of each user on each day, so the stats that are totals of
+    the flight table are sums over this much smaller table. `entries` is
+    every flight, `flights` and `hours` leave out the adjustment entries
+    (anything over 24 hours). Each run of calc_stats makes the rows of the
+    users who edited their logbook or added flights since the last run
+    again.
+    """
+    
+    user =      models.ForeignKey(User)
+    date =      models.DateField(db_index=True)
+    
+    entries =   models.PositiveIntegerField(default=0)
+    flights =   models.PositiveIntegerField(default=0)
+    hours =     models.FloatField(default=0)
+    
+    class Meta:
+        unique_together = ('user', 'date')
+        verbose_name_plural = 'Day Totals'
+    
+    def __unicode__(self):
+        return u"%s -- %s" % (self.user_id, self.date)
+    
+    @classmethod
+    def rebuild_users(cls, user_ids=None):
+        """
+        Make the rows of the passed users again from the flight table, or
+        of every user when no ids are passed.
+        """
+        
+        if user_ids is None:
+            cls.objects.all().delete()
+            where, params = "", []
+        else:
+            user_ids = list(user_ids)
+            if not user_ids:
+                return
+            
+            cls.objects.filter(user__in=user_ids).delete()
+            where = "WHERE user_id IN (%s)" % ", ".join(["%s"] * len(user_ids))
+            params = user_ids
+        
+        cursor = connection.cursor()
+        cursor.execute(
+            """INSERT INTO site_stats_daytotals
+                    (user_id, date, entries, flights, hours)
+               SELECT user_id, date, COUNT(*),
+                      SUM(CASE WHEN total > 24 THEN 0 ELSE 1 END),
+                      SUM(CASE WHEN total > 24 THEN 0 ELSE total END)
+               FROM logbook_flight
+               %s
+               GROUP BY user_id, date""" % where, params)
+    
+    @classmethod
+    def update(cls, rebuild=False):
+        """
+        Bring the table up to date with the flights added, edited and
+        deleted since the last run. Returns the number of users that were
+        updated, None when every user was.
+        """
+        
+        from backup.models import UsersToday
+        
+        # flights added while this runs get picked up by the next run
+        last_flight_id = Flight.objects.aggregate(m=Max('id'))['m'] or 0
+        now = datetime.datetime.now()
+        
+        try:
+            checkpoint = RollupCheckpoint.objects.latest()
+        except RollupCheckpoint.DoesNotExist:
+            checkpoint = None
+        
+        if rebuild or not checkpoint:
+            cls.rebuild_users()
+            user_ids = None
+        else:
+            edited = UsersToday.objects\
+                               .filter(date__gte=checkpoint.dt.date())\
+                               .values_list('logged_today', flat=True)
+            
+            added = Flight.objects\
+                          .filter(id__gt=checkpoint.last_flight_id)\
+                          .values_list('user', flat=True)\
+                          .order_by()\
+                          .distinct()
+            
+            user_ids = set(edited) | set(added)
+            user_ids.discard(None)
+            cls.rebuild_users(user_ids)
+        
+        RollupCheckpoint.objects.all().delete()
+        RollupCheckpoint.objects.create(dt=now, last_flight_id=last_flight_id)
+        
+        return None if user_ids is None else len(user_ids)
+
+class RollupCheckpoint(models.Model):
+    """
+    When DayTotals was last brought up to date, and the highest flight id
+    at that time.
+    """
+    
+    dt =                models.DateTimeField()
+    last_flight_id =    models.IntegerField(default=0)
+    
+    class Meta:
+        get_latest_by = 'dt'
+
 class StatDB(models.Model):
     dt =               models.DateTimeField()
     
@@ -155,54 +266,92 @@ class StatDB(models.Model):
         
     
 
+def _calc_stat(name):
+    """
+    Entry point for each process in the pool, calculates one stat.
+    """
+    
+    start = time.time()
+    value = getattr(Stat(), "calc_%s" % name)()
+    
+    return name, value, time.time() - start
+
 class Stat(object):
+    
+    # stats that are read from DayTotals, in the order they depend on
+    # each other
+    ROLLUP_STATS = ("users", "non_empty_users", "total_hours", "total_logged",
+                    "avg_per_active", "avg_duration", "time_7_days",
+                    "num_7_days", "user_7_days", "day_wmh")
+    
+    # stats that each scan their own tables, these are calculated at the
+    # same time by a pool of processes
+    INDEPENDENT_STATS = ("unique_airports", "unique_countries", "total_dist",
+                         "most_common_tail", "most_common_type",
+                         "most_common_manu", "auv", "most_traveled_tail",
+                         "unique_tn", "day_wmu")
+    
+    # stats that need the independent stats first
+    DERIVED_STATS = ("route_earths", )
 
     def __init__(self):
         
-        self.base_flights = Flight.objects.user('ALL').exclude(total__gt=24)
+        self.days = DayTotals.objects.exclude(user__id=settings.DEMO_USER_ID)
         
         self.users = User.objects.count()
         self.today = datetime.date.today()
         
         self.sda = datetime.date.today() - datetime.timedelta(days=7)
         
-        #all flights in the past 7 days (but not in the future)
-        self.fsd = self.base_flights.filter(date__gte=self.sda,
-                                            date__lte=self.today)
-        
-        #person with most...
-        self.pwm = User.objects\
-                       .exclude(flight=None)\
-                       .annotate(s=Sum('flight__total'))\
-                       .annotate(c=Count('flight__id'))\
-                       .annotate(a=Avg('flight__total'))\
-                       .exclude(a__gte=30)
+        #all days in the past 7 days (but not in the future)
+        self.dsd = self.days.filter(date__gte=self.sda, date__lte=self.today)
                   
-    def save_to_db(self):
-        fields = ("users", "non_empty_users", "total_hours", "total_logged",
-                  "avg_per_active", "avg_duration", "unique_airports",
-                  "unique_countries", "total_dist", "route_earths",
-                  "most_common_tail", "most_common_type", "most_common_manu",
-                  "auv", "time_7_days", "num_7_days", "user_7_days",
-                  "most_traveled_tail", "unique_tn", 'day_wmh', 'day_wmu')
-          
+    def save_to_db(self, processes=4, rebuild=False, progress=None):
+        """
+        Bring DayTotals up to date, then calculate every stat and save them
+        as a new StatDB row. `progress` is called with the name of each
+        stat (or step) and how many seconds it took.
+        """
+        
+        progress = progress or (lambda name, seconds: None)
+        
+        start = time.time()
+        DayTotals.update(rebuild)
+        progress("day totals", time.time() - start)
+        
         kwargs = {"dt": datetime.datetime.now()}
         
-        for item in fields:
-            kwargs.update({item: getattr(self, "calc_%s" % item).__call__()})
+        for item in self.ROLLUP_STATS:
+            start = time.time()
+            kwargs[item] = getattr(self, "calc_%s" % item)()
+            progress(item, time.time() - start)
+        
+        results = run_pool(_calc_stat, self.INDEPENDENT_STATS, processes)
+        
+        for item, value, seconds in results:
+            kwargs[item] = value
+            progress(item, seconds)
+        
+        self.total_dist = kwargs['total_dist']
+        
+        for item in self.DERIVED_STATS:
+            start = time.time()
+            kwargs[item] = getattr(self, "calc_%s" % item)()
+            progress(item, time.time() - start)
         
         sdb = StatDB(**kwargs)
         sdb.save()
+        
+        return sdb
     
     #--------------------------------------------------------------------------
     
     def calc_day_wmh(self):
         """day with the most hours logged"""
-        item = self.base_flights\
-                     .values('total', 'date')\
-                     .values('date')\
-                     .annotate(t=Sum('total'))\
-                     .order_by('-t')[0]
+        item = self.days\
+                   .values('date')\
+                   .annotate(t=Sum('hours'))\
+                   .order_by('-t')[0]
                      
         from django.utils.dateformat import format
         return "%s (%.1f)" % (format(item['date'], 'd M, Y'), item['t'])
@@ -228,33 +377,36 @@ class Stat(object):
         ago, based on the date the flight took place
         """
         
-        return User.objects.filter(flight__date__gte=self.sda,
-                                   flight__date__lte=self.today)\
-                   .values('id')\
-                   .distinct()\
-                   .count()
+        return DayTotals.objects\
+                        .filter(date__gte=self.sda, date__lte=self.today)\
+                        .values('user')\
+                        .distinct()\
+                        .count()
     
     def calc_num_7_days(self):
-        return self.fsd.count()
+        return self.dsd.aggregate(s=Sum('flights'))['s'] or 0
     
     def calc_time_7_days(self):
-        return self.fsd.aggregate(s=Sum('total'))['s'] 
+        return self.dsd.aggregate(s=Sum('hours'))['s'] 
                           
     def calc_auv(self):
         """
-        Airport with the most unique visitors
+        Airport with the most unique visitors, counted from the social
+        index which already has one row per user per identifier
         """
         
-        qs = RouteBase.objects\
-                      .filter(unknown__isnull=True)\
-                      .values('location__identifier')\
-                      .annotate(u=Count('route__flight__user', distinct=True))\
-                      .order_by('-u')[:10]
+        from logbook.models import SocialIndex
+        
+        qs = SocialIndex.objects\
+                        .filter(kind='location')\
+                        .values('value')\
+                        .annotate(u=Count('user'))\
+                        .order_by('-u')[:10]
         
         foo = ""
         s = "{place}. {ident} ({val})\n"
         for i,item in enumerate(qs):
-            ident = item['location__identifier']
+            ident = item['value']
             foo += s.format(place=i+1, ident=ident, val=item['u'])
         
         return foo
@@ -288,23 +440,21 @@ class Stat(object):
         Average length of each flight, excluding adjustment entries
         """
         
-        hours = self.base_flights.aggregate(t=Sum('total'))['t']
-        return hours / self.total_logged
+        return self.total_hours / self.total_logged
     
     def calc_avg_per_active(self):
         return self.total_hours / self.non_empty_users
 
     def calc_total_logged(self):
-        self.total_logged = self.base_flights.count()
+        self.total_logged = self.days.aggregate(t=Sum('flights'))['t'] or 0
         return self.total_logged
 
     def calc_total_hours(self):
-        self.total_hours = self.base_flights.aggregate(t=Sum('total'))['t']
+        self.total_hours = self.days.aggregate(t=Sum('hours'))['t']
         return self.total_hours
         
     def calc_non_empty_users(self):
-        self.non_empty_users = User.objects\
-                        .annotate(f=Count('flight')).filter(f__gte=1).count()
+        self.non_empty_users = DayTotals.objects.values('user').distinct().count()
         return self.non_empty_users
 
     def calc_users(self):
@@ -331,7 +481,3 @@ class Stat(object):
         self.others = self.users - (self.aol + self.my + self.yahoo + self.google)
         self.o_p = self.others / float(self.users) * 100
        
-#
-# install this crontab to get automatically updated stats
-#
-# 22 */3 * * * wget http://beta.flightlogg.in/stats_save.py?sk=
@@ -18,3 +18,45 @@ class SimpleTest(TestCase):
         """
         self.failUnlessEqual(1 + 1, 2)
 
+
+class DayTotalsTest(TestCase):
+    
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from plane.models import Plane
+        
+        self.u = User(username='gina')
+        self.u.save()
+        
+        self.p = Plane(tailnumber="N8888", cat_class=1)
+        self.p.save()
+    
+    def add_flight(self, date, total):
+        from logbook.test_utils import make_flight
+        return make_flight(self.u, self.p, date=date, total=total)
+    
+    def test_update(self):
+        """
+        Tests that the day totals pick up new flights, and leave out
+        adjustment entries from the flights and hours
+        """
+        
+        from models import DayTotals
+        
+        self.add_flight('2009-01-01', 1.5)
+        self.add_flight('2009-01-01', 2.0)
+        self.add_flight('2009-01-02', 500.0)
+        
+        DayTotals.update()
+        
+        day = DayTotals.objects.get(user=self.u, date='2009-01-01')
+        self.failUnlessEqual((day.entries, day.flights, day.hours), (2, 2, 3.5))
+        
+        adjustment = DayTotals.objects.get(user=self.u, date='2009-01-02')
+        self.failUnlessEqual((adjustment.entries, adjustment.flights), (1, 0))
+        
+        self.add_flight('2009-01-01', 1.0)
+        DayTotals.update()
+        
+        day = DayTotals.objects.get(user=self.u, date='2009-01-01')
+        self.failUnlessEqual((day.flights, day.hours), (3, 4.5))
@@ -4,7 +4,6 @@ from django.views.decorators.cache import cache_page
 from annoying.decorators import render_to
 
 from route.models import Route
-from share.decorator import secret_key
 from models import Stat
 
 from utils import *
@@ -41,15 +40,6 @@ def site_stats(request):
     
     return locals()
 
-@secret_key
-def save_to_db(request):
-    """
-    Renders the stats
-    """
-    
-    from django.http import HttpResponse
-    return HttpResponse(str(stop-start), mimetype='text/plain')
-
 @cache_page(60 * 60 * 3)
 def stats_graph(request, item, ext):
     from graph import StatsGraph, SiteStatsPlot